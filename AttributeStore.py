@@ -0,0 +1,181 @@
+import os
+import re
+import json
+import numpy as np
+
+from Caching import LRUCache
+from Snapshots import atomic_write
+
+
+# Ladder names list several categories: "Home & Kitchen", "Bags, Wallets and Luggage"
+CONJUNCT_SEPARATOR = re.compile(r"\s*(?:&|,|/|\band\b)\s*")
+WORD = re.compile(r"[a-z0-9]+")
+
+
+def _singular(word):
+    if len(word) > 3 and word.endswith("ies"):
+        return word[:-3] + "y"
+    if word.endswith(("sses", "shes", "ches", "xes")):
+        return word[:-2]
+    if len(word) > 3 and word.endswith("s") and not word.endswith("ss"):
+        return word[:-1]
+    return word
+
+
+def category_terms(name):
+    """
+    Normalized categories a name stands for: one per "&"/","/"and"
+    conjunct, lowercased, without possessives and singularized word by word.
+    "Home & Kitchen" → {"home", "kitchen"}, "Women's Shoes" → {"women shoe"}.
+    """
+    terms = set()
+    for conjunct in CONJUNCT_SEPARATOR.split(name.lower().replace("'s", "").replace("’s", "")):
+        words = [_singular(word) for word in WORD.findall(conjunct)]
+        if words:
+            terms.add(" ".join(words))
+    return terms
+
+
+class AttributeStore:
+    def __init__(self, path="data/attributes"):
+        """
+        Columnar per-product attributes keyed by FAISS id, used to filter searches.
+
+        Prices live in a float32 array (NaN when unknown). Category ladder
+        names are interned to int32 ids and stored CSR-style: the categories
+        of product i are `category_ids[indptr[i]:indptr[i + 1]]`.
+
+        Args:
+            path (str): File prefix for the `.npz` arrays and `.categories.json` vocabulary.
+        """
+        self.arrays_path = f"{path}.npz"
+        self.vocab_path = f"{path}.categories.json"
+
+        if os.path.exists(self.arrays_path):
+            arrays = np.load(self.arrays_path)
+            self.price = arrays["price"]
+            self.indptr = arrays["indptr"]
+            self.category_ids = arrays["category_ids"]
+        else:
+            self.price = np.empty(0, dtype="float32")
+            self.indptr = np.zeros(1, dtype="int64")
+            self.category_ids = np.empty(0, dtype="int32")
+
+        if os.path.exists(self.vocab_path):
+            with open(self.vocab_path, "r") as f:
+                self.categories = json.load(f)
+        else:
+            self.categories = []
+        self.category_to_id = {name: i for i, name in enumerate(self.categories)}
+
+        # Per-append arrays not yet concatenated onto the columns
+        self._new_price = []
+        self._new_lengths = []
+        self._new_category_ids = []
+        self._new_count = 0
+        self._category_rows = None
+        self._category_masks = LRUCache(max_size=256)
+
+    def __len__(self):
+        return len(self.price) + self._new_count
+
+    def append(self, attributes):
+        """
+        Append one attribute dict per product, in FAISS id order.
+
+        Args:
+            attributes (List[Dict]): {"price": float | None, "categories": List[str]}.
+        """
+        prices, lengths, category_ids = [], [], []
+        for attrs in attributes:
+            attrs = attrs or {}
+            price = attrs.get("price")
+            prices.append(np.nan if price is None else float(price))
+            ids = []
+            for name in dict.fromkeys(attrs.get("categories") or []):
+                name = name.strip().lower()
+                if not name:
+                    continue
+                if name not in self.category_to_id:
+                    self.category_to_id[name] = len(self.categories)
+                    self.categories.append(name)
+                ids.append(self.category_to_id[name])
+            lengths.append(len(ids))
+            category_ids.extend(ids)
+        self._new_price.append(np.asarray(prices, dtype="float32"))
+        self._new_lengths.append(np.asarray(lengths, dtype="int64"))
+        self._new_category_ids.append(np.asarray(category_ids, dtype="int32"))
+        self._new_count += len(prices)
+
+    def pad_to(self, size):
+        """Give products indexed before attributes were stored empty attributes."""
+        if size > len(self):
+            self.append([None] * (size - len(self)))
+
+    def _consolidate(self):
+        """Concatenate appended rows onto the columns once, rather than on every append."""
+        if not self._new_count:
+            return
+        self.price = np.concatenate([self.price, *self._new_price])
+        self.indptr = np.concatenate([self.indptr, self.indptr[-1] + np.cumsum(np.concatenate(self._new_lengths))])
+        self.category_ids = np.concatenate([self.category_ids, *self._new_category_ids])
+        self._new_price, self._new_lengths, self._new_category_ids = [], [], []
+        self._new_count = 0
+        self._category_rows = None
+        self._category_masks = LRUCache(max_size=256)
+
+    def save(self):
+        self._consolidate()
+        with atomic_write(self.arrays_path, "wb") as f:
+            np.savez(f, price=self.price, indptr=self.indptr, category_ids=self.category_ids)
+        with atomic_write(self.vocab_path) as f:
+            json.dump(self.categories, f)
+
+    def match_categories(self, category):
+        """
+        Ids of the category ladder names matching a free-text category, e.g.
+        "kitchen" → "home & kitchen" or "bags" → "bags, wallets and luggage".
+        Whole normalized terms must match, so "mobiles" does not match
+        "automobiles" and "bags" does not match "tea bags".
+        """
+        terms = category_terms(category or "")
+        if not terms:
+            return np.empty(0, dtype="int32")
+        return np.asarray([i for i, name in enumerate(self.categories) if terms & category_terms(name)],
+                          dtype="int32")
+
+    def _category_mask(self, category):
+        mask = self._category_masks.get(category)
+        if mask is None:
+            matched = self.match_categories(category)
+            if self._category_rows is None:
+                # Product id of every CSR entry, built once per consolidation
+                self._category_rows = np.repeat(np.arange(len(self.price)), np.diff(self.indptr))
+            mask = np.zeros(len(self.price), dtype=bool)
+            mask[self._category_rows[np.isin(self.category_ids, matched)]] = True
+            self._category_masks.set(category, mask)
+        return mask
+
+    def eligible(self, size, price_max=None, category=None, include_unknown_price=True):
+        """
+        Boolean mask over the first `size` FAISS ids of products passing the filters,
+        or None when no filter applies. A category that matches no known ladder
+        name is ignored rather than filtering everything out.
+        """
+        self._consolidate()
+        apply_category = category is not None and len(self.match_categories(category)) > 0
+        if price_max is None and not apply_category:
+            return None
+
+        mask = np.ones(size, dtype=bool)
+        known = min(size, len(self.price))
+        if price_max is not None:
+            price = self.price[:known]
+            within = price <= price_max
+            if include_unknown_price:
+                within |= np.isnan(price)
+            mask[:known] &= within
+        if apply_category:
+            mask[:known] &= self._category_mask(category.strip().lower())[:known]
+            mask[known:] = False
+        return mask
@@ -1,14 +1,26 @@
 import os
+import subprocess
+import threading
 import whisper
-from typing import Optional, Dict
+import numpy as np
+from typing import Optional, Dict, Iterable, Union
 import torch
 from QueryParser import QueryRewriter
+from InferenceBackends import set_num_threads, validate_backend
+
+# "faster-whisper" runs the same checkpoints on CTranslate2 with int8 weights on CPU
+WHISPER_BACKENDS = ("torch", "faster-whisper")
+
 class AudioSearchPipeline:
     def __init__(
         self,
         whisper_model_size: str = "base",
         rewriter_model_name: str = "gemini-1.5-flash",
-        use_gpu: bool = True
+        use_gpu: bool = True,
+        backend: str = "torch",
+        fast_decode: bool = False,
+        language: Optional[str] = None,
+        num_threads: Optional[int] = None
     ):
         """
         Initializes the audio search pipeline.
@@ -17,19 +29,89 @@ class AudioSearchPipeline:
             whisper_model_size (str): Size of Whisper model ("tiny", "base", "small", etc.)
             rewriter_model_name (str): Gemini model to use for query rewriting
             use_gpu (bool): Whether to run Whisper on GPU
+            backend (str): "torch" (openai-whisper) or "faster-whisper" (needs the
+                `faster-whisper` package)
+            fast_decode (bool): Greedy decoding at temperature 0 without
+                timestamps, temperature fallback or conditioning on earlier
+                windows. Voice queries are a few seconds long, so this loses
+                little accuracy and saves most decoder passes.
+            language (str, optional): Spoken language; skips language detection.
+                Fast decoding assumes "en" when unset.
+            num_threads (int, optional): Intra-op threads on CPU
         """
+        validate_backend(backend, WHISPER_BACKENDS)
+        set_num_threads(num_threads)
         self.device = "cuda" if use_gpu and torch.cuda.is_available() else "cpu"
-        self.whisper_model = whisper.load_model(whisper_model_size, device=self.device)
-        self.query_rewriter = QueryRewriter(model_name=rewriter_model_name)
+        self.backend = backend
+        self.language = language or ("en" if fast_decode else None)
+        self.decode_options = {"language": self.language}
+        if fast_decode:
+            self.decode_options.update(temperature=0.0, condition_on_previous_text=False, without_timestamps=True)
+        if backend == "faster-whisper":
+            if fast_decode:
+                # faster-whisper defaults to a beam of 5; openai-whisper is already greedy at temperature 0
+                self.decode_options["beam_size"] = 1
+            from faster_whisper import WhisperModel
+            self.whisper_model = WhisperModel(whisper_model_size, device=self.device,
+                                              compute_type="int8" if self.device == "cpu" else "float16",
+                                              cpu_threads=num_threads or 0)
+        else:
+            self.whisper_model = whisper.load_model(whisper_model_size, device=self.device)
+            # fp16 is not supported on CPU; asking for it only adds a warning per call
+            self.decode_options["fp16"] = self.device != "cpu"
+        self.rewriter_model_name = rewriter_model_name
+        self._query_rewriter = None
+
+    @property
+    def query_rewriter(self):
+        # Created on first use, so transcription alone needs no Gemini credentials
+        if self._query_rewriter is None:
+            self._query_rewriter = QueryRewriter(model_name=self.rewriter_model_name)
+        return self._query_rewriter
 
-    def transcribe_audio(self, audio_path: str) -> str:
+    def transcribe_audio(self, audio_path: Union[str, np.ndarray]) -> str:
         """
         Transcribes audio to text using Whisper.
+
+        Args:
+            audio_path: File path, or a mono float32 waveform sampled at 16 kHz.
         """
-        result = self.whisper_model.transcribe(audio_path)
+        if self.backend == "faster-whisper":
+            segments, _ = self.whisper_model.transcribe(audio_path, **self.decode_options)
+            return "".join(segment.text for segment in segments).strip()
+        result = self.whisper_model.transcribe(audio_path, **self.decode_options)
         return result.get("text", "").strip()
 
-    def process(self, audio_path: str) -> Dict:
+    @staticmethod
+    def decode_audio_stream(chunks: Iterable[bytes], sample_rate: int = whisper.audio.SAMPLE_RATE) -> np.ndarray:
+        """
+        Decode encoded audio (any format ffmpeg reads) into the mono float32
+        waveform Whisper expects, piping chunks through ffmpeg as they arrive
+        instead of going through a temporary file.
+        """
+        cmd = ["ffmpeg", "-nostdin", "-threads", "0", "-i", "pipe:0",
+               "-f", "s16le", "-ac", "1", "-acodec", "pcm_s16le", "-ar", str(sample_rate), "pipe:1"]
+        proc = subprocess.Popen(cmd, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+
+        def feed():
+            try:
+                for chunk in chunks:
+                    proc.stdin.write(chunk)
+            except BrokenPipeError:
+                pass
+            finally:
+                proc.stdin.close()
+
+        # Feed stdin from a second thread so a full stdout pipe cannot deadlock the decode
+        writer = threading.Thread(target=feed, daemon=True)
+        writer.start()
+        pcm = proc.stdout.read()
+        writer.join()
+        if proc.wait() != 0:
+            raise RuntimeError("❌ ffmpeg failed to decode audio")
+        return np.frombuffer(pcm, np.int16).astype(np.float32) / 32768.0
+
+    def process(self, audio_path: Union[str, np.ndarray]) -> Dict:
         """
         End-to-end pipeline: audio → transcription → query structuring.
 
@@ -37,7 +119,7 @@ class AudioSearchPipeline:
             Dict: structured query with keys like `query`, `category`, `price_max`, `intent`
         """
         try:
-            print(f"🎙️ Transcribing audio: {audio_path}")
+            print(f"🎙️ Transcribing audio: {audio_path if isinstance(audio_path, str) else 'waveform'}")
             text_query = self.transcribe_audio(audio_path)
             print(f"📝 Transcribed Text: {text_query}")
             # structured_query = self.query_rewriter.rewrite(text_query)
@@ -0,0 +1,526 @@
+import os
+import sys
+import json
+import math
+import time
+import zlib
+import random
+import string
+import asyncio
+import argparse
+import platform
+import resource
+import tempfile
+import itertools
+import subprocess
+from collections import defaultdict
+
+import numpy as np
+import psutil
+from bson import ObjectId
+
+# db.py needs a database name at import; the benchmark replaces its collections with local stand-ins
+os.environ.setdefault("MONGODB_DB_NAME", "benchmark")
+os.environ.setdefault("MONGODB_COLLECTION", "products")
+# Models are handed to the API directly; nothing should load in the background
+os.environ["PRELOAD_MODELS"] = ""
+os.environ["WARMUP_MODELS"] = ""
+
+import db
+from Indexer import ProductSearchIndexer, RerankCascade
+from IndexCreaterScript import build_index, StageTimer
+from Evaluation import recall_report, print_report
+from LexicalIndex import tokenize
+from QueryParser import CATEGORY_LEXICON, RuleBasedQueryParser, HybridQueryParser
+from TextProcessor import build_product_record
+
+
+BRANDS = ["Acme", "Nova", "Zenith", "Orbit", "Lumen", "Vertex", "Aurora", "Summit", "Kestrel", "Harbor",
+          "Pioneer", "Cobalt", "Willow", "Quartz", "Ember", "Atlas", "Juniper", "Sable", "Tundra", "Maple"]
+ADJECTIVES = ["lightweight", "durable", "premium", "compact", "portable", "wireless", "ergonomic", "classic",
+              "waterproof", "eco-friendly", "adjustable", "foldable", "stainless", "organic", "slim", "heavy duty"]
+FEATURES = ["Long lasting battery with fast charging support.", "Made from recycled materials.",
+            "Machine washable and quick drying.", "1 year manufacturer warranty.",
+            "Non-slip grip for everyday use.", "Fits most standard sizes.", "BPA free and food safe.",
+            "Includes a travel pouch.", "Available in multiple colours.", "Designed for daily home use.",
+            "Breathable fabric keeps you cool.", "Scratch resistant finish.", "Easy to assemble in minutes.",
+            "Certified for safety and quality.", "Energy efficient design."]
+
+# Index settings benchmarked by default; `--configs` takes "index_type[:storage]" names
+DEFAULT_CONFIGS = ["flat", "hnsw", "ivf_flat:int8"]
+DEFAULT_CONCURRENCY = [1, 8, 32]
+
+
+# === Synthetic catalogue and local Mongo stand-in ===
+
+class SyntheticCatalogue:
+    def __init__(self, size, seed=0):
+        """
+        Deterministic catalogue in the shape of the Mongo product documents
+        (`title`, `bullet_points`, `description`, `price` and nested
+        `category[].ladder[].name`).
+
+        Documents are generated from their position on demand and never held
+        in memory, so 10M products cost no more than 10k. Product i has the
+        ObjectId whose 12 bytes encode i + 1 (the all-zero ObjectId is
+        reserved by `IdMap`), which makes `_id` lookups O(1).
+
+        Args:
+            size (int): Number of products.
+            seed (int): Same seed, same catalogue and queries.
+        """
+        self.size = size
+        self.seed = seed
+        self.categories = sorted(CATEGORY_LEXICON)
+
+    @staticmethod
+    def object_id(i):
+        return ObjectId((int(i) + 1).to_bytes(12, "big"))
+
+    @staticmethod
+    def position(object_id):
+        return int.from_bytes(ObjectId(object_id).binary, "big") - 1
+
+    def _fields(self, i):
+        rng = random.Random(self.seed * 1_000_003 + i)
+        category = rng.choice(self.categories)
+        return {
+            "rng": rng,
+            "category": category,
+            "noun": rng.choice(CATEGORY_LEXICON[category]),
+            "brand": rng.choice(BRANDS),
+            "adjective": rng.choice(ADJECTIVES),
+            "model": f"{rng.choice(string.ascii_uppercase)}{rng.choice(string.ascii_uppercase)}-{rng.randrange(100, 1000)}",
+            "price": rng.randrange(199, 20000),
+        }
+
+    def document(self, i):
+        fields = self._fields(i)
+        rng = fields["rng"]
+        noun, brand, adjective = fields["noun"], fields["brand"], fields["adjective"]
+        return {
+            "_id": self.object_id(i),
+            "title": f"{brand} {adjective.title()} {noun.title()} {fields['model']}",
+            "bullet_points": "\n".join(rng.sample(FEATURES, 3)),
+            "description": f"A {adjective} {noun} by {brand}. {rng.choice(FEATURES)}",
+            "price": f"₹{fields['price']:,}",
+            "category": [{"ladder": [{"name": fields["category"].title()}, {"name": noun.title()}]}],
+        }
+
+    def query(self, i):
+        """A known-item query for product i: its brand, product noun and model code, sometimes with a price cap."""
+        fields = self._fields(i)
+        query = f"{fields['brand']} {fields['noun']} {fields['model']}".lower()
+        if fields["rng"].random() < 0.3:
+            query += f" under {math.ceil(fields['price'] / 500) * 500}"
+        return query, str(self.object_id(i))
+
+    def queries(self, count):
+        rng = random.Random(self.seed)
+        return [self.query(i) for i in rng.sample(range(self.size), min(count, self.size))]
+
+
+def _project(document, projection):
+    if not projection:
+        return document
+    keep = {field.split(".")[0] for field, include in projection.items() if include}
+    return {key: value for key, value in document.items() if key == "_id" or key in keep}
+
+
+class LocalCursor:
+    def __init__(self, catalogue, positions, projection):
+        self.catalogue = catalogue
+        self.positions = positions
+        self.projection = projection
+
+    def sort(self, field, direction=1):
+        if field != "_id":
+            raise ValueError(f"❌ The local collection can only sort by _id, not '{field}'.")
+        if direction < 0:
+            self.positions = reversed(list(self.positions))
+        return self
+
+    def __iter__(self):
+        for i in self.positions:
+            yield _project(self.catalogue.document(i), self.projection)
+
+    def __next__(self):
+        # Cursors are consumed with next(cursor, None), like pymongo's
+        if not hasattr(self, "_iterator"):
+            self._iterator = iter(self)
+        return next(self._iterator)
+
+    async def __aiter__(self):
+        for document in self:
+            yield document
+
+
+class LocalCollection:
+    def __init__(self, catalogue):
+        """
+        Read-only stand-in for the pymongo collection over a synthetic
+        catalogue. Supports the queries the indexer and API issue: everything,
+        `_id` `$in` and `_id` `$gt`.
+        """
+        self.catalogue = catalogue
+
+    def estimated_document_count(self):
+        return self.catalogue.size
+
+    def _positions(self, query):
+        condition = (query or {}).get("_id")
+        if not condition:
+            return range(self.catalogue.size)
+        if "$in" in condition:
+            positions = (self.catalogue.position(object_id) for object_id in condition["$in"])
+            return [i for i in positions if 0 <= i < self.catalogue.size]
+        if "$gt" in condition:
+            return range(self.catalogue.position(condition["$gt"]) + 1, self.catalogue.size)
+        raise ValueError(f"❌ The local collection does not support the query {query}.")
+
+    def find(self, query=None, projection=None, batch_size=None):
+        return LocalCursor(self.catalogue, self._positions(query), projection)
+
+
+class StubQueryRewriter:
+    def __init__(self, latency_ms=0.0):
+        """
+        Offline stand-in for the Gemini `QueryRewriter`: rule-based parsing
+        after a simulated round trip of `latency_ms`.
+        """
+        self.model_name = "stub"
+        self.latency = latency_ms / 1000
+        self.rules = RuleBasedQueryParser()
+
+    def rewrite(self, user_input):
+        time.sleep(self.latency)
+        return self.rules.parse(user_input)[0]
+
+    async def arewrite(self, user_input):
+        await asyncio.sleep(self.latency)
+        return self.rules.parse(user_input)[0]
+
+
+# === Model stand-ins for index-scale runs ===
+
+class HashingEncoder:
+    def __init__(self, dimension=384):
+        """Deterministic SentenceTransformer stand-in: signed feature hashing of word unigrams and bigrams."""
+        self.dimension = dimension
+
+    def encode(self, texts, batch_size=None, normalize_embeddings=True, **kwargs):
+        vectors = np.zeros((len(texts), self.dimension), dtype="float32")
+        for row, text in enumerate(texts):
+            tokens = tokenize(text)
+            for token in itertools.chain(tokens, (f"{a} {b}" for a, b in zip(tokens, tokens[1:]))):
+                h = zlib.crc32(token.encode("utf-8"))
+                vectors[row, h % self.dimension] += 1.0 if h & 0x80000000 else -1.0
+        if normalize_embeddings:
+            norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+            vectors /= np.where(norms > 0, norms, 1)
+        return vectors
+
+
+class OverlapReranker:
+    """CrossEncoder stand-in scoring a (query, text) pair by token overlap."""
+
+    def predict(self, pairs, **kwargs):
+        scores = []
+        for query, text in pairs:
+            query_tokens, text_tokens = set(tokenize(query)), set(tokenize(text))
+            scores.append(len(query_tokens & text_tokens) / math.sqrt(len(text_tokens) or 1))
+        return np.asarray(scores, dtype="float32")
+
+
+# === Measurements ===
+
+def _rss_mb():
+    return psutil.Process().memory_info().rss / 2 ** 20
+
+
+def _peak_rss_mb():
+    # ru_maxrss is in KiB on Linux and bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 2 ** 20 if sys.platform == "darwin" else peak / 2 ** 10
+
+
+def _directory_mb(path):
+    return sum(os.path.getsize(os.path.join(root, name)) for root, _, files in os.walk(path) for name in files) / 2 ** 20
+
+
+def _latency_stats(latencies_ms):
+    latencies_ms = np.asarray(latencies_ms)
+    return {
+        "p50_ms": round(float(np.percentile(latencies_ms, 50)), 3),
+        "p99_ms": round(float(np.percentile(latencies_ms, 99)), 3),
+        "mean_ms": round(float(latencies_ms.mean()), 3),
+    }
+
+
+def parse_config(name, size):
+    """"ivf_flat:int8" → indexer build arguments, with nlist scaled to the catalogue."""
+    index_type, _, storage = name.partition(":")
+    return {"index_type": index_type, "storage": storage or "float32",
+            "nlist": max(16, min(4096, int(4 * math.sqrt(size))))}
+
+
+def measure_build(indexer, workdir, args):
+    rss_before = _rss_mb()
+    timer = StageTimer()
+    start = time.perf_counter()
+    indexed = build_index(indexer, chunk_size=args.chunk_size, batch_size=args.batch_size,
+                          encode_batch_size=args.encode_batch_size, workers=args.workers, timer=timer)
+    seconds = time.perf_counter() - start
+    build = {
+        "products": indexed,
+        "seconds": round(seconds, 2),
+        "products_per_second": round(indexed / seconds, 1) if seconds > 0 else None,
+        "stages": {stage: {"seconds": round(timer.seconds[stage], 2),
+                           "docs_per_second": round(timer.docs[stage] / timer.seconds[stage], 1)
+                           if timer.seconds[stage] > 0 else None}
+                   for stage in timer.seconds},
+    }
+    memory = {
+        "rss_mb": round(_rss_mb(), 1),
+        "rss_growth_mb": round(_rss_mb() - rss_before, 1),
+        "peak_rss_mb": round(_peak_rss_mb(), 1),
+        "on_disk_mb": round(_directory_mb(workdir), 1),
+    }
+    return build, memory
+
+
+def rerank_settings():
+    return [
+        ("dense_only", {"rerank": False}),
+        ("full_rerank", {"rerank": True, "cascade": False}),
+        ("cascade_rerank", {"rerank": True, "cascade": RerankCascade()}),
+    ]
+
+
+def measure_search(indexer, queries, k, top_k):
+    """Sequential search latency and known-item recall@k (the query's source product in the top k)."""
+    rows = []
+    for name, options in rerank_settings():
+        for query, _ in queries[:5]:
+            indexer.search(query, top_k=top_k, **options)
+        latencies, hits = [], 0
+        for query, pid in queries:
+            start = time.perf_counter()
+            results = indexer.search(query, top_k=top_k, **options)
+            latencies.append((time.perf_counter() - start) * 1000)
+            hits += pid in results[:k]
+        row = {"setting": name, "queries": len(queries), **_latency_stats(latencies),
+               "recall_at_k": round(hits / len(queries), 4)}
+        rows.append(row)
+        print(f"🔎 {name:<15} recall@{k} {row['recall_at_k']:.3f}  p50 {row['p50_ms']:.2f} ms  "
+              f"p99 {row['p99_ms']:.2f} ms")
+    return rows
+
+
+def serve(indexer, rewrite_latency_ms):
+    """The FastAPI app wired to the local stand-ins and an already built indexer."""
+    import main
+    main.models.replace("indexer", indexer)
+    main.QueryRewriter = HybridQueryParser(StubQueryRewriter(rewrite_latency_ms))
+    return main
+
+
+async def _load_level(client, queries, concurrency, requests):
+    latencies, stages = [], defaultdict(list)
+    errors = 0
+    positions = iter(range(requests))
+
+    async def client_loop():
+        nonlocal errors
+        # One shared iterator: each request is taken by exactly one simulated client
+        for n in positions:
+            query, _ = queries[n % len(queries)]
+            start = time.perf_counter()
+            response = await client.post("/search", data={"text": query}, headers={"X-Profile": "1"})
+            latencies.append((time.perf_counter() - start) * 1000)
+            if response.status_code != 200:
+                errors += 1
+                continue
+            profile = response.json()["profile_ms"]
+            for stage, ms in {**profile.pop("search_stages"), **profile}.items():
+                stages[stage].append(ms)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(client_loop() for _ in range(concurrency)))
+    seconds = time.perf_counter() - start
+    return {"concurrency": concurrency, "requests": requests, "errors": errors,
+            "qps": round(requests / seconds, 1), **_latency_stats(latencies),
+            "stage_mean_ms": {stage: round(float(np.mean(values)), 3) for stage, values in stages.items()}}
+
+
+def measure_concurrency(loop, indexer, queries, levels, requests, rewrite_latency_ms):
+    """
+    QPS and latency of /search end to end (rewrite, batched search, hydration) under concurrent clients.
+    Every call must use the same `loop`: the API's batcher and limiters bind to the loop they first run on.
+    """
+    import httpx
+    main = serve(indexer, rewrite_latency_ms)
+
+    async def run():
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://benchmark", timeout=None) as client:
+            rows = []
+            for concurrency in levels:
+                main.product_cache.clear()
+                row = await _load_level(client, queries, concurrency, requests)
+                print(f"🚦 concurrency {concurrency:>4}  {row['qps']:>8.1f} qps  p50 {row['p50_ms']:.1f} ms  "
+                      f"p99 {row['p99_ms']:.1f} ms  errors {row['errors']}")
+                rows.append(row)
+            return rows
+
+    return loop.run_until_complete(run())
+
+
+def measure_ann_recall(indexer, catalogue, queries, sample, k):
+    """recall@k of each approximate index setting against exact search, on a sample of the catalogue."""
+    records = (build_product_record(catalogue.document(i)) for i in range(min(sample, catalogue.size)))
+    texts = [record[1] for record in records if record]
+    embeddings = indexer.encode_products(texts)
+    query_vecs = indexer.query_model.encode([query for query, _ in queries], normalize_embeddings=True)
+    rows = recall_report(embeddings, np.asarray(query_vecs, dtype="float32"), k=k, dimension=indexer.dimension)
+    print_report(rows, k=k)
+    return rows
+
+
+# === Results ===
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def flatten(results):
+    """Headline metrics keyed by a stable path, for comparing two result files."""
+    flat = {}
+    for config in results["configs"]:
+        prefix = config["name"]
+        flat[f"{prefix}/build/products_per_second"] = config["build"]["products_per_second"]
+        flat[f"{prefix}/memory/rss_mb"] = config["memory"]["rss_mb"]
+        flat[f"{prefix}/memory/on_disk_mb"] = config["memory"]["on_disk_mb"]
+        for row in config["search"]:
+            for metric in ("p50_ms", "p99_ms", "recall_at_k"):
+                flat[f"{prefix}/search/{row['setting']}/{metric}"] = row[metric]
+        for row in config.get("concurrency", []):
+            for metric in ("qps", "p50_ms", "p99_ms"):
+                flat[f"{prefix}/concurrency/{row['concurrency']}/{metric}"] = row[metric]
+    for row in results.get("ann_recall", []):
+        name = ",".join(f"{key}={value}" for key, value in row["config"].items())
+        flat[f"ann/{name}/recall"] = row["recall"]
+        flat[f"ann/{name}/p99_ms"] = row["p99_ms"]
+    return flat
+
+
+def compare(baseline, current):
+    """Print the relative change of every headline metric present in both result files."""
+    before, after = flatten(baseline), flatten(current)
+    print(f"\n📈 {baseline['meta'].get('commit')} → {current['meta'].get('commit')}")
+    for key in sorted(before.keys() & after.keys()):
+        old, new = before[key], after[key]
+        change = (new - old) / old if old else float("nan")
+        print(f"  {key:<60} {old:>12.3f} {new:>12.3f} {change:>+8.1%}")
+
+
+def run(args):
+    catalogue = SyntheticCatalogue(args.size, seed=args.seed)
+    db.collection = LocalCollection(catalogue)
+    db.async_collection = LocalCollection(catalogue)
+    queries = catalogue.queries(args.queries)
+    models = (HashingEncoder(), HashingEncoder(), OverlapReranker()) if args.stub_models else None
+
+    results = {
+        "meta": {
+            "commit": git_commit(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "args": vars(args),
+        },
+        "configs": [],
+    }
+    workroot = args.workdir or tempfile.mkdtemp(prefix="intentsearch-bench-")
+    loop = asyncio.new_event_loop()
+    for name in args.configs:
+        print(f"\n🏗️ {name}: indexing {args.size} synthetic products")
+        workdir = os.path.join(workroot, name.replace(":", "-"))
+        indexer = ProductSearchIndexer(index_path=os.path.join(workdir, "index.faiss"),
+                                       id_map_path=os.path.join(workdir, "id_map.json"),
+                                       use_embedding_cache=False, models=models,
+                                       hybrid=not args.no_hybrid, num_shards=args.shards,
+                                       **parse_config(name, args.size))
+        models = indexer.models
+        build, memory = measure_build(indexer, workdir, args)
+        config = {"name": name, "build": build, "memory": memory,
+                  "search": measure_search(indexer, queries, args.k, args.top_k)}
+        if args.concurrency:
+            config["concurrency"] = measure_concurrency(loop, indexer, queries, args.concurrency, args.requests,
+                                                        args.rewrite_latency_ms)
+        results["configs"].append(config)
+        indexer.close()
+    loop.close()
+
+    if args.ann_sample:
+        results["ann_recall"] = measure_ann_recall(indexer, catalogue, queries, args.ann_sample, args.k)
+
+    output = args.output or os.path.join("data", "benchmarks", f"{results['meta']['commit'] or 'local'}-{args.size}.json")
+    os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(results, f, indent=2, default=str)
+    print(f"\n💾 Results written to {output}")
+
+    if args.compare:
+        with open(args.compare, "r") as f:
+            compare(json.load(f), results)
+    return results
+
+
+def _int_list(value):
+    return [int(part) for part in value.split(",") if part]
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Offline benchmark on a synthetic catalogue, "
+                                                 "with no MongoDB or Gemini needed.")
+    parser.add_argument("--size", type=int, default=10_000, help="Synthetic products (10k–10M)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--configs", type=lambda value: value.split(","), default=DEFAULT_CONFIGS,
+                        help="Comma-separated index_type[:storage] settings, e.g. flat,hnsw,ivf_pq,flat:int8")
+    parser.add_argument("--shards", type=int, default=None, help="Shard every index into this many parts")
+    parser.add_argument("--no-hybrid", action="store_true", help="Dense retrieval only, no BM25 fusion")
+    parser.add_argument("--stub-models", action="store_true",
+                        help="Hashing encoder and overlap reranker instead of the real models, "
+                             "to benchmark the index at sizes the encoder cannot build in time")
+    parser.add_argument("--queries", type=int, default=500, help="Known-item queries per setting")
+    parser.add_argument("--k", type=int, default=10, help="Cut-off for recall@k")
+    parser.add_argument("--top-k", type=int, default=20, help="Results per search")
+    parser.add_argument("--concurrency", type=_int_list, default=DEFAULT_CONCURRENCY,
+                        help="Comma-separated concurrent /search clients; empty to skip")
+    parser.add_argument("--requests", type=int, default=500, help="/search requests per concurrency level")
+    parser.add_argument("--rewrite-latency-ms", type=float, default=0.0,
+                        help="Simulated Gemini round trip for queries the rule parser escalates")
+    parser.add_argument("--ann-sample", type=int, default=50_000,
+                        help="Products in the approximate-vs-exact recall comparison; 0 to skip")
+    parser.add_argument("--chunk-size", type=int, default=2048)
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument("--encode-batch-size", type=int, default=256)
+    parser.add_argument("--workers", type=int, default=1,
+                        help="Build processes (real models only; workers load their own encoder)")
+    parser.add_argument("--workdir", default=None, help="Where indexes are built. Defaults to a temp directory")
+    parser.add_argument("--output", default=None, help="Results JSON. Defaults to data/benchmarks/<commit>-<size>.json")
+    parser.add_argument("--compare", default=None, help="Earlier results JSON to compare against")
+    args = parser.parse_args()
+    if args.stub_models and args.workers > 1:
+        parser.error("--stub-models builds in one process; build workers would load the real encoder")
+    return args
+
+
+if __name__ == "__main__":
+    run(parse_args())
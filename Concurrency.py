@@ -0,0 +1,76 @@
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+
+
+class QueueFullError(Exception):
+    """Raised when a stage already has as much work queued as it is allowed to hold."""
+
+    def __init__(self, stage):
+        super().__init__(f"{stage} queue is full")
+        self.stage = stage
+
+
+class AsyncLimiter:
+    def __init__(self, name, max_concurrency, max_queue):
+        """
+        Bound concurrent async work (LLM and Mongo calls) on the event loop.
+
+        Up to `max_concurrency` callers run at once and `max_queue` more may
+        wait; beyond that `QueueFullError` is raised straight away instead of
+        letting latency grow without bound.
+        """
+        self.name = name
+        self.capacity = max_concurrency + max_queue
+        self.in_flight = 0
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+
+    async def __aenter__(self):
+        if self.in_flight >= self.capacity:
+            raise QueueFullError(self.name)
+        self.in_flight += 1
+        try:
+            await self._semaphore.acquire()
+        except BaseException:
+            self.in_flight -= 1
+            raise
+        return self
+
+    async def __aexit__(self, *exc_info):
+        self._semaphore.release()
+        self.in_flight -= 1
+
+
+class BoundedExecutor:
+    def __init__(self, name, max_workers, max_queue, kind="thread"):
+        """
+        Dedicated worker pool for blocking model inference.
+
+        Args:
+            name (str): Stage name, used in thread names and errors.
+            max_workers (int): Threads (or processes) running the stage.
+            max_queue (int): Calls allowed to wait for a free worker before
+                `QueueFullError` is raised.
+            kind (str): "thread" (models that release the GIL, i.e. torch) or
+                "process" (pure-Python work; callables and arguments must pickle).
+        """
+        self.name = name
+        self.capacity = max_workers + max_queue
+        self.in_flight = 0
+        if kind == "process":
+            self.pool = ProcessPoolExecutor(max_workers=max_workers)
+        else:
+            self.pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=name)
+
+    async def run(self, fn, *args, **kwargs):
+        # Only touched from the event loop thread, so no lock is needed
+        if self.in_flight >= self.capacity:
+            raise QueueFullError(self.name)
+        self.in_flight += 1
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self.pool, functools.partial(fn, *args, **kwargs))
+        finally:
+            self.in_flight -= 1
+
+    def shutdown(self):
+        self.pool.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,92 @@
+import os
+import mmap
+import numpy as np
+
+
+class DocumentStore:
+    def __init__(self, path="data/docstore"):
+        """
+        Append-only on-disk text store keyed by FAISS row.
+
+        Texts are concatenated as UTF-8 in `<path>.bin`; `<path>.idx` holds
+        n + 1 int64 byte offsets so row i spans offsets[i]:offsets[i + 1].
+        Both files are memory-mapped, so reads only touch the pages of the
+        rows requested and resident memory does not grow with the catalogue.
+
+        Args:
+            path (str): File prefix for the `.bin` and `.idx` files.
+        """
+        self.data_path = f"{path}.bin"
+        self.offsets_path = f"{path}.idx"
+        self._data = None
+        self._data_file = None
+        self._offsets = np.zeros(1, dtype="int64")
+        self._open()
+
+    def _open(self):
+        self.close()
+        if not os.path.exists(self.offsets_path) or os.path.getsize(self.offsets_path) == 0:
+            self._offsets = np.zeros(1, dtype="int64")
+            return
+
+        offsets = np.memmap(self.offsets_path, dtype="int64", mode="r")
+        data_size = os.path.getsize(self.data_path) if os.path.exists(self.data_path) else 0
+        # A crash between writing the texts and their offsets leaves trailing offsets past the data
+        valid = int(np.searchsorted(offsets, data_size, side="right"))
+        self._offsets = offsets[:max(valid, 1)]
+
+        if data_size > 0:
+            self._data_file = open(self.data_path, "rb")
+            self._data = mmap.mmap(self._data_file.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def __len__(self):
+        return len(self._offsets) - 1
+
+    def append(self, texts):
+        """Append texts as the next rows. Returns the row number of the first one."""
+        first_row = len(self)
+        encoded = [text.encode("utf-8") for text in texts]
+        lengths = np.fromiter((len(b) for b in encoded), dtype="int64", count=len(encoded))
+        new_offsets = self._offsets[-1] + np.cumsum(lengths)
+
+        self.close()
+        os.makedirs(os.path.dirname(self.data_path) or ".", exist_ok=True)
+        with open(self.data_path, "ab") as f:
+            f.truncate(int(self._offsets[-1]))
+            for b in encoded:
+                f.write(b)
+        with open(self.offsets_path, "ab") as f:
+            # Drops offsets past the valid data; a new file is zero-extended to its leading 0 offset
+            f.truncate(len(self._offsets) * 8)
+            f.write(new_offsets.astype("int64").tobytes())
+
+        self._open()
+        return first_row
+
+    def get(self, rows):
+        """
+        Fetch texts for the given rows. Rows outside the store return "".
+
+        Only the requested byte ranges are read from the mapping; nothing
+        else is copied into memory.
+        """
+        if self._data is None:
+            return ["" for _ in rows]
+        view = memoryview(self._data)
+        texts = []
+        for row in rows:
+            if 0 <= row < len(self):
+                start, end = int(self._offsets[row]), int(self._offsets[row + 1])
+                texts.append(str(view[start:end], "utf-8"))
+            else:
+                texts.append("")
+        view.release()
+        return texts
+
+    def close(self):
+        if self._data is not None:
+            self._data.close()
+            self._data = None
+        if self._data_file is not None:
+            self._data_file.close()
+            self._data_file = None
@@ -0,0 +1,149 @@
+import os
+import hashlib
+import numpy as np
+
+
+# New entries held in memory before they are appended to disk (~50 MB of float16 384-d vectors)
+FLUSH_ROWS = 65536
+
+
+class EmbeddingCache:
+    def __init__(self, path="data/embedding_cache", model_name="", dimension=384, dtype="float16",
+                 flush_rows=FLUSH_ROWS):
+        """
+        On-disk cache of product embeddings keyed by a hash of the model name
+        and the cleaned text, so unchanged products are never re-encoded.
+
+        `<path>.keys` holds one uint64 hash per row and `<path>.vecs` the
+        matching vectors, both append-only. Lookups binary-search a sorted
+        copy of the keys; vectors are memory-mapped and only hit rows are read.
+
+        Args:
+            path (str): File prefix for the `.keys` and `.vecs` files.
+            model_name (str): Encoder name, part of every key.
+            dimension (int): Embedding dimension.
+            dtype (str): Storage precision, "float16" or "float32".
+            flush_rows (int): New entries buffered before `put` flushes them,
+                so memory stays bounded during a streaming build.
+        """
+        self.path = path
+        self.keys_path = f"{path}.keys"
+        self.vectors_path = f"{path}.vecs"
+        self.model_name = model_name
+        self.dimension = dimension
+        self.dtype = np.dtype(dtype)
+        self.flush_rows = flush_rows
+        self.hits = 0
+        self.misses = 0
+        self._load()
+
+    def _load(self):
+        keys = np.fromfile(self.keys_path, dtype="uint64") if os.path.exists(self.keys_path) else np.empty(0, "uint64")
+        row_bytes = self.dimension * self.dtype.itemsize
+        vector_rows = os.path.getsize(self.vectors_path) // row_bytes if os.path.exists(self.vectors_path) else 0
+        # A crash between the two appends leaves keys without vectors (or the reverse)
+        size = min(len(keys), vector_rows)
+        keys = keys[:size]
+        if size:
+            self._vectors = np.memmap(self.vectors_path, dtype=self.dtype, mode="r", shape=(size, self.dimension))
+        else:
+            self._vectors = np.empty((0, self.dimension), dtype=self.dtype)
+        self._order = np.argsort(keys, kind="stable")
+        self._sorted_keys = keys[self._order]
+        self._size = size
+        self._clear_new()
+
+    def _clear_new(self):
+        # Entries added since the last flush
+        self._new_rows = {}
+        self._new_keys = []
+        self._new_vectors = []
+
+    def __len__(self):
+        return self._size + len(self._new_keys)
+
+    def make_keys(self, texts):
+        prefix = f"{self.model_name}\0".encode("utf-8")
+        return np.fromiter(
+            (int.from_bytes(hashlib.blake2b(prefix + text.encode("utf-8"), digest_size=8).digest(), "little")
+             for text in texts),
+            dtype="uint64", count=len(texts))
+
+    def get(self, keys):
+        """
+        Look up cached vectors.
+
+        Returns:
+            Tuple[np.ndarray, np.ndarray]: float32 vectors (zeros for misses)
+            and a boolean hit mask.
+        """
+        vectors = np.zeros((len(keys), self.dimension), dtype="float32")
+        hit = np.zeros(len(keys), dtype=bool)
+        if self._size and len(keys):
+            positions = np.minimum(np.searchsorted(self._sorted_keys, keys), self._size - 1)
+            hit = self._sorted_keys[positions] == keys
+            if hit.any():
+                rows = self._order[positions[hit]]
+                # Sorted row order keeps memmap reads sequential
+                read_order = np.argsort(rows)
+                found = np.empty((len(rows), self.dimension), dtype="float32")
+                found[read_order] = self._vectors[rows[read_order]]
+                vectors[hit] = found
+        if self._new_rows:
+            for i in np.flatnonzero(~hit):
+                row = self._new_rows.get(int(keys[i]))
+                if row is not None:
+                    vectors[i] = self._new_vectors[row]
+                    hit[i] = True
+
+        hit_count = int(hit.sum())
+        self.hits += hit_count
+        self.misses += len(keys) - hit_count
+        return vectors, hit
+
+    def record(self, hits, misses):
+        """Count lookups made against a copy of this cache in another process."""
+        self.hits += hits
+        self.misses += misses
+
+    def put(self, keys, vectors):
+        for key, vector in zip(keys, vectors):
+            key = int(key)
+            if key not in self._new_rows:
+                self._new_rows[key] = len(self._new_keys)
+                self._new_keys.append(key)
+                self._new_vectors.append(np.asarray(vector, dtype=self.dtype))
+        if len(self._new_keys) >= self.flush_rows:
+            self.flush()
+
+    def flush(self):
+        """Append entries added since the last flush to disk and merge them into the sorted lookup keys."""
+        if not self._new_keys:
+            return
+        os.makedirs(os.path.dirname(self.keys_path) or ".", exist_ok=True)
+        row_bytes = self.dimension * self.dtype.itemsize
+        with open(self.vectors_path, "ab") as f:
+            f.truncate(self._size * row_bytes)
+            f.write(np.vstack(self._new_vectors).astype(self.dtype).tobytes())
+        with open(self.keys_path, "ab") as f:
+            f.truncate(self._size * 8)
+            f.write(np.asarray(self._new_keys, dtype="uint64").tobytes())
+
+        # Merging the sorted new keys in is linear; re-sorting every key on each flush is not
+        new_keys = np.asarray(self._new_keys, dtype="uint64")
+        new_order = np.argsort(new_keys, kind="stable")
+        positions = np.searchsorted(self._sorted_keys, new_keys[new_order])
+        self._sorted_keys = np.insert(self._sorted_keys, positions, new_keys[new_order])
+        self._order = np.insert(self._order, positions, self._size + new_order)
+        self._size += len(new_keys)
+        self._vectors = np.memmap(self.vectors_path, dtype=self.dtype, mode="r", shape=(self._size, self.dimension))
+        self._clear_new()
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "size": len(self),
+        }
@@ -0,0 +1,203 @@
+import time
+import numpy as np
+import faiss
+
+from Indexer import build_faiss_index, set_search_params, min_training_size
+
+
+DEFAULT_INDEX_CONFIGS = [
+    {"index_type": "hnsw", "ef_search": 32},
+    {"index_type": "hnsw", "ef_search": 128},
+    {"index_type": "ivf_flat", "nprobe": 8},
+    {"index_type": "ivf_flat", "nprobe": 32},
+    {"index_type": "ivf_pq", "nprobe": 8},
+    {"index_type": "ivf_pq", "nprobe": 32},
+    {"index_type": "flat", "storage": "fp16"},
+    {"index_type": "flat", "storage": "int8"},
+    {"index_type": "flat", "storage": "int8", "refine_factor": 4},
+    {"index_type": "flat", "storage": "pq"},
+    {"index_type": "flat", "storage": "pq", "refine_factor": 4},
+    {"index_type": "hnsw", "storage": "int8", "ef_search": 128},
+    {"index_type": "ivf_flat", "storage": "int8", "nprobe": 32, "refine_factor": 4},
+]
+
+BUILD_KEYS = ("index_type", "nlist", "pq_m", "pq_nbits", "hnsw_m", "storage")
+SEARCH_KEYS = ("nprobe", "ef_search")
+
+
+def _timed_search(index, query_vecs, k, refine_vectors=None, refine_factor=0):
+    """
+    Search one query at a time (like the API does) and return results plus per-query latency in ms.
+    With `refine_vectors`, `refine_factor` * k candidates are re-scored at full precision.
+    """
+    refine = refine_vectors is not None and refine_factor > 1
+    all_ids = np.empty((len(query_vecs), k), dtype="int64")
+    latencies = []
+    for i in range(len(query_vecs)):
+        start = time.perf_counter()
+        _, I = index.search(query_vecs[i:i + 1], k * refine_factor if refine else k)
+        ids = I[0]
+        if refine:
+            ids = ids[ids >= 0]
+            ids = ids[np.argsort(-(refine_vectors[ids] @ query_vecs[i]), kind="stable")[:k]]
+            ids = np.pad(ids, (0, k - len(ids)), constant_values=-1)
+        latencies.append((time.perf_counter() - start) * 1000)
+        all_ids[i] = ids
+    return all_ids, np.array(latencies)
+
+
+def index_memory_mb(index):
+    """Serialized size of an index, a close proxy for its resident memory."""
+    return faiss.serialize_index(index).nbytes / 2 ** 20
+
+
+def recall_at_k(ground_truth, results, k):
+    """Mean fraction of the exact top-k that the approximate top-k recovered."""
+    hits = [len(set(gt[:k]) & set(res[:k])) for gt, res in zip(ground_truth, results)]
+    return float(np.mean(hits)) / k
+
+
+def recall_report(embeddings, query_vecs, configs=None, k=10, dimension=384):
+    """
+    Compare approximate index types against an exact flat index.
+
+    Args:
+        embeddings (np.ndarray): Normalized product embeddings, shape (n, dimension).
+        query_vecs (np.ndarray): Normalized query embeddings, shape (q, dimension).
+        configs (List[Dict]): Build and search parameters per row, e.g.
+            {"index_type": "ivf_flat", "storage": "int8", "nprobe": 16, "refine_factor": 4}.
+        k (int): Cut-off for recall@k.
+
+    Returns:
+        List[Dict]: One row per config with recall@k, latency stats and index memory.
+    """
+    embeddings = np.ascontiguousarray(embeddings, dtype="float32")
+    query_vecs = np.ascontiguousarray(query_vecs, dtype="float32")
+    configs = configs or DEFAULT_INDEX_CONFIGS
+
+    flat = faiss.IndexFlatIP(dimension)
+    flat.add(embeddings)
+    ground_truth, flat_latencies = _timed_search(flat, query_vecs, k)
+    rows = [_report_row({"index_type": "flat"}, 1.0, flat_latencies)]
+    rows[0]["memory_mb"] = index_memory_mb(flat)
+
+    # Configs that only differ in search knobs share one built index
+    built = {}
+    for config in configs:
+        build_params = {key: config[key] for key in BUILD_KEYS if key in config}
+        build_key = tuple(sorted(build_params.items()))
+        if build_key not in built:
+            index = build_faiss_index(dimension=dimension, **build_params)
+            if not index.is_trained:
+                required = min_training_size(build_params["index_type"], build_params.get("nlist", 1024),
+                                             build_params.get("pq_nbits", 8), build_params.get("storage", "float32"))
+                if len(embeddings) < required:
+                    print(f"⚠️ Skipping {config}: needs {required} vectors to train.")
+                    continue
+                index.train(embeddings)
+            index.add(embeddings)
+            built[build_key] = index
+        index = built[build_key]
+
+        set_search_params(index, **{key: config[key] for key in SEARCH_KEYS if key in config})
+        results, latencies = _timed_search(index, query_vecs, k, embeddings, config.get("refine_factor", 0))
+        row = _report_row(config, recall_at_k(ground_truth, results, k), latencies)
+        row["memory_mb"] = index_memory_mb(index)
+        rows.append(row)
+
+    return rows
+
+
+def _report_row(config, quality, latencies, metric="recall"):
+    return {
+        "config": config,
+        metric: quality,
+        "p50_ms": float(np.percentile(latencies, 50)),
+        "p99_ms": float(np.percentile(latencies, 99)),
+        "qps": float(1000 / latencies.mean()) if latencies.mean() > 0 else float("inf"),
+    }
+
+
+def print_report(rows, k=10):
+    print(f"\n📊 recall@{k} vs. latency and memory")
+    print(f"{'config':<72} {'recall':>8} {'p50 ms':>9} {'p99 ms':>9} {'qps':>10} {'MB':>9} {'saved':>7}")
+    baseline_mb = rows[0].get("memory_mb")
+    for row in rows:
+        config = ", ".join(f"{key}={value}" for key, value in row["config"].items())
+        memory_mb = row.get("memory_mb", float("nan"))
+        saved = 1 - memory_mb / baseline_mb if baseline_mb else float("nan")
+        print(f"{config:<72} {row['recall']:>8.3f} {row['p50_ms']:>9.3f} {row['p99_ms']:>9.3f} "
+              f"{row['qps']:>10.1f} {memory_mb:>9.1f} {saved:>7.1%}")
+
+
+def ndcg_at_k(ranked, gains, k):
+    """NDCG@k of a ranked list of product ids, given graded relevance gains per product id."""
+    dcg = sum(gains.get(pid, 0.0) / np.log2(rank + 2) for rank, pid in enumerate(ranked[:k]))
+    ideal = sorted(gains.values(), reverse=True)[:k]
+    idcg = sum(gain / np.log2(rank + 2) for rank, gain in enumerate(ideal))
+    return dcg / idcg if idcg > 0 else 0.0
+
+
+def _timed_rerank(indexer, queries, top_k, cascade):
+    results, latencies = [], []
+    for query in queries:
+        start = time.perf_counter()
+        results.append(indexer.search(query, top_k=top_k, cascade=cascade))
+        latencies.append((time.perf_counter() - start) * 1000)
+    return results, np.array(latencies)
+
+
+def cascade_report(indexer, queries, cascade, k=10, top_k=20, qrels=None):
+    """
+    Compare full cross-encoder reranking against a `RerankCascade` on the same index.
+
+    Args:
+        indexer (ProductSearchIndexer): Index to search.
+        queries (List[str]): Evaluation queries.
+        cascade (RerankCascade): Cascade settings to evaluate.
+        k (int): Cut-off for NDCG@k.
+        top_k (int): Candidates retrieved per query.
+        qrels (Dict[str, Dict[str, float]], optional): Graded relevance per query
+            and product id. Defaults to the full rerank's own top-k (gain k - rank),
+            which measures how closely the cascade reproduces it.
+
+    Returns:
+        List[Dict]: Full and cascade rows with NDCG@k and latency stats; the
+        cascade row adds the skip rate, mean rerank depth and latency saved.
+    """
+    full_results, full_latencies = _timed_rerank(indexer, queries, top_k, cascade=False)
+    cascade_results, cascade_latencies = _timed_rerank(indexer, queries, top_k, cascade=cascade)
+    if qrels is None:
+        qrels = {query: {pid: float(k - rank) for rank, pid in enumerate(results[:k])}
+                 for query, results in zip(queries, full_results)}
+
+    # The cascade decides from the dense scores, before any lexical fusion
+    query_vecs = indexer.query_model.encode(list(queries), normalize_embeddings=True).astype("float32")
+    D, I = indexer.index.search(query_vecs, top_k)
+    depths = np.array([cascade.depth([score for idx, score in zip(ids, scores) if idx >= 0])
+                       for ids, scores in zip(I, D)])
+
+    rows = []
+    for config, results, latencies in (({"rerank": "full"}, full_results, full_latencies),
+                                       ({"rerank": "cascade", **vars(cascade)}, cascade_results, cascade_latencies)):
+        ndcg = float(np.mean([ndcg_at_k(ranked, qrels.get(query, {}), k)
+                              for query, ranked in zip(queries, results)]))
+        rows.append(_report_row(config, ndcg, latencies, metric="ndcg"))
+    rows[1].update({
+        "skip_rate": float(np.mean(depths == 0)),
+        "mean_depth": float(depths.mean()),
+        "latency_saved_ms": float(full_latencies.mean() - cascade_latencies.mean()),
+    })
+    return rows
+
+
+def print_cascade_report(rows, k=10):
+    full, cascade = rows
+    print(f"\n📊 NDCG@{k} vs. rerank latency")
+    print(f"{'rerank':<10} {'ndcg':>8} {'p50 ms':>9} {'p99 ms':>9} {'qps':>10}")
+    for row in rows:
+        print(f"{row['config']['rerank']:<10} {row['ndcg']:>8.3f} {row['p50_ms']:>9.3f} "
+              f"{row['p99_ms']:>9.3f} {row['qps']:>10.1f}")
+    print(f"Cascade skipped {cascade['skip_rate']:.1%} of queries, reranked {cascade['mean_depth']:.1f} "
+          f"candidates on average, saved {cascade['latency_saved_ms']:.2f} ms/query "
+          f"for ΔNDCG {cascade['ndcg'] - full['ndcg']:+.3f}")
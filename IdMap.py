@@ -0,0 +1,103 @@
+import os
+import json
+import numpy as np
+
+from Snapshots import atomic_write
+
+
+OBJECT_ID_BYTES = 12
+EMPTY = bytes(OBJECT_ID_BYTES)
+
+
+class IdMap:
+    def __init__(self, path="data/id_map"):
+        """
+        FAISS id → product id map stored as packed 12-byte Mongo ObjectIds.
+
+        `<path>.bin` holds one ObjectId per FAISS id; all-zero rows mark ids
+        whose vectors were compacted away (read back as None), so the all-zero
+        ObjectId is reserved and cannot be a product id. The file is
+        memory-mapped read-only, so API workers share its pages; changes are
+        kept in memory and written to a new file on `save()`. A legacy
+        `<path>.json` list of id strings is converted on first load.
+
+        Args:
+            path (str): File prefix for the `.bin` file (and legacy `.json`).
+        """
+        self.path = f"{path}.bin"
+        self.legacy_path = f"{path}.json"
+        if os.path.exists(self.path) and os.path.getsize(self.path) >= OBJECT_ID_BYTES:
+            rows = os.path.getsize(self.path) // OBJECT_ID_BYTES
+            self._ids = np.memmap(self.path, dtype="uint8", mode="r", shape=(rows, OBJECT_ID_BYTES))
+        elif os.path.exists(self.legacy_path):
+            with open(self.legacy_path, "r") as f:
+                self._ids = self._pack(json.load(f))
+        else:
+            self._ids = np.empty((0, OBJECT_ID_BYTES), dtype="uint8")
+        # Ids appended since the last save
+        self._new = []
+
+    @staticmethod
+    def _pack(product_ids):
+        packed = np.zeros((len(product_ids), OBJECT_ID_BYTES), dtype="uint8")
+        for i, pid in enumerate(product_ids):
+            if pid is not None:
+                packed[i] = np.frombuffer(IdMap._encode(pid), dtype="uint8")
+        return packed
+
+    @staticmethod
+    def _encode(pid):
+        try:
+            raw = bytes.fromhex(pid)
+        except (TypeError, ValueError):
+            raw = b""
+        if len(raw) != OBJECT_ID_BYTES:
+            raise ValueError(f"❌ Product id '{pid}' is not a 24-character hex ObjectId.")
+        if raw == EMPTY:
+            raise ValueError(f"❌ Product id '{pid}' is reserved for compacted ids.")
+        return raw
+
+    def __len__(self):
+        return len(self._ids) + len(self._new)
+
+    def __getitem__(self, faiss_id):
+        if faiss_id < len(self._ids):
+            raw = self._ids[faiss_id].tobytes()
+        else:
+            raw = self._new[faiss_id - len(self._ids)]
+        return None if raw == EMPTY else raw.hex()
+
+    def __setitem__(self, faiss_id, pid):
+        raw = EMPTY if pid is None else self._encode(pid)
+        if faiss_id >= len(self._ids):
+            self._new[faiss_id - len(self._ids)] = raw
+            return
+        if isinstance(self._ids, np.memmap):
+            # Copy on first write; the mapped file may be hard-linked into a published snapshot
+            self._ids = np.array(self._ids)
+        self._ids[faiss_id] = np.frombuffer(raw, dtype="uint8")
+
+    def __iter__(self):
+        for start in range(0, len(self._ids), 65536):
+            for row in np.asarray(self._ids[start:start + 65536]):
+                raw = row.tobytes()
+                yield None if raw == EMPTY else raw.hex()
+        for raw in self._new:
+            yield None if raw == EMPTY else raw.hex()
+
+    def extend(self, product_ids):
+        # Encoded before appending, so an invalid id leaves the map unchanged
+        self._new.extend([self._encode(pid) for pid in product_ids])
+
+    def save(self):
+        if self._new:
+            new = np.frombuffer(b"".join(self._new), dtype="uint8").reshape(-1, OBJECT_ID_BYTES)
+            self._ids = np.concatenate([np.asarray(self._ids), new])
+            self._new = []
+        elif isinstance(self._ids, np.memmap) and os.path.exists(self.path):
+            return
+        with atomic_write(self.path, "wb") as f:
+            f.write(np.ascontiguousarray(self._ids).tobytes())
+        rows = len(self._ids)
+        if rows:
+            self._ids = np.memmap(self.path, dtype="uint8", mode="r", shape=(rows, OBJECT_ID_BYTES))
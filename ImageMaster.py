@@ -1,38 +1,66 @@
 from transformers import BlipProcessor, BlipForConditionalGeneration
 from PIL import Image
+import io
 import torch
 import requests
+from InferenceBackends import quantize_dynamic, set_num_threads, validate_backend
+
+# Generation is autoregressive, so ONNX export does not apply; "int8" quantizes the Linear layers
+CAPTION_BACKENDS = ("torch", "int8")
 
 class BLIPCaptionGenerator:
-    def __init__(self, model_name="Salesforce/blip-image-captioning-base", device="cpu"):
+    def __init__(self, model_name="Salesforce/blip-image-captioning-base", device="cpu", backend="torch",
+                 num_threads=None):
         """
         Initialize the BLIP model and processor.
         
         Args:
             model_name (str): Hugging Face model identifier.
             device (str): Device to run the model on ('cpu' or 'cuda').
+            backend (str): "torch" or "int8" (dynamic int8 quantization, CPU only).
+            num_threads (int, optional): Intra-op threads.
         """
+        validate_backend(backend, CAPTION_BACKENDS)
+        if backend == "int8" and device != "cpu":
+            raise ValueError("❌ The int8 caption backend only runs on CPU.")
+        set_num_threads(num_threads)
         self.device = device
         self.processor = BlipProcessor.from_pretrained(model_name)
-        self.model = BlipForConditionalGeneration.from_pretrained(model_name).to(device)
+        self.model = BlipForConditionalGeneration.from_pretrained(model_name).to(device).eval()
+        if backend == "int8":
+            self.model = quantize_dynamic(self.model)
 
-    def generate_caption(self, image_path_or_url, conditional_prompt=None, max_new_tokens=100):
+    def load_image(self, image_source):
+        """
+        Load an image as RGB from a local path, a URL, raw bytes, a binary
+        file-like object (e.g. an upload stream) or a PIL image.
+        """
+        if isinstance(image_source, Image.Image):
+            return image_source.convert("RGB")
+        if isinstance(image_source, (bytes, bytearray, memoryview)):
+            return Image.open(io.BytesIO(image_source)).convert("RGB")
+        if hasattr(image_source, "read"):
+            return Image.open(image_source).convert("RGB")
+        if image_source.startswith("http") or image_source.startswith("https"):
+            return Image.open(requests.get(image_source, stream=True).raw).convert("RGB")
+        return Image.open(image_source).convert("RGB")
+
+    def generate_caption(self, image_path_or_url, conditional_prompt=None, max_new_tokens=30):
         """
         Generate a caption for an image.
 
         Args:
-            image_path_or_url (str): Local file path or image URL.
+            image_path_or_url (str | bytes | file-like | PIL.Image.Image): Local file
+                path, image URL, encoded image bytes, binary stream or decoded image.
             conditional_prompt (str, optional): Optional prompt like "a photo of".
-            max_new_tokens (int): Max tokens to generate.
+            max_new_tokens (int): Max tokens to generate. Captions used as
+                queries are short, and every extra token is another decoder pass.
 
         Returns:
             str: Generated caption.
         """
         # Load image
-        if image_path_or_url.startswith("http") or image_path_or_url.startswith("https"):
-            image = Image.open(requests.get(image_path_or_url, stream=True).raw).convert("RGB")
-        else:
-            image = Image.open(image_path_or_url).convert("RGB")
+        image = self.load_image(image_path_or_url)
 
         # Prepare inputs
         if conditional_prompt:
@@ -40,9 +68,9 @@ class BLIPCaptionGenerator:
         else:
             inputs = self.processor(image, return_tensors="pt").to(self.device)
 
-        # Generate caption
-        with torch.no_grad():
-            output_ids = self.model.generate(**inputs, max_new_tokens=max_new_tokens)
+        # Generate caption, greedily: one decoder pass per token instead of one per beam
+        with torch.inference_mode():
+            output_ids = self.model.generate(**inputs, max_new_tokens=max_new_tokens, num_beams=1, do_sample=False)
             caption = self.processor.decode(output_ids[0], skip_special_tokens=True)
 
         return caption
\ No newline at end of file
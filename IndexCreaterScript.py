@@ -1,109 +1,293 @@
+import argparse
+import itertools
+import os
+import random
+import time
 import db
+from bson import json_util
 from ImageMaster import BLIPCaptionGenerator
-from Indexer import ProductSearchIndexer
+from Indexer import ProductSearchIndexer, RerankCascade, INDEX_TYPES, STORAGE_TYPES
 from AudioMaster import AudioSearchPipeline
+from Evaluation import recall_report, print_report, cascade_report, print_cascade_report
+from ParallelBuild import parallel_build
+from ShardedIndex import ShardedIndex
+from Snapshots import SnapshotStore
+from InferenceBackends import BACKENDS
 
 
-ProductSearchIndexer = ProductSearchIndexer()
 # AudioSearchPipeline = AudioSearchPipeline()
 # BLIPCaptionGenerator = BLIPCaptionGenerator()
 
 
-def convert_doc(doc):
-    doc['id'] = str(doc['_id'])
-    del doc['_id']
-    return doc
+from tqdm import tqdm
+from TextProcessor import build_product_record
 
+# Only the fields that go into the indexed text and filter attributes are pulled from Mongo
+PROJECTION = {"title": 1, "description": 1, "bullet_points": 1, "query": 1, "category.ladder.name": 1, "price": 1}
 
-from tqdm import tqdm
-import re
-from typing import Optional
 
+class StageTimer:
+    """Accumulates wall time and document counts per pipeline stage."""
 
-class TextCleaner:
     def __init__(self):
-        # You can add custom normalization dictionaries here if needed
-        self.spec_patterns = [
-            (r"\b(\d+)[ ]?H\b", r"\1 hours"),
-            (r"\bIPX[\d]+\b", "water-resistant"),
-            (r"\bBT\b", "Bluetooth"),
-            (r"\b(\d{2})K\b", r"\1,000"),  # 30K → 30,000
-        ]
+        self.seconds = {}
+        self.docs = {}
 
-    def clean_text(self, text: Optional[str]) -> str:
-        if not text:
-            return ""
+    def record(self, stage, seconds, docs):
+        self.seconds[stage] = self.seconds.get(stage, 0.0) + seconds
+        self.docs[stage] = self.docs.get(stage, 0) + docs
 
-        # Remove HTML tags
-        text = re.sub(r"<.*?>", "", text)
+    def report(self):
+        print("\n⏱️ Build throughput per stage")
+        for stage, seconds in self.seconds.items():
+            rate = self.docs[stage] / seconds if seconds > 0 else float("inf")
+            print(f"  {stage:<8} {self.docs[stage]:>10} docs  {seconds:>9.2f}s  {rate:>10.1f} docs/s")
 
-        # Remove emojis & non-ASCII
-        text = re.sub(r"[^\x00-\x7F]+", " ", text)
 
-        # Normalize price mentions (₹1999 → "under 2000")
-        text = re.sub(r"₹[\d,]+", " ", text)
+class Checkpoint:
+    def __init__(self, path="data/checkpoint.json", field="_id"):
+        """
+        Watermark of the last document indexed, so an incremental run only
+        re-embeds documents inserted or updated since.
 
-        # Apply product spec normalization
-        for pattern, repl in self.spec_patterns:
-            text = re.sub(pattern, repl, text, flags=re.IGNORECASE)
+        Args:
+            path (str): Where the watermark is stored.
+            field (str): Monotonic document field, e.g. "_id" (new documents
+                only) or "updated_at" (new and changed documents).
+        """
+        self.path = path
+        self.field = field
+        self.value = None
+        if os.path.exists(path):
+            with open(path, "r") as f:
+                saved = json_util.loads(f.read())
+            if saved.get("field") == field:
+                self.value = saved.get("value")
+            else:
+                print(f"⚠️ Checkpoint was for '{saved.get('field')}', not '{field}'. Starting from scratch.")
 
-        # Remove special symbols
-        text = re.sub(r"[\*\•\|\~\+\=\_]", " ", text)
+    def query(self):
+        return {self.field: {"$gt": self.value}} if self.value is not None else {}
 
-        # Remove extra punctuation
-        text = re.sub(r"[.,;:!?]{2,}", ".", text)
+    def track(self, items):
+        """Pass documents through, remembering the watermark of the latest one."""
+        for item in items:
+            self.value = item.get(self.field, self.value)
+            yield item
 
-        # Replace multiple spaces with one
-        text = re.sub(r"\s+", " ", text)
+    def save(self, value=None):
+        """Persist the watermark, or `value` when the last document read is ahead of what was indexed."""
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w") as f:
+            f.write(json_util.dumps({"field": self.field, "value": self.value if value is None else value}))
+        os.replace(tmp_path, self.path)
+
+
+def iter_products(batch_size=1000, timer=None, checkpoint=None):
+    """
+    Stream projected product documents from Mongo, `batch_size` per round trip.
+    With a checkpoint, only documents past its watermark are read, in watermark order.
+    """
+    if checkpoint:
+        cursor = db.collection.find(checkpoint.query(), {**PROJECTION, checkpoint.field: 1}, batch_size=batch_size)
+        cursor = checkpoint.track(cursor.sort(checkpoint.field, 1))
+    else:
+        cursor = db.collection.find({}, PROJECTION, batch_size=batch_size)
+    while True:
+        start = time.perf_counter()
+        item = next(cursor, None)
+        if timer:
+            timer.record("fetch", time.perf_counter() - start, 1 if item is not None else 0)
+        if item is None:
+            return
+        yield item
+
+
+def iter_cleaned(items, timer=None):
+    for item in items:
+        start = time.perf_counter()
+        product = build_product_record(item)
+        if timer:
+            timer.record("clean", time.perf_counter() - start, 1)
+        if product:
+            yield product
 
-        # Lowercase and trim
-        return text.strip().lower()
-from tqdm import tqdm
 
-cleaner = TextCleaner()
+def chunked(iterable, size):
+    chunk = []
+    for element in iterable:
+        chunk.append(element)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
 
 def create_index():
-    items = list(db.collection.find())
-    id_text_list = []
-
-    print(f"🔍 Found {len(items)} items in the database.")
-    for item in tqdm(items, desc="🔧 Creating index"):
-        item = convert_doc(item)
-
-        product_id = item.get('id')
-        title = item.get('title', '')
-        description = item.get('description', '')
-        bullet_points = item.get('bullet_points', '')
-        query = item.get('query', '')
-        caption = ""
-        
-        # 🔹 Extract category names from nested ladder structure
-        category_names = []
-        try:
-            if "category" in item and isinstance(item["category"], list):
-                for cat in item["category"]:
-                    if "ladder" in cat and isinstance(cat["ladder"], list):
-                        category_names.extend(c.get("name", "") for c in cat["ladder"])
-        except Exception as e:
-            print(f"⚠️ Category parsing failed for {product_id}: {e}")
-
-        # Join all category names into one string
-        category_text = " ".join(category_names)
-
-        # 🔹 Combine all parts into a single string
-        raw_text = f"{title}. {bullet_points}. {description}. {caption}. {query}. {category_text}"
-
-        # 🔹 Clean the final text before embedding
-        cleaned_text = cleaner.clean_text(raw_text)
-
-        if product_id and cleaned_text.strip():
-            id_text_list.append((product_id, cleaned_text))
-
-    return id_text_list
+    """Return every indexable (product_id, cleaned_text) tuple. Holds the whole catalogue in memory."""
+    return [(pid, text) for pid, text, _ in iter_cleaned(iter_products())]
+
+
+def build_index(indexer, chunk_size=2048, batch_size=1000, encode_batch_size=256, workers=1,
+                checkpoint=None, checkpoint_every=50, timer=None):
+    """
+    Stream the catalogue into the index chunk by chunk.
+
+    Peak memory is bounded by `chunk_size` texts and embeddings, not by the
+    catalogue size. With `workers` > 1, cleaning and encoding run in a
+    process pool (see `ParallelBuild`). With a `checkpoint`, only documents
+    changed since the last run are read, and the index and watermark are
+    saved every `checkpoint_every` chunks so an interrupted run resumes.
+    Returns the number of products indexed; per-stage times accumulate in
+    `timer` if one is passed.
+    """
+    timer = timer or StageTimer()
+    total = db.collection.estimated_document_count()
+    print(f"🔍 Found about {total} items in the database.")
+
+    indexed = 0
+    with tqdm(total=total, desc="🔧 Creating index") as progress:
+        if workers > 1:
+            indexed = parallel_build(indexer, iter_products(batch_size, timer, checkpoint), workers, chunk_size=chunk_size,
+                                     encode_batch_size=encode_batch_size, timer=timer, progress=progress,
+                                     checkpoint=checkpoint, checkpoint_every=checkpoint_every)
+        else:
+            products = iter_cleaned(iter_products(batch_size, timer, checkpoint), timer)
+            for chunk_number, chunk in enumerate(chunked(products, chunk_size), start=1):
+                product_ids = [pid for pid, _, _ in chunk]
+                product_texts = [text for _, text, _ in chunk]
+                product_attributes = [attributes for _, _, attributes in chunk]
+
+                start = time.perf_counter()
+                embeddings = indexer.encode_products(product_texts, batch_size=encode_batch_size)
+                timer.record("encode", time.perf_counter() - start, len(chunk))
+
+                start = time.perf_counter()
+                indexer.add_embeddings(product_ids, product_texts, embeddings, save=False,
+                                       product_attributes=product_attributes)
+                timer.record("add", time.perf_counter() - start, len(chunk))
+
+                indexed += len(chunk)
+                progress.update(len(chunk))
+
+                if checkpoint and chunk_number % checkpoint_every == 0:
+                    indexer.save()
+                    checkpoint.save()
+
+    start = time.perf_counter()
+    indexer.save()
+    timer.record("save", time.perf_counter() - start, indexed)
+    if checkpoint:
+        checkpoint.save()
+    timer.report()
+    if indexer.embedding_cache is not None:
+        stats = indexer.embedding_cache.stats()
+        print(f"🗃️ Embedding cache: {stats['hits']} hits, {stats['misses']} misses "
+              f"({stats['hit_rate']:.1%} reused), {stats['size']} entries.")
+    return indexed
+
+
+def prune_deleted(indexer, batch_size=10000):
+    """Delete indexed products whose documents no longer exist in Mongo."""
+    live_ids = {str(item["_id"]) for item in db.collection.find({}, {"_id": 1}, batch_size=batch_size)}
+    removed = [pid for pid in indexer.pid_to_id if pid not in live_ids]
+    return indexer.delete(removed, save=False)
+
+
+def report_index_memory(indexer):
+    """Compare the saved index with the space its vectors take at full precision."""
+    if indexer.index.ntotal == 0:
+        return
+    if isinstance(indexer.index, ShardedIndex):
+        index_mb = indexer.index.size_bytes() / 2 ** 20
+    elif os.path.exists(indexer.index_path):
+        index_mb = os.path.getsize(indexer.index_path) / 2 ** 20
+    else:
+        return
+    float32_mb = indexer.index.ntotal * indexer.dimension * 4 / 2 ** 20
+    print(f"💾 {indexer.meta['index_type']}/{indexer.meta['storage']} index: {index_mb:.1f} MB "
+          f"vs. {float32_mb:.1f} MB of float32 vectors ({1 - index_mb / float32_mb:.0%} saved). "
+          "Run with --recall-report N for the recall cost.")
+
+
+def run_recall_report(indexer, sample_size, k=10):
+    """Use product text prefixes as pseudo-queries and compare index types against flat search."""
+    texts = [text for _, text, _ in itertools.islice(iter_cleaned(iter_products()), sample_size)]
+    queries = [" ".join(text.split()[:8]) for text in random.sample(texts, min(1000, len(texts)))]
+    embeddings = indexer.encode_products(texts)
+    query_vecs = indexer.query_model.encode(queries, normalize_embeddings=True).astype('float32')
+    print_report(recall_report(embeddings, query_vecs, k=k, dimension=indexer.dimension), k=k)
+
+
+def run_cascade_report(indexer, sample_size, k=10):
+    """Use product text prefixes as pseudo-queries and compare cascade reranking against full reranking."""
+    texts = [text for _, text, _ in itertools.islice(iter_cleaned(iter_products()), max(sample_size, 1000))]
+    queries = [" ".join(text.split()[:8]) for text in random.sample(texts, min(sample_size, len(texts)))]
+    print_cascade_report(cascade_report(indexer, queries, RerankCascade(), k=k), k=k)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Build the product search index from MongoDB.")
+    parser.add_argument("--index-type", choices=INDEX_TYPES, default=None,
+                        help="FAISS backend for a new index (default: flat)")
+    parser.add_argument("--nlist", type=int, default=1024, help="IVF cluster count")
+    parser.add_argument("--pq-m", type=int, default=48, help="IVF-PQ sub-quantizers")
+    parser.add_argument("--hnsw-m", type=int, default=32, help="HNSW neighbours per node")
+    parser.add_argument("--storage", choices=STORAGE_TYPES, default=None,
+                        help="Vector encoding for a new index (default: float32)")
+    parser.add_argument("--snapshot-dir", default="data/snapshots",
+                        help="Where finished builds are published as versioned snapshots for the API")
+    parser.add_argument("--no-publish", action="store_true",
+                        help="Save the working index without publishing a snapshot")
+    parser.add_argument("--shards", type=int, default=None,
+                        help="Partition a new index into N shards searched in parallel (default: 1)")
+    parser.add_argument("--encoder-backend", choices=BACKENDS, default="torch",
+                        help="Inference backend of the product encoder; embeddings are cached per backend")
+    parser.add_argument("--chunk-size", type=int, default=2048,
+                        help="Products cleaned, encoded and added per chunk (bounds peak memory)")
+    parser.add_argument("--batch-size", type=int, default=1000, help="Mongo cursor batch size")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="Processes for category flattening, cleaning and encoding")
+    parser.add_argument("--encode-batch-size", type=int, default=256, help="Encoder batch size")
+    parser.add_argument("--incremental", action="store_true",
+                        help="Only index documents past the last run's watermark")
+    parser.add_argument("--watermark-field", default="_id",
+                        help="Monotonic field for --incremental, e.g. _id or updated_at")
+    parser.add_argument("--checkpoint-every", type=int, default=50,
+                        help="Save the index and watermark every N chunks during --incremental runs")
+    parser.add_argument("--no-embedding-cache", action="store_true",
+                        help="Re-encode every product instead of reusing cached embeddings")
+    parser.add_argument("--prune", action="store_true",
+                        help="Delete indexed products that were removed from MongoDB")
+    parser.add_argument("--recall-report", type=int, default=0, metavar="N",
+                        help="After indexing, report recall@10 vs. latency on the first N products")
+    parser.add_argument("--cascade-report", type=int, default=0, metavar="N",
+                        help="After indexing, report NDCG@10 and latency of cascade vs. full reranking on N queries")
+    return parser.parse_args()
+
 
 if __name__ == "__main__":
-    id_text_list = create_index()
-    print(len(id_text_list))
-    print(id_text_list[:2])
-    ProductSearchIndexer.append(id_text_list)
-    print(f"✅ Indexed {len(id_text_list)} products.")
\ No newline at end of file
+    args = parse_args()
+    db.ping()
+    ProductSearchIndexer = ProductSearchIndexer(index_type=args.index_type, nlist=args.nlist,
+                                                pq_m=args.pq_m, hnsw_m=args.hnsw_m, storage=args.storage,
+                                                num_shards=args.shards,
+                                                backends={"product": args.encoder_backend},
+                                                use_embedding_cache=not args.no_embedding_cache)
+    indexed = build_index(ProductSearchIndexer, chunk_size=args.chunk_size, batch_size=args.batch_size,
+                          encode_batch_size=args.encode_batch_size, workers=args.workers,
+                          checkpoint=Checkpoint(field=args.watermark_field) if args.incremental else None,
+                          checkpoint_every=args.checkpoint_every)
+    if args.prune:
+        prune_deleted(ProductSearchIndexer)
+        ProductSearchIndexer.save()
+    print(f"✅ Indexed {indexed} products. Total in index: {ProductSearchIndexer.get_index_size()}")
+    report_index_memory(ProductSearchIndexer)
+    if not args.no_publish:
+        ProductSearchIndexer.publish(SnapshotStore(args.snapshot_dir), save=False)
+    if args.recall_report:
+        run_recall_report(ProductSearchIndexer, args.recall_report)
+    if args.cascade_report:
+        run_cascade_report(ProductSearchIndexer, args.cascade_report)
\ No newline at end of file
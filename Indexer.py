@@ -3,65 +3,550 @@ import faiss
 import numpy as np
 import os
 import json
+import time
+from functools import cached_property
+from DocStore import DocumentStore
+from EmbeddingCache import EmbeddingCache
+from AttributeStore import AttributeStore
+from LexicalIndex import LexicalIndex
+from VectorStore import VectorStore
+from ShardedIndex import ShardedIndex, apply_search_params, selection_params, search_selected, supports_selection
+from Snapshots import atomic_write
+from IdMap import IdMap
+from InferenceBackends import load_text_model, validate_backend
+from Metrics import span
+
+
+INDEX_TYPES = ("flat", "hnsw", "ivf_flat", "ivf_pq")
+
+# How vectors are encoded inside the index: full precision, scalar-quantized or product-quantized
+STORAGE_TYPES = ("float32", "fp16", "int8", "pq")
+STORAGE_CODECS = {"float32": "Flat", "fp16": "SQfp16", "int8": "SQ8"}
+
+# Tombstoned vectors are physically removed once they exceed this share of the index
+COMPACTION_RATIO = 0.2
+
+# FAISS warns below 39 training points per centroid; streaming builds buffer this many before training
+TRAINING_POINTS_PER_CENTROID = 39
+
+# Reciprocal-rank fusion constant; larger values flatten the advantage of top ranks
+RRF_K = 60
+
+# Snapshot files the indexer appends to in place; snapshots copy them instead of hard-linking
+APPEND_ONLY_FILES = ("docstore.bin", "docstore.idx", "vectors.vecs")
+
+
+def build_faiss_index(index_type="flat", dimension=384, nlist=1024, pq_m=48, pq_nbits=8, hnsw_m=32,
+                      storage="float32"):
+    """
+    Create an empty inner-product FAISS index.
+
+    Args:
+        index_type (str): One of "flat", "hnsw", "ivf_flat" or "ivf_pq".
+        dimension (int): Embedding dimension.
+        nlist (int): Number of IVF clusters (IVF types only).
+        pq_m (int): Number of PQ sub-quantizers, must divide `dimension` (PQ only).
+        pq_nbits (int): Bits per PQ code (PQ only).
+        hnsw_m (int): Neighbours per HNSW node (HNSW only).
+        storage (str): Vector encoding, one of "float32", "fp16", "int8"
+            (scalar-quantized, 2x and 4x smaller) or "pq" (pq_m * pq_nbits
+            bits per vector). "ivf_pq" always stores PQ codes.
+
+    Returns:
+        faiss.Index
+    """
+    if storage not in STORAGE_TYPES:
+        raise ValueError(f"❌ Unknown storage '{storage}'. Expected one of {STORAGE_TYPES}.")
+    codec = STORAGE_CODECS.get(storage, f"PQ{pq_m}x{pq_nbits}")
+    if index_type == "flat":
+        description = codec
+    elif index_type == "hnsw":
+        description = f"HNSW{hnsw_m},Flat" if storage == "float32" else f"HNSW{hnsw_m}_{codec}"
+    elif index_type == "ivf_flat":
+        description = f"IVF{nlist},{codec}"
+    elif index_type == "ivf_pq":
+        description = f"IVF{nlist},PQ{pq_m}x{pq_nbits}"
+    else:
+        raise ValueError(f"❌ Unknown index type '{index_type}'. Expected one of {INDEX_TYPES}.")
+    return faiss.index_factory(dimension, description, faiss.METRIC_INNER_PRODUCT)
+
+
+def set_search_params(index, nprobe=None, ef_search=None):
+    """
+    Apply search-time knobs to an index. Knobs that do not apply to the
+    index type (e.g. `nprobe` on HNSW) are ignored.
+    """
+    if isinstance(index, ShardedIndex):
+        index.set_search_params(nprobe, ef_search)
+    else:
+        apply_search_params(index, nprobe, ef_search)
+
+
+def reciprocal_rank_fusion(rankings, top_k, k=RRF_K):
+    """Fuse ranked lists of (id, score) by summing 1 / (k + rank) per id. Returns the top_k (id, fused score)."""
+    fused = {}
+    for ranking in rankings:
+        for rank, (idx, _) in enumerate(ranking, start=1):
+            fused[idx] = fused.get(idx, 0.0) + 1.0 / (k + rank)
+    return sorted(fused.items(), key=lambda x: x[1], reverse=True)[:top_k]
+
+
+def min_training_size(index_type, nlist=1024, pq_nbits=8, storage="float32"):
+    """Number of vectors needed before an index of this type can be trained."""
+    required = nlist if index_type in ("ivf_flat", "ivf_pq") else 0
+    if index_type == "ivf_pq" or storage == "pq":
+        return max(required, 2 ** pq_nbits)
+    if storage in ("int8", "fp16"):
+        # Scalar quantizers learn per-dimension ranges
+        return max(required, 1)
+    return required
+
+
+class RerankCascade:
+    def __init__(self, skip_margin=0.15, depth_window=0.2, min_depth=5, max_depth=20,
+                 time_budget_ms=None, max_tokens=128, chunk_size=8):
+        """
+        Cheaper cross-encoder reranking, guided by the bi-encoder scores.
+
+        Args:
+            skip_margin (float): Skip reranking a query whose top FAISS score
+                beats the runner-up by at least this much.
+            depth_window (float): Rerank the candidates scoring within this
+                much of the top FAISS score, clamped to `min_depth`..`max_depth`.
+            min_depth (int): Fewest candidates reranked when reranking at all.
+            max_depth (int): Most candidates reranked per query.
+            time_budget_ms (float, optional): Stop reranking once this much time
+                is spent; candidates not scored keep their FAISS order.
+            max_tokens (int): Candidate texts are cut to this many words.
+            chunk_size (int): Rank positions scored per cross-encoder call when
+                a time budget is set.
+        """
+        self.skip_margin = skip_margin
+        self.depth_window = depth_window
+        self.min_depth = min_depth
+        self.max_depth = max_depth
+        self.time_budget_ms = time_budget_ms
+        self.max_tokens = max_tokens
+        self.chunk_size = chunk_size
+
+    def depth(self, scores):
+        """Number of leading candidates worth reranking, given FAISS scores in rank order."""
+        if len(scores) < 2 or scores[0] - scores[1] >= self.skip_margin:
+            return 0
+        within = sum(1 for score in scores if score >= scores[0] - self.depth_window)
+        return min(len(scores), self.max_depth, max(self.min_depth, within))
+
+    def truncate(self, text):
+        return " ".join(text.split(maxsplit=self.max_tokens)[:self.max_tokens])
 
 
 class ProductSearchIndexer:
     def __init__(self, index_path="data/index.faiss", id_map_path="data/id_map.json",
                  product_model_name='all-MiniLM-L6-v2',
                  query_model_name='multi-qa-MiniLM-L6-cos-v1',
-                 reranker_model_name='cross-encoder/ms-marco-MiniLM-L-6-v2'):
+                 reranker_model_name='cross-encoder/ms-marco-MiniLM-L-6-v2',
+                 index_type=None, nlist=1024, pq_m=48, pq_nbits=8, hnsw_m=32,
+                 nprobe=16, ef_search=64, docstore_path=None, compaction_ratio=COMPACTION_RATIO,
+                 embedding_cache_path=None, use_embedding_cache=True, cascade=None, hybrid=True, rrf_k=RRF_K,
+                 storage=None, refine_factor=0, num_shards=None, shard_workers=None, models=None,
+                 backends=None, num_threads=None, read_only=False):
+        """
+        Args:
+            index_type (str, optional): FAISS backend for a new index, one of
+                "flat", "hnsw", "ivf_flat" or "ivf_pq". Defaults to the type
+                recorded next to an existing index, else "flat".
+            nlist, pq_m, pq_nbits, hnsw_m: Build parameters, see `build_faiss_index`.
+            storage (str, optional): Vector encoding for a new index, one of
+                "float32", "fp16", "int8" or "pq". Defaults to the encoding
+                recorded next to an existing index, else "float32".
+            refine_factor (int): With quantized storage, fetch this many times
+                top_k candidates and re-score them against full-precision
+                vectors kept on disk. 0 or 1 disables refinement.
+            num_shards (int, optional): Partition a new index into this many
+                shards under `shards/`, searched in parallel by worker processes.
+                Defaults to the layout of an existing index, else one index file.
+            shard_workers (int, optional): Search processes for a sharded index.
+                Defaults to one per shard.
+            models (Tuple, optional): Already loaded (product_model, query_model,
+                reranker), e.g. from the indexer a reloaded snapshot replaces.
+            backends (Dict[str, str], optional): Inference backend by model
+                ("product", "query", "reranker"), see `InferenceBackends.BACKENDS`.
+                Unlisted models run on "torch".
+            num_threads (int, optional): Intra-op threads for model inference.
+            nprobe (int): IVF lists probed per query.
+            ef_search (int): HNSW candidate list size per query.
+            docstore_path (str, optional): File prefix of the on-disk reranker text
+                store. Defaults to `docstore` next to the index.
+            compaction_ratio (float): Share of tombstoned vectors that triggers a
+                compaction on `save()`.
+            embedding_cache_path (str, optional): File prefix of the product
+                embedding cache. Defaults to `embedding_cache` next to the index.
+            use_embedding_cache (bool): Reuse embeddings of unchanged product texts.
+            cascade (RerankCascade, optional): Adaptive reranking depth. None
+                reranks every candidate.
+            hybrid (bool): Fuse BM25 matches from the lexical index with the
+                FAISS results before reranking.
+            rrf_k (int): Reciprocal-rank fusion constant.
+            read_only (bool): Nothing is written back to the index files, as
+                for a published snapshot. A lexical index that lags behind
+                is then backfilled in memory only.
+        """
         self.index_path = index_path
         self.id_map_path = id_map_path
+        self.meta_path = os.path.join(os.path.dirname(index_path), "index_meta.json")
+        self.docstore_path = docstore_path or os.path.join(os.path.dirname(index_path), "docstore")
+        self.tombstones_path = os.path.join(os.path.dirname(index_path), "tombstones.json")
+        self.shards_dir = os.path.join(os.path.dirname(index_path), "shards")
+        self.shard_workers = shard_workers
+        self.compaction_ratio = compaction_ratio
         self.product_model_name = product_model_name
         self.query_model_name = query_model_name
         self.reranker_model_name = reranker_model_name
+        self.backends = {"product": "torch", "query": "torch", "reranker": "torch", **(backends or {})}
+        for backend in self.backends.values():
+            validate_backend(backend)
+        self.num_threads = num_threads
         self.dimension = 384
+        self.nprobe = nprobe
+        self.ef_search = ef_search
+        self.cascade = cascade
+        self.refine_factor = refine_factor
+        self.read_only = read_only
+
+        # Index build parameters, overridden by what an existing index was built with
+        self.meta = {"index_type": index_type or "flat", "nlist": nlist, "pq_m": pq_m,
+                     "pq_nbits": pq_nbits, "hnsw_m": hnsw_m, "storage": storage or "float32",
+                     "num_shards": num_shards or 1}
+        index_exists = os.path.exists(self.index_path) or ShardedIndex.exists(self.shards_dir)
+        if os.path.exists(self.meta_path):
+            with open(self.meta_path, "r") as f:
+                saved_meta = json.load(f)
+            if index_type and saved_meta.get("index_type") != index_type and index_exists:
+                print(f"⚠️ Requested index type '{index_type}' but existing index is "
+                      f"'{saved_meta.get('index_type')}'. Using the existing index.")
+            if storage and saved_meta.get("storage", "float32") != storage and index_exists:
+                print(f"⚠️ Requested storage '{storage}' but existing index stores "
+                      f"'{saved_meta.get('storage', 'float32')}'. Using the existing index.")
+            if num_shards and saved_meta.get("num_shards", 1) != num_shards and index_exists:
+                print(f"⚠️ Requested {num_shards} shards but existing index has "
+                      f"{saved_meta.get('num_shards', 1)}. Using the existing index.")
+            if index_exists:
+                self.meta.update(saved_meta)
+                # Indexes built before storage modes and sharding are one full-precision file
+                self.meta.setdefault("storage", "float32")
+                self.meta.setdefault("num_shards", 1)
 
         # Load models
-        self.product_model = SentenceTransformer(self.product_model_name)
-        self.query_model = SentenceTransformer(self.query_model_name)
-        self.reranker = CrossEncoder(self.reranker_model_name)
+        if models is not None:
+            self.product_model, self.query_model, self.reranker = models
+        else:
+            self.product_model = load_text_model(SentenceTransformer, self.product_model_name,
+                                                 self.backends["product"], num_threads=num_threads)
+            self.query_model = load_text_model(SentenceTransformer, self.query_model_name,
+                                               self.backends["query"], num_threads=num_threads)
+            self.reranker = load_text_model(CrossEncoder, self.reranker_model_name,
+                                            self.backends["reranker"], num_threads=num_threads)
 
         # Load or initialize FAISS index
-        if os.path.exists(self.index_path):
+        if self.meta["num_shards"] > 1 and ShardedIndex.exists(self.shards_dir):
+            self.index = ShardedIndex(self.shards_dir, self.meta["num_shards"], self._new_shard,
+                                      workers=self.shard_workers)
+            print(f"✅ Loaded {self.meta['index_type']} FAISS index in {self.meta['num_shards']} shards "
+                  f"with {self.index.ntotal} vectors.")
+        elif os.path.exists(self.index_path):
             self.index = faiss.read_index(self.index_path)
-            print(f"✅ Loaded FAISS index with {self.index.ntotal} vectors.")
+            print(f"✅ Loaded {self.meta['index_type']} FAISS index with {self.index.ntotal} vectors.")
         else:
-            self.index = faiss.IndexFlatIP(self.dimension)
-            print("⚠️ Created new FAISS index.")
+            self.index = self._new_index()
+            print(f"⚠️ Created new {self.meta['index_type']} FAISS index.")
+        set_search_params(self.index, nprobe=self.nprobe, ef_search=self.ef_search)
+        # Indexes built before stable ids address vectors by row and cannot remove them
+        self.stable_ids = isinstance(self.index, (faiss.IndexIDMap, ShardedIndex))
+        if not self.stable_ids:
+            print("⚠️ Index predates stable ids; rebuild it to enable upsert() and delete().")
+
+        # Encoded chunks waiting for enough vectors to train an IVF/PQ index
+        self._pending = []
 
-        # Load or initialize ID map
-        if os.path.exists(self.id_map_path):
-            with open(self.id_map_path, "r") as f:
-                self.id_map = json.load(f)
+        # Load or initialize ID map: FAISS id → product id, None once compacted away
+        self.id_map = IdMap(os.path.splitext(self.id_map_path)[0])
+
+        # Ids whose vectors are still in the index but superseded or deleted
+        if os.path.exists(self.tombstones_path):
+            with open(self.tombstones_path, "r") as f:
+                self.tombstones = set(json.load(f))
         else:
-            self.id_map = []
+            self.tombstones = set()
+
+        # Cached search parameters (and lexical mask) excluding the tombstones, rebuilt when they change
+        self._params = None
+        self._live = None
+
+        # Product embeddings by hash of model name + cleaned text, so unchanged products skip the encoder
+        self.embedding_cache = None
+        if use_embedding_cache:
+            self.embedding_cache = EmbeddingCache(
+                embedding_cache_path or os.path.join(os.path.dirname(index_path), "embedding_cache"),
+                model_name=self.product_model_key, dimension=self.dimension)
+
+        # Product text by FAISS id (for reranking), read from disk on demand
+        self.docstore = DocumentStore(self.docstore_path)
+        # Texts past the end of the id map are never read; missing ones cannot be reranked
+        if len(self.docstore) < len(self.id_map):
+            print(f"⚠️ Docstore has {len(self.docstore)} texts for {len(self.id_map)} indexed products. "
+                  "Rebuild the index to rerank with full product text.")
+
+        # Filterable price and category columns by FAISS id
+        self.attributes = AttributeStore(os.path.join(os.path.dirname(index_path), "attributes"))
+        self.attributes.pad_to(len(self.id_map))
+
+        # BM25 inverted index over the same cleaned texts, persisted next to the FAISS index
+        self.rrf_k = rrf_k
+        self.lexical = None
+        if hybrid:
+            self.lexical = LexicalIndex(os.path.join(os.path.dirname(index_path), "lexical"))
+            if len(self.lexical) < len(self.id_map):
+                self._backfill_lexical()
+
+        # Full-precision vectors for refining quantized shortlists, memory-mapped from disk
+        self.vectors = None
+        if self.meta["storage"] != "float32":
+            self.vectors = VectorStore(os.path.join(os.path.dirname(index_path), "vectors"), self.dimension)
+            if len(self.vectors) < len(self.id_map):
+                print(f"⚠️ Vector store has {len(self.vectors)} vectors for {len(self.id_map)} indexed products. "
+                      "Rebuild the index to refine quantized results.")
+
+    def _backfill_lexical(self, batch_size=10000):
+        """Index products added before the lexical index existed, reading their text from the docstore."""
+        start, end = len(self.lexical), len(self.id_map)
+        print(f"🔤 Building lexical index for {end - start} indexed products...")
+        for first in range(start, end, batch_size):
+            self.lexical.append(self.docstore.get(range(first, min(first + batch_size, end))))
+        self.lexical.remove([i for i in range(start, end) if self.id_map[i] is None])
+        if not self.read_only:
+            self.lexical.save()
+
+    def _new_index(self):
+        if self.meta["num_shards"] > 1:
+            return ShardedIndex(self.shards_dir, self.meta["num_shards"], self._new_shard,
+                                workers=self.shard_workers, fresh=True)
+        return self._new_shard()
 
-        # Internal dictionary to track product_id → full text (for reranking)
-        self.product_id_to_text = {}
+    def _new_shard(self):
+        base = build_faiss_index(self.meta["index_type"], self.dimension, self.meta["nlist"],
+                                 self.meta["pq_m"], self.meta["pq_nbits"], self.meta["hnsw_m"],
+                                 self.meta["storage"])
+        return faiss.IndexIDMap2(base)
 
-    def append(self, product_tuples):
+    def append(self, product_tuples, save=True, batch_size=256):
+        """
+        Encode and index (product_id, text) or (product_id, text, attributes)
+        tuples. A product that is already indexed is replaced, so this is an upsert.
+
+        Args:
+            product_tuples (List[Tuple]): Products to add. Attributes are
+                {"price": float | None, "categories": List[str]}.
+            save (bool): Persist the index after adding. Streaming builds pass
+                False for every chunk and call `save()` once at the end.
+            batch_size (int): Encoder batch size.
+        """
         if not product_tuples:
             print("⚠️ No products to append.")
             return
 
-        product_texts = [text for _, text in product_tuples]
-        product_ids = [pid for pid, _ in product_tuples]
+        product_ids = [product[0] for product in product_tuples]
+        product_texts = [product[1] for product in product_tuples]
+        product_attributes = [product[2] if len(product) > 2 else None for product in product_tuples]
 
-        # Store product text for reranker use
-        for pid, text in product_tuples:
-            self.product_id_to_text[pid] = text
+        embeddings = self.encode_products(product_texts, batch_size=batch_size)
+        self.add_embeddings(product_ids, product_texts, embeddings, save=save, product_attributes=product_attributes)
+
+    def encode_products(self, product_texts, batch_size=256):
+        """Encode product texts, reusing cached embeddings for texts seen before."""
+        if self.embedding_cache is None:
+            return self.product_model.encode(product_texts, batch_size=batch_size,
+                                             normalize_embeddings=True).astype('float32')
+
+        keys = self.embedding_cache.make_keys(product_texts)
+        embeddings, hit = self.embedding_cache.get(keys)
+        missing = np.flatnonzero(~hit)
+        if len(missing):
+            encoded = self.product_model.encode([product_texts[i] for i in missing], batch_size=batch_size,
+                                                normalize_embeddings=True).astype('float32')
+            embeddings[missing] = encoded
+            self.embedding_cache.put(keys[missing], encoded)
+        return embeddings
+
+    def add_embeddings(self, product_ids, product_texts, embeddings, save=True, product_attributes=None):
+        """
+        Add already-encoded products to the index.
+
+        An untrained IVF/PQ index buffers chunks until it has enough vectors
+        to train on, then trains and adds everything buffered.
+        """
+        product_attributes = list(product_attributes) if product_attributes else [None] * len(product_ids)
+        if self.index.is_trained:
+            self._add(product_ids, product_texts, embeddings, product_attributes)
+        else:
+            self._pending.append((list(product_ids), list(product_texts), embeddings, product_attributes))
+            self._flush_pending(force=save)
+
+        if save:
+            self.save()
+            print(f"✅ Appended {len(product_ids)} products. Total in index: {self.index.ntotal}")
 
-        embeddings = self.product_model.encode(product_texts, normalize_embeddings=True).astype('float32')
-        self.index.add(embeddings)
+    def upsert(self, product_tuples, save=True, batch_size=256):
+        """Insert or replace (product_id, text) tuples."""
+        self.append(product_tuples, save=save, batch_size=batch_size)
+
+    def delete(self, product_ids, save=True):
+        """
+        Remove products from search results. Their vectors are tombstoned and
+        physically dropped by the next compaction.
+
+        Returns:
+            int: Number of products that were indexed and are now deleted.
+        """
+        self._require_stable_ids()
+        deleted = 0
+        for pid in product_ids:
+            faiss_id = self.pid_to_id.pop(pid, None)
+            if faiss_id is not None:
+                self._tombstone(faiss_id)
+                deleted += 1
+        if save and deleted:
+            self.save()
+        print(f"🗑️ Deleted {deleted} products. Pending tombstones: {len(self.tombstones)}")
+        return deleted
+
+    def _tombstone(self, faiss_id):
+        self.tombstones.add(faiss_id)
+        self._params = None
+        self._live = None
+
+    def _require_stable_ids(self):
+        if not self.stable_ids:
+            raise ValueError("❌ This index predates stable ids. Rebuild it to upsert or delete products.")
+
+    def _add(self, product_ids, product_texts, embeddings, product_attributes):
+        # Ids are assigned sequentially, so a FAISS id is also the product's docstore row
+        start = len(self.id_map)
+        faiss_ids = np.arange(start, start + len(product_ids), dtype='int64')
+        if not self.stable_ids and any(pid in self.pid_to_id for pid in product_ids):
+            self._require_stable_ids()
+        for faiss_id, pid in zip(faiss_ids, product_ids):
+            previous = self.pid_to_id.get(pid)
+            if previous is not None:
+                self._tombstone(previous)
+            self.pid_to_id[pid] = int(faiss_id)
+
+        if self.stable_ids:
+            self.index.add_with_ids(embeddings, faiss_ids)
+        else:
+            self.index.add(embeddings)
         self.id_map.extend(product_ids)
+        # Store product text for reranker use
+        self.docstore.append(product_texts)
+        self.attributes.append(product_attributes)
+        if self.lexical is not None:
+            self.lexical.append(product_texts)
+        if self.vectors is not None:
+            self.vectors.append(embeddings)
 
+    def compact(self):
+        """
+        Physically remove tombstoned vectors. Index types that cannot remove
+        ids in place (HNSW) are rebuilt from the live vectors.
+        """
+        self._require_stable_ids()
+        if not self.tombstones:
+            return
+        dead = np.fromiter(self.tombstones, dtype='int64', count=len(self.tombstones))
+        try:
+            self.index.remove_ids(faiss.IDSelectorBatch(dead))
+        except RuntimeError:
+            live = np.fromiter(sorted(self.pid_to_id.values()), dtype='int64', count=len(self.pid_to_id))
+            # Quantized indexes only reconstruct approximations; rebuild from full precision when kept
+            if not len(live):
+                vectors = np.empty((0, self.dimension), 'float32')
+            elif self.vectors is not None and len(self.vectors) >= len(self.id_map):
+                vectors = self.vectors.get(live)
+            else:
+                vectors = self.index.reconstruct_batch(live)
+            index = self._new_index()
+            if len(live):
+                if not index.is_trained:
+                    index.train(vectors)
+                index.add_with_ids(vectors, live)
+            set_search_params(index, nprobe=self.nprobe, ef_search=self.ef_search)
+            if isinstance(self.index, ShardedIndex):
+                self.index.close()
+            self.index = index
+        for faiss_id in dead:
+            self.id_map[faiss_id] = None
+        if self.lexical is not None:
+            self.lexical.remove(dead)
+        print(f"🧹 Compacted {len(dead)} tombstoned vectors. Total in index: {self.index.ntotal}")
+        self.tombstones = set()
+        self._params = None
+        self._live = None
+
+    def _flush_pending(self, force=False):
+        """Train on the buffered chunks once there are enough of them (or when forced) and add them."""
+        pending_count = sum(len(pending[0]) for pending in self._pending)
+        required = min_training_size(self.meta["index_type"], self.meta["nlist"], self.meta["pq_nbits"],
+                                     self.meta["storage"])
+        if not self._pending or (pending_count < required * TRAINING_POINTS_PER_CENTROID and not force):
+            return
+        product_ids = [pid for ids, _, _, _ in self._pending for pid in ids]
+        product_texts = [text for _, texts, _, _ in self._pending for text in texts]
+        embeddings = np.vstack([emb for _, _, emb, _ in self._pending])
+        product_attributes = [attrs for _, _, _, attributes in self._pending for attrs in attributes]
+        self._pending = []
+        self._train_if_needed(embeddings)
+        self._add(product_ids, product_texts, embeddings, product_attributes)
+
+    def save(self):
+        """Persist the index, id map and metadata, training on any buffered vectors first."""
+        if self.read_only:
+            raise ValueError("❌ This index was opened read-only (e.g. a published snapshot) and cannot be saved.")
+        self._flush_pending(force=True)
+        if self.tombstones and len(self.tombstones) > self.compaction_ratio * max(self.index.ntotal, 1):
+            self.compact()
         self._save_index()
         self._save_id_map()
+        self._save_meta()
+        self._save_tombstones()
+        self.attributes.save()
+        if self.lexical is not None:
+            self.lexical.save()
+        if self.embedding_cache is not None:
+            self.embedding_cache.flush()
 
-        print(f"✅ Appended {len(product_tuples)} products. Total in index: {self.index.ntotal}")
+    def _train_if_needed(self, embeddings):
+        """IVF and PQ indexes learn their centroids/codebooks from the first batch they see."""
+        if self.index.is_trained:
+            return
+        required = min_training_size(self.meta["index_type"], self.meta["nlist"], self.meta["pq_nbits"],
+                                     self.meta["storage"])
+        if len(embeddings) < required:
+            raise ValueError(f"❌ {self.meta['index_type']} index needs at least {required} vectors "
+                             f"to train, got {len(embeddings)}.")
+        print(f"🏋️ Training {self.meta['index_type']} index on {len(embeddings)} vectors...")
+        self.index.train(embeddings)
+        set_search_params(self.index, nprobe=self.nprobe, ef_search=self.ef_search)
+
+    def set_search_params(self, nprobe=None, ef_search=None):
+        """Tune recall vs. latency at search time without rebuilding the index."""
+        if nprobe is not None:
+            self.nprobe = nprobe
+        if ef_search is not None:
+            self.ef_search = ef_search
+        set_search_params(self.index, nprobe=self.nprobe, ef_search=self.ef_search)
+        # Cached selection parameters carry the previous nprobe / efSearch
+        self._params = None
 
-    def search(self, query, top_k=20, return_scores=False, rerank=True):
+    def search(self, query, top_k=20, return_scores=False, rerank=True, filters=None, cascade=None):
         """
         Search and optionally rerank results using a cross-encoder.
 
@@ -70,50 +555,260 @@ class ProductSearchIndexer:
             top_k (int): Number of results to return.
             return_scores (bool): Whether to return similarity scores.
             rerank (bool): Whether to rerank with cross-encoder.
+            filters (Dict, optional): `price_max` and/or `category`, applied
+                inside the FAISS scan. See `AttributeStore.eligible`.
+            cascade (RerankCascade | bool, optional): Overrides the indexer's
+                cascade for this call; False reranks every candidate.
 
         Returns:
             List[str] or List[Tuple[str, float]]
         """
+        return self.search_many([query], top_k=top_k, return_scores=return_scores, rerank=rerank,
+                                filters=filters, cascade=cascade)[0]
+
+    def search_many(self, queries, top_k=20, return_scores=False, rerank=True, batch_size=256, filters=None,
+                    cascade=None, timings=None):
+        """
+        Search several queries at once. Encoding, the FAISS lookup and
+        cross-encoder scoring each run as one batched call per `batch_size`
+        distinct queries; repeated queries are only searched once. `filters`
+        is one dict applied to every query, or a list with one dict (or None)
+        per query: queries with different filters still share encoding and
+        reranking, and only the FAISS and BM25 lookups run once per distinct
+        filter. If given, `timings` collects the milliseconds spent in each
+        stage of the call.
+
+        Returns:
+            List of per-query results, in the same form as `search`.
+        """
+        if not queries:
+            return []
         if self.index.ntotal == 0:
             print("⚠️ Index is empty. Add products before searching.")
-            return []
+            return [[] for _ in queries]
 
-        # Step 1: FAISS search
-        query_vec = self.query_model.encode([query], normalize_embeddings=True).astype('float32')
-        D, I = self.index.search(query_vec, top_k)
+        if filters is None or isinstance(filters, dict):
+            filters = [filters] * len(queries)
+        keys = [tuple(sorted((key, value) for key, value in (query_filters or {}).items() if value is not None))
+                for query_filters in filters]
+        cascade = self.cascade if cascade is None else cascade or None
 
-        candidates = []
-        for idx, score in zip(I[0], D[0]):
-            if idx < len(self.id_map):
-                pid = self.id_map[idx]
-                text = self.product_id_to_text.get(pid, "")
-                candidates.append((pid, text, score))
+        # ((FAISS selection, parameters), BM25 mask) per distinct filter; None when nothing passes it
+        selections = {}
+        for key in dict.fromkeys(keys):
+            mask = self.attributes.eligible(len(self.id_map), **dict(key)) if key else None
+            if mask is not None and not mask.any():
+                selections[key] = None
+            else:
+                selections[key] = (self._search_params(mask), mask if mask is not None else self._live_mask())
+
+        requests = list(zip(queries, keys))
+        unique_requests = [request for request in dict.fromkeys(requests) if selections[request[1]] is not None]
+        results = {}
+        for start in range(0, len(unique_requests), batch_size):
+            batch = unique_requests[start:start + batch_size]
+            results.update(zip(batch, self._search_batch([query for query, _ in batch], [key for _, key in batch],
+                                                         selections, top_k, return_scores, rerank, cascade,
+                                                         timings)))
+        return [list(results.get(request, [])) for request in requests]
+
+    def _search_batch(self, queries, keys, selections, top_k, return_scores, rerank, cascade=None, timings=None):
+        # Step 1: FAISS search, one call per distinct filter
+        with span("encode", timings):
+            query_vecs = self.query_model.encode(list(queries), normalize_embeddings=True).astype('float32')
+        refine = self.vectors is not None and self.refine_factor > 1 and len(self.vectors) >= len(self.id_map)
+        groups = {}
+        for q, key in enumerate(keys):
+            groups.setdefault(key, []).append(q)
+
+        hits = [None] * len(queries)
+        lexical_hits = [None] * len(queries)
+        for key, positions in groups.items():
+            (selection, params), lexical_mask = selections[key]
+            group_vecs = query_vecs[positions]
+            with span("faiss", timings):
+                D, I = search_selected(self.index, group_vecs, top_k * self.refine_factor if refine else top_k,
+                                       selection, params)
+            if refine:
+                with span("refine", timings):
+                    D, I = self._refine(group_vecs, I, top_k)
+            for q, ids, scores in zip(positions, I, D):
+                hits[q] = [(int(idx), score) for idx, score in zip(ids, scores)
+                           if 0 <= idx < len(self.id_map) and self.id_map[idx] is not None]
+            if self.lexical is not None:
+                with span("lexical", timings):
+                    group_lexical = self.lexical.search_many([queries[q] for q in positions], top_k, mask=lexical_mask)
+                for q, query_lexical in zip(positions, group_lexical):
+                    lexical_hits[q] = query_lexical
+        # The rerank cascade judges confidence from the dense scores alone
+        dense_scores = [[score for _, score in query_hits] for query_hits in hits]
+
+        # Step 1b: BM25 matches fused with the dense ranking
+        if self.lexical is not None:
+            hits = [reciprocal_rank_fusion([dense_hits, [(idx, score) for idx, score in query_lexical
+                                                         if idx < len(self.id_map) and self.id_map[idx] is not None]],
+                                           top_k, self.rrf_k)
+                    for dense_hits, query_lexical in zip(hits, lexical_hits)]
 
         if not rerank:
-            return [(pid, score) if return_scores else pid for pid, _, score in candidates]
+            return [[(self.id_map[idx], score) if return_scores else self.id_map[idx] for idx, score in query_hits]
+                    for query_hits in hits]
+
+        # (query, rank position) pairs to rerank, shallowest first so a time budget cuts the weakest candidates
+        depths = [min(cascade.depth(scores), len(query_hits)) if cascade else len(query_hits)
+                  for scores, query_hits in zip(dense_scores, hits)]
+        pairs = sorted(((q, position) for q, depth in enumerate(depths) for position in range(depth)),
+                       key=lambda pair: pair[1])
 
-        # Step 2: Rerank using cross-encoder
-        rerank_inputs = [(query, text) for _, text, _ in candidates]
-        rerank_scores = self.reranker.predict(rerank_inputs)
+        # Only the candidate texts being reranked are read from the docstore, in one pass for the batch
+        with span("docstore", timings):
+            texts = self.docstore.get([hits[q][position][0] for q, position in pairs])
+        if cascade:
+            texts = [cascade.truncate(text) for text in texts]
+        rerank_inputs = [(queries[q], text) for (q, _), text in zip(pairs, texts)]
 
-        # Combine and sort
-        reranked = sorted(zip(candidates, rerank_scores), key=lambda x: x[1], reverse=True)
+        # Step 2: Rerank the pairs, in one cross-encoder call unless a time budget applies
+        rerank_scores = {}
+        with span("rerank", timings):
+            if cascade and cascade.time_budget_ms is not None:
+                deadline = time.perf_counter() + cascade.time_budget_ms / 1000
+                step = cascade.chunk_size * len(queries)
+                for start in range(0, len(rerank_inputs), step):
+                    if time.perf_counter() >= deadline:
+                        break
+                    rerank_scores.update(zip(pairs[start:start + step],
+                                             self.reranker.predict(rerank_inputs[start:start + step])))
+            elif rerank_inputs:
+                rerank_scores = dict(zip(pairs, self.reranker.predict(rerank_inputs)))
 
         results = []
-        for ((pid, _, _), score) in reranked:
-            if return_scores:
-                results.append((pid, float(score)))
-            else:
-                results.append(pid)
+        for q, query_hits in enumerate(hits):
+            # Combine and sort; candidates left unscored follow in retrieval order with their retrieval scores
+            scored = [(self.id_map[idx], float(rerank_scores[(q, position)]))
+                      for position, (idx, _) in enumerate(query_hits) if (q, position) in rerank_scores]
+            reranked = sorted(scored, key=lambda x: x[1], reverse=True)
+            reranked += [(self.id_map[idx], float(score))
+                         for position, (idx, score) in enumerate(query_hits) if (q, position) not in rerank_scores]
+            results.append(reranked if return_scores else [pid for pid, _ in reranked])
 
         return results
 
+    def _refine(self, query_vecs, I, top_k):
+        """Re-score a quantized shortlist against the full-precision vectors and keep the best top_k."""
+        exact = np.full(I.shape, -np.inf, dtype='float32')
+        rows, cols = np.nonzero(I >= 0)
+        # The shortlist of the whole batch is read from disk in one pass
+        exact[rows, cols] = np.einsum('ij,ij->i', self.vectors.get(I[rows, cols]), query_vecs[rows])
+        order = np.argsort(-exact, axis=1, kind='stable')[:, :top_k]
+        return np.take_along_axis(exact, order, axis=1), np.take_along_axis(I, order, axis=1)
+
+    def _search_params(self, mask=None):
+        """
+        Restrict the FAISS scan to live products (and, given a filter `mask`
+        over FAISS ids, to eligible ones), so top_k is filled with usable
+        results instead of being over-fetched and trimmed.
+
+        Returns:
+            Tuple: The picklable selection and its FAISS parameters, see
+            `ShardedIndex.search_selected`. (None, None) when nothing is excluded.
+        """
+        if mask is not None:
+            if self.tombstones:
+                dead = np.fromiter(self.tombstones, dtype='int64', count=len(self.tombstones))
+                mask[dead[dead < len(mask)]] = False
+            return self._selection({"bitmap": np.packbits(mask, bitorder="little")})
+
+        if not self.tombstones:
+            return None, None
+        if self._params is None:
+            dead = np.fromiter(self.tombstones, dtype='int64', count=len(self.tombstones))
+            self._params = self._selection({"exclude": dead})
+        return self._params
+
+    def _selection(self, selection):
+        # Shard workers build their own FAISS parameters; indexes without selector support filter afterwards
+        if isinstance(self.index, ShardedIndex) or not supports_selection(self.index):
+            return selection, None
+        return selection, selection_params(selection, self.index)
+
+    def _live_mask(self):
+        """Boolean mask over FAISS ids excluding tombstones, for the lexical index. None when nothing is tombstoned."""
+        if not self.tombstones:
+            return None
+        if self._live is None or len(self._live) != len(self.id_map):
+            self._live = np.ones(len(self.id_map), dtype=bool)
+            dead = np.fromiter(self.tombstones, dtype='int64', count=len(self.tombstones))
+            self._live[dead[dead < len(self._live)]] = False
+        return self._live
+
     def _save_index(self):
-        faiss.write_index(self.index, self.index_path)
+        if isinstance(self.index, ShardedIndex):
+            self.index.save()
+        else:
+            # Replaced rather than overwritten, so a crash mid-write leaves the previous index intact
+            faiss.write_index(self.index, f"{self.index_path}.tmp")
+            os.replace(f"{self.index_path}.tmp", self.index_path)
 
     def _save_id_map(self):
-        with open(self.id_map_path, "w") as f:
-            json.dump(self.id_map, f)
+        self.id_map.save()
+
+    def _save_tombstones(self):
+        with atomic_write(self.tombstones_path) as f:
+            json.dump(sorted(self.tombstones), f)
+
+    def _save_meta(self):
+        with atomic_write(self.meta_path) as f:
+            json.dump(self.meta, f)
+
+    @property
+    def models(self):
+        return self.product_model, self.query_model, self.reranker
+
+    @property
+    def product_model_key(self):
+        """Product encoder identity for the embedding cache; quantized backends produce slightly different vectors."""
+        backend = self.backends["product"]
+        return self.product_model_name if backend == "torch" else f"{self.product_model_name}@{backend}"
+
+    @cached_property
+    def pid_to_id(self):
+        """Product id → live FAISS id. Only the write paths need it, so read-only replicas never build it."""
+        return {pid: i for i, pid in enumerate(self.id_map) if pid is not None and i not in self.tombstones}
+
+    def state_files(self):
+        """Files of the saved index, by their name inside a snapshot directory (see `Snapshots.SnapshotStore`)."""
+        files = {
+            "id_map.bin": self.id_map.path,
+            "index_meta.json": self.meta_path,
+            "tombstones.json": self.tombstones_path,
+            "docstore.bin": self.docstore.data_path,
+            "docstore.idx": self.docstore.offsets_path,
+            "attributes.npz": self.attributes.arrays_path,
+            "attributes.categories.json": self.attributes.vocab_path,
+        }
+        if isinstance(self.index, ShardedIndex):
+            for path in [*self.index.paths, self.index.manifest_path]:
+                files[f"shards/{os.path.basename(path)}"] = path
+        else:
+            files["index.faiss"] = self.index_path
+        if self.lexical is not None:
+            files["lexical.npz"] = self.lexical.arrays_path
+            files["lexical.terms.json"] = self.lexical.vocab_path
+        if self.vectors is not None:
+            files["vectors.vecs"] = self.vectors.vectors_path
+        return files
+
+    def publish(self, snapshots, save=True):
+        """Publish the saved index (saving first unless it just was) as a new immutable snapshot. Returns its version."""
+        if save:
+            self.save()
+        return snapshots.publish(self.state_files(), copy=APPEND_ONLY_FILES)
+
+    def close(self):
+        """Release search worker processes and file mappings."""
+        if isinstance(self.index, ShardedIndex):
+            self.index.close()
+        self.docstore.close()
 
     def get_index_size(self):
-        return self.index.ntotal
+        return self.index.ntotal - len(self.tombstones)
@@ -0,0 +1,198 @@
+import os
+import argparse
+import numpy as np
+
+
+# "torch" is eager fp32 PyTorch; "int8" quantizes Linear weights dynamically in PyTorch;
+# "onnx" and "onnx-int8" run an exported graph (fp32 or dynamically quantized) on ONNX Runtime
+BACKENDS = ("torch", "int8", "onnx", "onnx-int8")
+# Instruction set "onnx-int8" graphs are quantized for: "avx2", "avx512", "avx512_vnni" or "arm64"
+ONNX_QUANTIZATION = "avx2"
+# Minimum agreement with the PyTorch outputs for a backend to pass `check_parity`
+PARITY_MIN_COSINE = 0.99
+PARITY_MIN_RANK_CORRELATION = 0.95
+
+PARITY_QUERIES = [
+    "wireless noise cancelling earbuds",
+    "yoga mat for beginners",
+    "men's waterproof hiking boots size 10",
+    "stainless steel water bottle under 20 dollars",
+    "gaming laptop with rtx graphics",
+    "organic cotton baby onesie",
+    "ergonomic office chair with lumbar support",
+    "red running shoes for women",
+]
+PARITY_DOCUMENTS = [
+    "Bluetooth earbuds with active noise cancellation and a 24 hour charging case.",
+    "Non-slip 6mm exercise mat for yoga and pilates, with carrying strap.",
+    "Leather hiking boots with waterproof membrane and rubber lug sole.",
+    "Insulated stainless steel bottle keeps drinks cold for 24 hours.",
+    "15.6 inch laptop with RTX 4060 graphics and 144Hz display.",
+    "Soft organic cotton bodysuit for newborns, pack of three.",
+    "Mesh office chair with adjustable lumbar support and armrests.",
+    "Lightweight women's running shoes with breathable knit upper.",
+]
+
+
+def validate_backend(backend, supported=BACKENDS):
+    if backend not in supported:
+        raise ValueError(f"❌ Unknown inference backend '{backend}'. Choose one of {supported}.")
+    return backend
+
+
+def set_num_threads(num_threads):
+    """Intra-op threads for PyTorch in this process; None keeps the default of one per core."""
+    if num_threads:
+        import torch
+        torch.set_num_threads(num_threads)
+
+
+def quantize_dynamic(module):
+    """int8 weights and dynamically quantized activations for the module's nn.Linear layers (CPU only)."""
+    import torch
+    return torch.quantization.quantize_dynamic(module, {torch.nn.Linear}, dtype=torch.qint8, inplace=True)
+
+
+def _find_file(directory, file_name):
+    for root, _, files in os.walk(directory):
+        if file_name in files:
+            return os.path.relpath(os.path.join(root, file_name), directory)
+    return None
+
+
+def _onnx_model_kwargs(file_name, num_threads):
+    import onnxruntime
+    options = onnxruntime.SessionOptions()
+    options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+    if num_threads:
+        options.intra_op_num_threads = num_threads
+        options.inter_op_num_threads = 1
+    return {"file_name": file_name, "provider": "CPUExecutionProvider", "session_options": options}
+
+
+def export_onnx(model_class, model_name, export_dir, quantization=None):
+    """
+    Export a SentenceTransformer or CrossEncoder to ONNX under `export_dir`,
+    plus a dynamically int8-quantized copy when `quantization` names an
+    instruction set. Returns the path of the graph to load, relative to `export_dir`.
+    """
+    from sentence_transformers import export_dynamic_quantized_onnx_model
+
+    if _find_file(export_dir, "model.onnx") is None:
+        print(f"⏳ Exporting {model_name} to ONNX in {export_dir}...")
+        # Converts the PyTorch weights when the model repository ships no ONNX graph
+        model_class(model_name, backend="onnx").save_pretrained(export_dir)
+    if not quantization:
+        return _find_file(export_dir, "model.onnx")
+
+    quantized_name = f"model_qint8_{quantization}.onnx"
+    if _find_file(export_dir, quantized_name) is None:
+        print(f"⏳ Quantizing {model_name} to int8 for {quantization}...")
+        export_dynamic_quantized_onnx_model(model_class(export_dir, backend="onnx"), quantization, export_dir)
+    return _find_file(export_dir, quantized_name)
+
+
+def load_text_model(model_class, model_name, backend="torch", num_threads=None,
+                    export_dir="data/onnx", quantization=ONNX_QUANTIZATION):
+    """
+    Load a sentence-transformers model (SentenceTransformer or CrossEncoder)
+    on the given inference backend.
+
+    ONNX graphs are exported once under `export_dir` and reused by later
+    loads. The ONNX backends need `optimum[onnxruntime]` installed.
+
+    Args:
+        model_class (type): SentenceTransformer or CrossEncoder.
+        model_name (str): Hugging Face model identifier.
+        backend (str): One of `BACKENDS`.
+        num_threads (int, optional): Intra-op threads. Set it to cores per
+            API worker so concurrent workers do not oversubscribe the CPU.
+        export_dir (str): Directory holding exported ONNX graphs.
+        quantization (str): Instruction set for "onnx-int8", see `ONNX_QUANTIZATION`.
+    """
+    validate_backend(backend)
+    set_num_threads(num_threads)
+    if backend == "torch":
+        return model_class(model_name)
+    if backend == "int8":
+        return quantize_dynamic(model_class(model_name, device="cpu"))
+
+    model_dir = os.path.join(export_dir, model_name.replace("/", "--"))
+    file_name = export_onnx(model_class, model_name, model_dir,
+                            quantization=quantization if backend == "onnx-int8" else None)
+    return model_class(model_dir, backend="onnx", model_kwargs=_onnx_model_kwargs(file_name, num_threads))
+
+
+def _rank_correlation(a, b):
+    """Spearman correlation of two score vectors."""
+    rank_a = np.argsort(np.argsort(a))
+    rank_b = np.argsort(np.argsort(b))
+    return float(np.corrcoef(rank_a, rank_b)[0, 1])
+
+
+def check_parity(reference, candidate, texts=None, pairs=None):
+    """
+    Compare a model on another backend against its PyTorch reference.
+
+    Encoders are compared by cosine similarity of the embeddings of `texts`,
+    cross-encoders by the scores they give `pairs`.
+
+    Returns:
+        Dict: The measured agreement and whether it passes the parity thresholds.
+    """
+    if pairs is not None:
+        expected = np.asarray(reference.predict(pairs), dtype="float32")
+        actual = np.asarray(candidate.predict(pairs), dtype="float32")
+        correlation = _rank_correlation(expected, actual)
+        return {"max_abs_diff": round(float(np.abs(expected - actual).max()), 4),
+                "rank_correlation": round(correlation, 4),
+                "passed": correlation >= PARITY_MIN_RANK_CORRELATION}
+
+    expected = reference.encode(texts, normalize_embeddings=True)
+    actual = candidate.encode(texts, normalize_embeddings=True)
+    cosines = np.sum(expected * actual, axis=1)
+    return {"min_cosine": round(float(cosines.min()), 4), "mean_cosine": round(float(cosines.mean()), 4),
+            "passed": bool(cosines.min() >= PARITY_MIN_COSINE)}
+
+
+def _parse_args():
+    parser = argparse.ArgumentParser(description="Check an inference backend against PyTorch outputs.")
+    parser.add_argument("--backend", choices=BACKENDS[1:], default="onnx-int8")
+    parser.add_argument("--threads", type=int, default=None, help="Intra-op threads")
+    parser.add_argument("--quantization", default=ONNX_QUANTIZATION, help="Instruction set for onnx-int8")
+    parser.add_argument("--encoder", action="append", default=None,
+                        help="SentenceTransformer to check (repeatable)")
+    parser.add_argument("--reranker", default="cross-encoder/ms-marco-MiniLM-L-6-v2")
+    return parser.parse_args()
+
+
+# Example Usage
+if __name__ == "__main__":
+    import sys
+    import time
+    from sentence_transformers import SentenceTransformer, CrossEncoder
+
+    args = _parse_args()
+    pairs = [(query, document) for query in PARITY_QUERIES for document in PARITY_DOCUMENTS]
+    checks = [(SentenceTransformer, name, {"texts": PARITY_QUERIES + PARITY_DOCUMENTS})
+              for name in args.encoder or ["all-MiniLM-L6-v2", "multi-qa-MiniLM-L6-cos-v1"]]
+    checks.append((CrossEncoder, args.reranker, {"pairs": pairs}))
+
+    failed = False
+    for model_class, name, inputs in checks:
+        reference = load_text_model(model_class, name, "torch", num_threads=args.threads)
+        candidate = load_text_model(model_class, name, args.backend, num_threads=args.threads,
+                                    quantization=args.quantization)
+        report = check_parity(reference, candidate, **inputs)
+        timings = {}
+        for label, model in (("torch", reference), (args.backend, candidate)):
+            start = time.perf_counter()
+            for _ in range(5):
+                if "pairs" in inputs:
+                    model.predict(pairs)
+                else:
+                    model.encode(inputs["texts"])
+            timings[label] = round((time.perf_counter() - start) * 1000 / 5, 1)
+        print(f"{'✅' if report['passed'] else '❌'} {name} [{args.backend}] {report} ms/batch: {timings}")
+        failed |= not report["passed"]
+    sys.exit(1 if failed else 0)
@@ -0,0 +1,219 @@
+import os
+import re
+import json
+from collections import Counter
+import numpy as np
+
+from Snapshots import atomic_write
+
+
+# Words, plus SKU/model-number style compounds such as "wh-1000xm4" or "a/b.2"
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+(?:[-/.][a-z0-9]+)*")
+TOKEN_SEPARATORS = re.compile(r"[-/.]")
+
+# Terms in more than this share of documents ("for", "men") only rescore candidates found by rarer terms
+MAX_DF_RATIO = 0.05
+
+
+def tokenize(text):
+    """Lowercase tokens of a cleaned text. Compounds are kept whole and also split into their parts."""
+    tokens = []
+    for token in TOKEN_PATTERN.findall((text or "").lower()):
+        tokens.append(token)
+        if not token.isalnum():
+            tokens.extend(part for part in TOKEN_SEPARATORS.split(token) if part)
+    return tokens
+
+
+class LexicalIndex:
+    def __init__(self, path="data/lexical", k1=1.2, b=0.75, max_df_ratio=MAX_DF_RATIO):
+        """
+        Array-backed BM25 inverted index keyed by FAISS id, for exact SKU,
+        model-number and brand matches that dense retrieval misses.
+
+        Terms are interned to int32 ids. Postings are stored CSR-style: the
+        documents containing term t are `doc_ids[indptr[t]:indptr[t + 1]]`
+        (ascending) with their term frequencies in `tfs`. `doc_len` holds the
+        token count of every document, 0 once it is removed.
+
+        Args:
+            path (str): File prefix for the `.npz` arrays and `.terms.json` vocabulary.
+            k1 (float): BM25 term-frequency saturation.
+            b (float): BM25 document-length normalisation.
+            max_df_ratio (float): Document-frequency share above which a
+                query term is not scanned, see `search_many`.
+        """
+        self.arrays_path = f"{path}.npz"
+        self.vocab_path = f"{path}.terms.json"
+        self.k1 = k1
+        self.b = b
+        self.max_df_ratio = max_df_ratio
+
+        if os.path.exists(self.arrays_path):
+            arrays = np.load(self.arrays_path)
+            self.indptr = arrays["indptr"]
+            self.doc_ids = arrays["doc_ids"]
+            self.tfs = arrays["tfs"]
+            self.doc_len = arrays["doc_len"]
+        else:
+            self.indptr = np.zeros(1, dtype="int64")
+            self.doc_ids = np.empty(0, dtype="int32")
+            self.tfs = np.empty(0, dtype="uint16")
+            self.doc_len = np.empty(0, dtype="int32")
+
+        if os.path.exists(self.vocab_path):
+            with open(self.vocab_path, "r") as f:
+                self.terms = json.load(f)
+        else:
+            self.terms = []
+        self.term_to_id = {term: i for i, term in enumerate(self.terms)}
+
+        # Per-append postings not yet merged into the CSR arrays
+        self._new_terms = []
+        self._new_docs = []
+        self._new_tfs = []
+        self._new_lengths = []
+        self._new_count = 0
+        self._norm = None
+
+    def __len__(self):
+        return len(self.doc_len) + self._new_count
+
+    def append(self, texts):
+        """Index texts as the next FAISS ids."""
+        first = len(self)
+        term_ids, doc_ids, tfs, lengths = [], [], [], []
+        for offset, text in enumerate(texts):
+            tokens = tokenize(text)
+            lengths.append(len(tokens))
+            for term, tf in Counter(tokens).items():
+                if term not in self.term_to_id:
+                    self.term_to_id[term] = len(self.terms)
+                    self.terms.append(term)
+                term_ids.append(self.term_to_id[term])
+                doc_ids.append(first + offset)
+                tfs.append(min(tf, np.iinfo("uint16").max))
+        self._new_terms.append(np.asarray(term_ids, dtype="int32"))
+        self._new_docs.append(np.asarray(doc_ids, dtype="int32"))
+        self._new_tfs.append(np.asarray(tfs, dtype="uint16"))
+        self._new_lengths.append(np.asarray(lengths, dtype="int32"))
+        self._new_count += len(lengths)
+
+    def _consolidate(self):
+        """Merge appended postings into the CSR arrays once, rather than on every append."""
+        if not self._new_count:
+            return
+        old_terms = np.repeat(np.arange(len(self.indptr) - 1, dtype="int32"), np.diff(self.indptr))
+        all_terms = np.concatenate([old_terms, *self._new_terms])
+        # A stable sort keeps each term's documents in ascending id order
+        order = np.argsort(all_terms, kind="stable")
+        self.doc_ids = np.concatenate([self.doc_ids, *self._new_docs])[order]
+        self.tfs = np.concatenate([self.tfs, *self._new_tfs])[order]
+        counts = np.bincount(all_terms, minlength=len(self.terms))
+        self.indptr = np.concatenate([[0], np.cumsum(counts)]).astype("int64")
+        self.doc_len = np.concatenate([self.doc_len, *self._new_lengths])
+        self._new_terms, self._new_docs, self._new_tfs, self._new_lengths = [], [], [], []
+        self._new_count = 0
+        self._norm = None
+
+    def remove(self, ids):
+        """Drop the postings of removed documents, e.g. after the FAISS index is compacted."""
+        self._consolidate()
+        ids = np.asarray(ids, dtype="int64")
+        ids = ids[(ids >= 0) & (ids < len(self.doc_len))]
+        if not len(ids):
+            return
+        dead = np.zeros(len(self.doc_len), dtype=bool)
+        dead[ids] = True
+        keep = ~dead[self.doc_ids]
+        kept_terms = np.repeat(np.arange(len(self.indptr) - 1), np.diff(self.indptr))[keep]
+        self.doc_ids = self.doc_ids[keep]
+        self.tfs = self.tfs[keep]
+        counts = np.bincount(kept_terms, minlength=len(self.terms))
+        self.indptr = np.concatenate([[0], np.cumsum(counts)]).astype("int64")
+        self.doc_len[ids] = 0
+        self._norm = None
+
+    def save(self):
+        self._consolidate()
+        with atomic_write(self.arrays_path, "wb") as f:
+            np.savez(f, indptr=self.indptr, doc_ids=self.doc_ids, tfs=self.tfs, doc_len=self.doc_len)
+        with atomic_write(self.vocab_path) as f:
+            json.dump(self.terms, f)
+
+    def _length_norm(self):
+        """BM25 denominator term k1 * (1 - b + b * len / avg_len) per document, cached until the index changes."""
+        if self._norm is None:
+            live = np.count_nonzero(self.doc_len)
+            avg_len = self.doc_len.sum() / live if live else 1.0
+            self._norm = (self.k1 * (1 - self.b + self.b * self.doc_len / max(avg_len, 1e-9))).astype("float32")
+        return self._norm
+
+    def search_many(self, queries, top_k=20, mask=None):
+        """
+        BM25 top-k per query. Scoring is vectorised over the concatenated
+        postings of the query terms.
+
+        Only terms in at most `max_df_ratio` of the documents (or, if every
+        term is that common, the rarest one) are scanned to find candidates.
+        Common terms add their exact contribution to those candidates through
+        a binary search of their postings, so a stopword costs O(candidates)
+        instead of O(documents). Documents matching only common terms are not
+        returned; their scores are near zero anyway.
+
+        Args:
+            queries (List[str]): Query texts.
+            top_k (int): Results per query.
+            mask (np.ndarray, optional): Boolean mask over FAISS ids of documents
+                allowed in the results; ids past its end are excluded.
+
+        Returns:
+            List[List[Tuple[int, float]]]: (FAISS id, BM25 score) per query, best first.
+        """
+        self._consolidate()
+        norm = self._length_norm()
+        doc_count = np.count_nonzero(self.doc_len)
+        results = []
+        for query in queries:
+            term_ids = sorted({self.term_to_id[t] for t in tokenize(query) if t in self.term_to_id})
+            if not term_ids or not doc_count:
+                results.append([])
+                continue
+            term_ids = np.asarray(term_ids, dtype="int64")
+            starts, ends = self.indptr[term_ids], self.indptr[term_ids + 1]
+            df = ends - starts
+            idf = np.log1p((doc_count - df + 0.5) / (df + 0.5)).astype("float32")
+            common = df > self.max_df_ratio * doc_count
+            if common.all():
+                common[np.argmin(df)] = False
+            scanned = ~common
+
+            postings = np.concatenate([np.arange(start, end) for start, end in zip(starts[scanned], ends[scanned])])
+            docs = self.doc_ids[postings]
+            weights = np.repeat(idf[scanned], df[scanned])
+            if mask is not None:
+                allowed = docs < len(mask)
+                allowed[allowed] = mask[docs[allowed]]
+                postings, docs, weights = postings[allowed], docs[allowed], weights[allowed]
+            if not len(docs):
+                results.append([])
+                continue
+
+            tf = self.tfs[postings].astype("float32")
+            contributions = weights * tf * (self.k1 + 1) / (tf + norm[docs])
+            unique_docs, inverse = np.unique(docs, return_inverse=True)
+            scores = np.bincount(inverse, weights=contributions)
+
+            # A term's postings are in ascending document order, so candidates are found by binary search
+            for t in np.flatnonzero(common):
+                term_docs = self.doc_ids[starts[t]:ends[t]]
+                positions = np.minimum(np.searchsorted(term_docs, unique_docs), len(term_docs) - 1)
+                found = term_docs[positions] == unique_docs
+                tf = self.tfs[starts[t] + positions[found]].astype("float32")
+                scores[found] += idf[t] * tf * (self.k1 + 1) / (tf + norm[unique_docs[found]])
+
+            k = min(top_k, len(scores))
+            top = np.argpartition(-scores, k - 1)[:k]
+            top = top[np.argsort(-scores[top], kind="stable")]
+            results.append([(int(unique_docs[i]), float(scores[i])) for i in top])
+        return results
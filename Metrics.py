@@ -0,0 +1,80 @@
+import time
+from contextlib import contextmanager
+from prometheus_client import Gauge, Histogram, REGISTRY, CONTENT_TYPE_LATEST, generate_latest
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+
+
+# Stages run from well under a millisecond (cache hits, FAISS on small indexes) to seconds (BLIP, Whisper, Gemini)
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+STAGE_SECONDS = Histogram(
+    "intentsearch_stage_seconds",
+    "Wall time of one pipeline stage. Search-internal stages (encode, faiss, lexical, rerank) "
+    "are observed once per batch.",
+    ["stage"], buckets=LATENCY_BUCKETS)
+REQUEST_SECONDS = Histogram(
+    "intentsearch_request_seconds", "End-to-end request latency.", ["endpoint"], buckets=LATENCY_BUCKETS)
+SEARCH_BATCH_SIZE = Histogram(
+    "intentsearch_search_batch_size", "Queries coalesced into one batched search.",
+    buckets=(1, 2, 4, 8, 16, 32, 64, 128, 256))
+QUEUE_DEPTH = Gauge("intentsearch_queue_depth", "Calls running or waiting in a stage's queue.", ["stage"])
+INDEX_VECTORS = Gauge("intentsearch_index_vectors", "Live (searchable) vectors in the loaded FAISS index.")
+INDEX_TOMBSTONES = Gauge("intentsearch_index_tombstones",
+                         "Deleted or superseded vectors still in the loaded FAISS index until compaction.")
+MODEL_READY = Gauge("intentsearch_model_ready", "1 once a model is loaded.", ["model"])
+
+
+@contextmanager
+def span(stage, timings=None):
+    """
+    Time a block as one pipeline stage: observed in `STAGE_SECONDS` and,
+    when `timings` is given, added to `timings[stage]` in milliseconds.
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        STAGE_SECONDS.labels(stage).observe(elapsed)
+        if timings is not None:
+            timings[stage] = round(timings.get(stage, 0.0) + elapsed * 1000, 2)
+
+
+class CacheCollector:
+    def __init__(self):
+        """
+        Exports hit/miss counters the caches keep themselves, read at scrape
+        time, so lookups on the hot path cost nothing extra.
+        """
+        self._sources = {}
+
+    def add(self, name, read):
+        """
+        Args:
+            name (str): Cache label.
+            read (Callable[[], Dict]): Returns `hits`, `misses` and `size`.
+        """
+        self._sources[name] = read
+
+    def collect(self):
+        lookups = CounterMetricFamily("intentsearch_cache_lookups", "Cache lookups by result.",
+                                      labels=["cache", "result"])
+        entries = GaugeMetricFamily("intentsearch_cache_entries", "Entries held by a cache.", labels=["cache"])
+        for name, read in self._sources.items():
+            stats = read()
+            if not stats:
+                continue
+            lookups.add_metric([name, "hit"], stats["hits"])
+            lookups.add_metric([name, "miss"], stats["misses"])
+            entries.add_metric([name], stats["size"])
+        yield lookups
+        yield entries
+
+
+caches = CacheCollector()
+REGISTRY.register(caches)
+
+
+def render():
+    """The /metrics payload and its content type."""
+    return generate_latest(), CONTENT_TYPE_LATEST
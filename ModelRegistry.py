@@ -0,0 +1,125 @@
+import os
+import gc
+import time
+import asyncio
+import threading
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def default_device():
+    """MODEL_DEVICE if set, else CUDA when available, else CPU."""
+    device = os.getenv("MODEL_DEVICE")
+    if device:
+        return device
+    import torch
+    return "cuda" if torch.cuda.is_available() else "cpu"
+
+
+class ModelRegistry:
+    def __init__(self):
+        """
+        Named models constructed lazily on first use and shared by the process.
+
+        Each model loads at most once, even when several threads ask for it
+        at the same time; callers of other models are not held up. Models
+        loaded before the server forks its workers (see `preload`) are
+        shared with them copy-on-write.
+        """
+        self._factories = {}
+        self._warmups = {}
+        self._on_load = {}
+        self._models = {}
+        self._status = {}
+        self._locks = {}
+
+    def register(self, name, factory, warmup=None, on_load=None):
+        """
+        Args:
+            name (str): Model name.
+            factory (Callable[[], Any]): Builds the model.
+            warmup (Callable[[Any], None], optional): Runs a throwaway inference
+                after loading, so the first real request does not pay for lazy
+                kernel and allocator setup.
+            on_load (Callable[[Any], None], optional): Called with the model
+                whenever it is loaded or replaced.
+        """
+        self._factories[name] = factory
+        self._warmups[name] = warmup
+        self._on_load[name] = on_load
+        self._locks[name] = threading.Lock()
+        self._status[name] = {"state": "not_loaded"}
+
+    def get(self, name):
+        """The model, loading it in the calling thread if needed."""
+        model = self._models.get(name)
+        if model is not None:
+            return model
+        with self._locks[name]:
+            if name not in self._models:
+                self._load(name)
+        return self._models[name]
+
+    async def aget(self, name):
+        """`get` for the event loop: a model that still has to load is loaded on the default executor."""
+        model = self._models.get(name)
+        if model is not None:
+            return model
+        return await asyncio.get_running_loop().run_in_executor(None, self.get, name)
+
+    def _load(self, name):
+        self._status[name] = {"state": "loading", "started_at": time.time()}
+        start = time.perf_counter()
+        try:
+            model = self._factories[name]()
+            if self._warmups[name] is not None:
+                self._warmups[name](model)
+        except Exception as e:
+            self._status[name] = {"state": "failed", "error": str(e)}
+            raise
+        self._models[name] = model
+        self._status[name] = {"state": "ready", "load_seconds": round(time.perf_counter() - start, 2)}
+        print(f"✅ Loaded {name} model in {self._status[name]['load_seconds']}s.")
+        if self._on_load[name] is not None:
+            self._on_load[name](model)
+
+    def replace(self, name, model):
+        """Swap in a different instance (e.g. a reloaded index); callers already holding the old one keep it."""
+        self._models[name] = model
+        self._status[name] = {"state": "ready", "replaced_at": time.time()}
+        if self._on_load[name] is not None:
+            self._on_load[name](model)
+
+    def peek(self, name):
+        """The model if it is already loaded, else None. Never triggers a load."""
+        return self._models.get(name)
+
+    def is_ready(self, *names):
+        return all(name in self._models for name in names)
+
+    def status(self):
+        return {name: dict(status) for name, status in self._status.items()}
+
+    def warm_up(self, names):
+        """Load the named models in order, logging rather than raising failures."""
+        for name in names:
+            try:
+                self.get(name)
+            except Exception:
+                logger.error(f"❌ Loading {name} model failed:", exc_info=True)
+
+    def warm_up_in_background(self, names):
+        """Load the named models in order on a daemon thread, so serving starts right away."""
+        thread = threading.Thread(target=self.warm_up, args=(list(names),), name="model-warmup", daemon=True)
+        thread.start()
+        return thread
+
+    def preload(self, names):
+        """
+        Load models before the server forks workers (e.g. gunicorn --preload),
+        so workers share their memory copy-on-write. Freezing the GC keeps
+        collections in the workers from touching, and so copying, those pages.
+        """
+        self.warm_up(names)
+        gc.freeze()
@@ -0,0 +1,165 @@
+import os
+import sys
+import time
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from TextProcessor import build_product_record
+from EmbeddingCache import EmbeddingCache
+
+
+# Worker-process state, set once by `_init_worker`
+_model = None
+_cache = None
+
+
+def _init_worker(model_name, backend, num_threads, cache_path, cache_key, dimension):
+    global _model, _cache
+    from sentence_transformers import SentenceTransformer
+    from InferenceBackends import load_text_model
+
+    _model = load_text_model(SentenceTransformer, model_name, backend, num_threads=num_threads)
+    # Read-only view of the cache as of pool start; the parent records new entries
+    if cache_path:
+        _cache = EmbeddingCache(cache_path, model_name=cache_key, dimension=dimension)
+
+
+def _attach(shm_name):
+    # The parent owns and unlinks the segment. Spawned workers share the parent's resource
+    # tracker, where registering a name again is a no-op but unregistering it would drop the
+    # parent's entry, so the worker never unregisters; 3.13+ can skip tracking altogether.
+    if sys.version_info >= (3, 13):
+        return shared_memory.SharedMemory(name=shm_name, track=False)
+    return shared_memory.SharedMemory(name=shm_name)
+
+
+def _process_chunk(items, shm_name, dimension, encode_batch_size):
+    """
+    Flatten, clean and encode one chunk of raw documents in a worker.
+
+    Embeddings are written straight into the parent's shared-memory buffer;
+    only ids, texts, attributes and stage timings travel back through pickling.
+    """
+    start = time.perf_counter()
+    products = [product for product in map(build_product_record, items) if product]
+    clean_seconds = time.perf_counter() - start
+
+    product_ids = [pid for pid, _, _ in products]
+    product_texts = [text for _, text, _ in products]
+    product_attributes = [attributes for _, _, attributes in products]
+
+    start = time.perf_counter()
+    hit = np.zeros(len(products), dtype=bool)
+    if products:
+        if _cache is not None:
+            embeddings, hit = _cache.get(_cache.make_keys(product_texts))
+            missing = np.flatnonzero(~hit)
+            if len(missing):
+                embeddings[missing] = _model.encode([product_texts[i] for i in missing],
+                                                    batch_size=encode_batch_size, normalize_embeddings=True)
+        else:
+            embeddings = _model.encode(product_texts, batch_size=encode_batch_size, normalize_embeddings=True)
+        shm = _attach(shm_name)
+        out = np.ndarray((len(products), dimension), dtype="float32", buffer=shm.buf)
+        out[:] = embeddings
+        del out
+        shm.close()
+    encode_seconds = time.perf_counter() - start
+
+    return product_ids, product_texts, product_attributes, hit, len(items), clean_seconds, encode_seconds
+
+
+def parallel_build(indexer, items, workers, chunk_size=2048, encode_batch_size=256, timer=None, progress=None,
+                   checkpoint=None, checkpoint_every=50):
+    """
+    Fan cleaning and encoding of `items` across a pool of `workers` processes.
+
+    Each in-flight chunk owns a shared-memory buffer of `chunk_size` float32
+    embeddings that is reused once the parent has added it to the index, so
+    memory stays bounded by `2 * workers` chunks. With a `checkpoint`, the
+    index is saved every `checkpoint_every` added chunks, together with the
+    watermark of the last chunk added rather than of the last one read.
+
+    Returns:
+        int: Number of products indexed.
+    """
+    in_flight = 2 * workers
+    dimension = indexer.dimension
+    buffer_bytes = chunk_size * dimension * 4
+    buffers = [shared_memory.SharedMemory(create=True, size=buffer_bytes) for _ in range(in_flight)]
+    free_buffers = deque(buffers)
+    pending = deque()
+    threads_per_worker = max(1, (os.cpu_count() or 1) // workers)
+    cache = indexer.embedding_cache
+    indexed = 0
+    added_chunks = 0
+
+    def collect():
+        nonlocal indexed, added_chunks
+        # Chunks are added in submission order, so every document before the watermark is indexed
+        future, shm, watermark = pending.popleft()
+        product_ids, product_texts, product_attributes, hit, doc_count, clean_seconds, encode_seconds = future.result()
+        embeddings = np.ndarray((len(product_ids), dimension), dtype="float32", buffer=shm.buf)
+
+        if cache is not None and product_ids:
+            missing = np.flatnonzero(~hit)
+            cache.record(len(hit) - len(missing), len(missing))
+            cache.put(cache.make_keys([product_texts[i] for i in missing]), embeddings[missing])
+
+        start = time.perf_counter()
+        if product_ids:
+            # Copied because the buffer is reused, and an untrained index holds on to pending chunks
+            indexer.add_embeddings(product_ids, product_texts, embeddings.copy(), save=False,
+                                   product_attributes=product_attributes)
+        add_seconds = time.perf_counter() - start
+        del embeddings
+        free_buffers.append(shm)
+
+        if timer:
+            # Worker-side stage times are summed across processes (CPU-seconds)
+            timer.record("clean", clean_seconds, doc_count)
+            timer.record("encode", encode_seconds, len(product_ids))
+            timer.record("add", add_seconds, len(product_ids))
+        if progress:
+            progress.update(doc_count)
+        indexed += len(product_ids)
+
+        added_chunks += 1
+        if checkpoint and added_chunks % checkpoint_every == 0:
+            indexer.save()
+            checkpoint.save(watermark)
+
+    def submit(pool, chunk):
+        if not free_buffers:
+            collect()
+        shm = free_buffers.popleft()
+        pending.append((pool.submit(_process_chunk, chunk, shm.name, dimension, encode_batch_size), shm,
+                        checkpoint.value if checkpoint else None))
+
+    # Spawned workers do not inherit the parent's torch/OpenMP thread state
+    context = multiprocessing.get_context("spawn")
+    try:
+        with ProcessPoolExecutor(max_workers=workers, mp_context=context, initializer=_init_worker,
+                                 initargs=(indexer.product_model_name, indexer.backends["product"],
+                                           threads_per_worker, cache.path if cache is not None else None,
+                                           indexer.product_model_key, dimension)) as pool:
+            chunk = []
+            for item in items:
+                chunk.append(item)
+                if len(chunk) == chunk_size:
+                    submit(pool, chunk)
+                    chunk = []
+            if chunk:
+                submit(pool, chunk)
+            while pending:
+                collect()
+    finally:
+        for shm in buffers:
+            shm.close()
+            shm.unlink()
+
+    return indexed
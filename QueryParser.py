@@ -1,6 +1,12 @@
 import os
+import re
+import time
+import asyncio
+import hashlib
 import logging
-from typing import Optional, Dict, Any
+import threading
+from concurrent.futures import Future
+from typing import Optional, Dict, Any, Tuple
 from dotenv import load_dotenv
 
 from langchain_google_genai import GoogleGenerativeAI
@@ -9,6 +15,8 @@ from langchain.prompts import PromptTemplate
 from langchain.output_parsers import PydanticOutputParser
 from pydantic import BaseModel, Field, ValidationError
 
+from Caching import LRUCache, SQLiteCache
+
 # Load environment variables
 load_dotenv()
 
@@ -32,6 +40,7 @@ class QueryRewriter:
         api_key: Optional[str] = None,
         verbose: bool = False,
     ):
+        self.model_name = model_name
         self.api_key = api_key or os.getenv("GOOGLE_API_KEY")
         if not self.api_key:
             raise ValueError("❌ GOOGLE_API_KEY not found. Please set it in .env or pass explicitly.")
@@ -68,16 +77,351 @@ User Query: {input}
         try:
             logger.info(f"🔍 Rewriting query: {user_input}")
             raw_output = self.chain.run({"input": user_input})
-            parsed_output = self.parser.parse(raw_output)
-            logger.debug(f"✅ Parsed Output: {parsed_output}")
-            return parsed_output.dict()
+            return self._parse(raw_output)
         except ValidationError as ve:
             logger.error("❌ Validation error in LLM response:", exc_info=True)
             return {"query": user_input, "error": "Invalid schema from model", "details": str(ve)}
         except Exception as e:
             logger.error("❌ Exception during query rewrite:", exc_info=True)
             return {"query": user_input, "error": str(e)}
-        
+
+    async def arewrite(self, user_input: str) -> Dict[str, Any]:
+        """Same as `rewrite`, but awaits the LLM call instead of blocking the event loop."""
+        try:
+            logger.info(f"🔍 Rewriting query: {user_input}")
+            raw_output = await self.chain.arun({"input": user_input})
+            return self._parse(raw_output)
+        except ValidationError as ve:
+            logger.error("❌ Validation error in LLM response:", exc_info=True)
+            return {"query": user_input, "error": "Invalid schema from model", "details": str(ve)}
+        except Exception as e:
+            logger.error("❌ Exception during query rewrite:", exc_info=True)
+            return {"query": user_input, "error": str(e)}
+
+    def _parse(self, raw_output: str) -> Dict[str, Any]:
+        parsed_output = self.parser.parse(raw_output)
+        logger.debug(f"✅ Parsed Output: {parsed_output}")
+        return parsed_output.dict()
+
+
+# === Cached Query Rewriter ===
+class CachedQueryRewriter:
+    def __init__(
+        self,
+        rewriter: QueryRewriter,
+        max_size: int = 10000,
+        ttl: Optional[float] = 24 * 3600,
+        persistent_path: Optional[str] = None,
+    ):
+        """
+        Tiered cache in front of `QueryRewriter`.
+
+        Lookups go to an in-process LRU, then an optional SQLite file, then
+        the LLM. Concurrent identical queries share one in-flight LLM call.
+        On the async path the SQLite tier is read and written in the default
+        executor, so a slow disk never blocks the event loop.
+        Keys cover the normalised input, the model name and the prompt
+        template, so changing either invalidates old rewrites.
+
+        Args:
+            rewriter (QueryRewriter): Rewriter to call on a miss.
+            max_size (int): In-process LRU size.
+            ttl (float, optional): Seconds a rewrite stays valid in both tiers.
+            persistent_path (str, optional): SQLite file for the persistent tier.
+        """
+        self.rewriter = rewriter
+        self.memory = LRUCache(max_size=max_size, ttl=ttl)
+        self.persistent = SQLiteCache(persistent_path, ttl=ttl) if persistent_path else None
+        prompt_hash = hashlib.sha256(rewriter.prompt.template.encode("utf-8")).hexdigest()[:16]
+        self._key_prefix = f"{rewriter.model_name}:{prompt_hash}:"
+        # Sync callers wait on concurrent.futures.Future, coroutines on asyncio futures
+        self._in_flight = {}
+        self._async_in_flight = {}
+        self._lock = threading.Lock()
+        self._stats = {"memory_hits": 0, "persistent_hits": 0, "coalesced": 0, "misses": 0,
+                       "llm_seconds": 0.0}
+
+    def _key(self, user_input: str) -> str:
+        normalised = " ".join(user_input.lower().split())
+        return hashlib.sha256((self._key_prefix + normalised).encode("utf-8")).hexdigest()
+
+    def _memory_lookup(self, key: str) -> Optional[Dict[str, Any]]:
+        value = self.memory.get(key)
+        if value is not None:
+            self._stats["memory_hits"] += 1
+        return value
+
+    def _persistent_lookup(self, key: str) -> Optional[Dict[str, Any]]:
+        if self.persistent is None:
+            return None
+        value = self.persistent.get(key)
+        if value is not None:
+            self._stats["persistent_hits"] += 1
+            self.memory.set(key, value)
+        return value
+
+    def _lookup(self, key: str) -> Optional[Dict[str, Any]]:
+        value = self._memory_lookup(key)
+        return value if value is not None else self._persistent_lookup(key)
+
+    def _store(self, key: str, value: Dict[str, Any], seconds: float) -> bool:
+        """Record a miss and cache the rewrite in memory. Returns whether it should also be persisted."""
+        self._stats["misses"] += 1
+        self._stats["llm_seconds"] += seconds
+        # Failed rewrites fall back to the raw query and are retried next time
+        if "error" in value:
+            return False
+        self.memory.set(key, value)
+        return self.persistent is not None
+
+    def rewrite(self, user_input: str) -> Dict[str, Any]:
+        key = self._key(user_input)
+        with self._lock:
+            value = self._lookup(key)
+            if value is not None:
+                return dict(value)
+            future = self._in_flight.get(key)
+            owner = future is None
+            if owner:
+                future = self._in_flight[key] = Future()
+            else:
+                self._stats["coalesced"] += 1
+        if not owner:
+            return dict(future.result())
+
+        start = time.perf_counter()
+        try:
+            value = self.rewriter.rewrite(user_input)
+            future.set_result(value)
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                self._in_flight.pop(key, None)
+        if self._store(key, value, time.perf_counter() - start):
+            self.persistent.set(key, value)
+        return dict(value)
+
+    async def arewrite(self, user_input: str) -> Dict[str, Any]:
+        key = self._key(user_input)
+        value = self._memory_lookup(key)
+        if value is not None:
+            return dict(value)
+        future = self._async_in_flight.get(key)
+        if future is not None:
+            self._stats["coalesced"] += 1
+            return dict(await asyncio.shield(future))
+
+        loop = asyncio.get_running_loop()
+        future = self._async_in_flight[key] = loop.create_future()
+        start = None
+        try:
+            value = await loop.run_in_executor(None, self._persistent_lookup, key)
+            if value is None:
+                start = time.perf_counter()
+                value = await self.rewriter.arewrite(user_input)
+            future.set_result(value)
+        except BaseException as e:
+            future.set_exception(e)
+            # Mark retrieved so an unawaited failure is not reported as never retrieved
+            future.exception()
+            raise
+        finally:
+            self._async_in_flight.pop(key, None)
+        if start is not None and self._store(key, value, time.perf_counter() - start):
+            await loop.run_in_executor(None, self.persistent.set, key, value)
+        return dict(value)
+
+    def stats(self) -> Dict[str, Any]:
+        stats = dict(self._stats)
+        hits = stats["memory_hits"] + stats["persistent_hits"] + stats["coalesced"]
+        lookups = hits + stats["misses"]
+        average_llm_seconds = stats["llm_seconds"] / stats["misses"] if stats["misses"] else 0.0
+        stats.update({
+            "hit_rate": hits / lookups if lookups else 0.0,
+            "time_saved_seconds": hits * average_llm_seconds,
+            "memory_size": len(self.memory),
+        })
+        return stats
+
+
+# === Rule-Based Query Parser ===
+CATEGORY_LEXICON = {
+    "yoga": ["yoga mat", "yoga block", "yoga", "pilates"],
+    "fitness": ["dumbbell", "kettlebell", "resistance band", "treadmill", "gym", "workout"],
+    "electronics": ["earbuds", "earphones", "headphones", "headset", "speaker", "charger", "power bank",
+                    "smartwatch", "laptop", "tablet", "mouse", "keyboard", "bluetooth", "usb", "camera"],
+    "mobiles": ["smartphone", "mobile phone", "iphone", "android phone", "phone case", "screen guard"],
+    "clothing": ["t-shirt", "tshirt", "shirt", "jeans", "kurta", "saree", "dress", "jacket", "hoodie",
+                 "trousers", "leggings"],
+    "footwear": ["shoes", "sneakers", "sandals", "slippers", "boots", "heels", "running shoes"],
+    "kitchen": ["cookware", "pressure cooker", "kadai", "pan", "mixer", "grinder", "kettle", "tiffin",
+                "water bottle", "lunch box"],
+    "home": ["bedsheet", "pillow", "curtain", "mattress", "lamp", "towel", "sofa cover"],
+    "beauty": ["lipstick", "moisturizer", "moisturiser", "shampoo", "serum", "sunscreen", "perfume",
+               "face wash", "trimmer"],
+    "books": ["book", "novel", "notebook"],
+    "toys": ["toy", "lego", "puzzle", "doll"],
+    "bags": ["backpack", "handbag", "wallet", "luggage", "suitcase"],
+}
+
+INTENT_LEXICON = {
+    "cheap": ["cheap", "affordable", "budget", "low cost", "inexpensive", "value for money"],
+    "premium": ["premium", "luxury", "high end", "high-end", "best quality", "top quality", "branded"],
+    "eco-friendly": ["eco-friendly", "eco friendly", "sustainable", "organic", "biodegradable", "natural"],
+    "durable": ["durable", "long lasting", "long-lasting", "sturdy", "heavy duty"],
+    "gift": ["gift", "present"],
+}
+
+# Conversational filler removed from the rewritten query
+FILLER_PATTERN = re.compile(
+    r"\b(i need|i want|i am looking for|i'm looking for|looking for|show me|find me|search for|"
+    r"can you|please|buy|need|want|some|a|an|the|good|for me)\b", re.IGNORECASE)
+
+# Groups per amount: currency prefix, number, thousands "k", currency suffix.
+# Letters after "k" or a currency word mean a different word ("5 kg", "10 rsvp"), not a price.
+_AMOUNT = (r"(₹|\$|(?:rs|inr)(?![a-z])\.?)?\s*(\d[\d,]*(?:\.\d+)?)(?:\s*(k)(?![a-z]))?"
+           r"(?:\s*(₹|(?:rs|inr|rupees|bucks|dollars)(?![a-z])\.?))?")
+# A bare number followed by one of these is a quantity ("under 5 kg", "under 10 years"), not a price
+UNIT_PATTERN = re.compile(
+    r"\s*(?:kgs?|g|gms?|grams?|mg|ml|l|ltrs?|litres?|liters?|cm|mm|inch(?:es)?|ft|feet|gb|tb|mb|mah|"
+    r"w|watts?|v|volts?|hz|years?|yrs?|months?|weeks?|days?|hours?|hrs?|mins?|minutes?|pcs|pieces|pack|"
+    r"people|persons?|seats?|seater)\b", re.IGNORECASE)
+PRICE_PATTERNS = [
+    re.compile(r"\bbetween\s+" + _AMOUNT + r"\s+(?:and|to|-)\s+" + _AMOUNT, re.IGNORECASE),
+    re.compile(r"(?:\bunder|\bbelow|\bless than|\bwithin|\bupto|\bup to|\bmax(?:imum)?|\bbudget(?: of)?|<=?)\s*"
+               + _AMOUNT, re.IGNORECASE),
+]
+
+# Currency symbols are the only non-ASCII characters an English query is expected to contain
+NON_ENGLISH_PATTERN = re.compile(r"[^\x00-\x7F₹€£]")
+
+
+class RuleBasedQueryParser:
+    def __init__(self, category_lexicon: Optional[Dict[str, list]] = None,
+                 intent_lexicon: Optional[Dict[str, list]] = None):
+        """
+        Deterministic regex/lexicon extraction of the `QuerySchema` fields.
+
+        Args:
+            category_lexicon (Dict[str, list], optional): category → trigger phrases.
+            intent_lexicon (Dict[str, list], optional): intent → trigger phrases.
+        """
+        self.categories = self._compile(category_lexicon or CATEGORY_LEXICON)
+        self.intents = self._compile(intent_lexicon or INTENT_LEXICON)
+
+    @staticmethod
+    def _compile(lexicon: Dict[str, list]):
+        # Longest phrases first, so "running shoes" wins over "shoes"
+        phrases = sorted(((phrase, label) for label, items in lexicon.items() for phrase in items),
+                         key=lambda item: len(item[0]), reverse=True)
+        return [(re.compile(r"\b" + re.escape(phrase) + r"\b", re.IGNORECASE), label) for phrase, label in phrases]
+
+    @staticmethod
+    def _amount(number: str, thousands: Optional[str]) -> int:
+        value = float(number.replace(",", ""))
+        return int(value * 1000 if thousands else value)
+
+    @staticmethod
+    def _price_match(pattern, text: str):
+        """First match of a price pattern that is not a bare number with a unit after it."""
+        for match in pattern.finditer(text):
+            groups = match.groups()
+            has_currency = any(groups[i] or groups[i + 3] for i in range(0, len(groups), 4))
+            if has_currency or not UNIT_PATTERN.match(text, match.end()):
+                return match
+        return None
+
+    def parse(self, user_input: str) -> Tuple[Dict[str, Any], float]:
+        """
+        Returns:
+            Tuple[Dict, float]: `QuerySchema` fields and a 0–1 confidence that
+            they capture the query as well as the LLM would.
+        """
+        text = " ".join(user_input.split())
+        if not text or NON_ENGLISH_PATTERN.search(text):
+            return {"query": text, "category": None, "price_max": None, "intent": None}, 0.0
+
+        price_max = None
+        has_currency = False
+        for pattern in PRICE_PATTERNS:
+            match = self._price_match(pattern, text)
+            if match:
+                groups = match.groups()
+                has_currency = any(groups[i] or groups[i + 3] for i in range(0, len(groups), 4))
+                # "between X and Y" caps at Y; "under X" at X
+                number, thousands = groups[-3], groups[-2]
+                price_max = self._amount(number, thousands)
+                text = (text[:match.start()] + text[match.end():]).strip()
+                break
+
+        category = next((label for pattern, label in self.categories if pattern.search(text)), None)
+
+        intent = None
+        for pattern, label in self.intents:
+            if pattern.search(text):
+                intent = label
+                text = pattern.sub("", text)
+                break
+
+        query = " ".join(FILLER_PATTERN.sub(" ", text).split()).strip(" .,!?")
+
+        confidence = 1.0
+        if not query:
+            confidence = 0.0
+        else:
+            if category is None:
+                confidence -= 0.5
+            # "under 500" without ₹/rs is usually a price, but the LLM is surer
+            if price_max is not None and not has_currency:
+                confidence -= 0.2
+            # Long, conversational queries are where the LLM earns its latency
+            if len(query.split()) > 8:
+                confidence -= 0.3
+        return {"query": query, "category": category, "price_max": price_max, "intent": intent}, confidence
+
+
+# === Hybrid Query Parser ===
+class HybridQueryParser:
+    def __init__(self, rewriter=None, rules: Optional[RuleBasedQueryParser] = None, min_confidence: float = 0.6):
+        """
+        Parse locally first and only escalate to the LLM when the rules are
+        unsure or the query is not English.
+
+        Args:
+            rewriter (QueryRewriter | CachedQueryRewriter, optional): LLM fallback.
+                Without one (no API key configured) rule-based output is always used.
+            rules (RuleBasedQueryParser, optional): Local parser.
+            min_confidence (float): Rule confidence needed to skip the LLM.
+        """
+        self.rewriter = rewriter
+        self.rules = rules or RuleBasedQueryParser()
+        self.min_confidence = min_confidence
+        self._stats = {"rules": 0, "llm": 0}
+
+    def _local(self, user_input: str) -> Optional[Dict[str, Any]]:
+        parsed, confidence = self.rules.parse(user_input)
+        if confidence >= self.min_confidence or self.rewriter is None:
+            self._stats["rules"] += 1
+            return parsed
+        self._stats["llm"] += 1
+        return None
+
+    def rewrite(self, user_input: str) -> Dict[str, Any]:
+        parsed = self._local(user_input)
+        return parsed if parsed is not None else self.rewriter.rewrite(user_input)
+
+    async def arewrite(self, user_input: str) -> Dict[str, Any]:
+        parsed = self._local(user_input)
+        return parsed if parsed is not None else await self.rewriter.arewrite(user_input)
+
+    def stats(self) -> Dict[str, Any]:
+        stats = dict(self._stats)
+        if self.rewriter is not None and hasattr(self.rewriter, "stats"):
+            stats["rewrite_cache"] = self.rewriter.stats()
+        return stats
+
 if __name__ == "__main__":
     # Example usage
     rewriter = QueryRewriter()
@@ -0,0 +1,115 @@
+import asyncio
+import functools
+import logging
+import time
+from collections import defaultdict
+
+from Concurrency import QueueFullError
+from Metrics import SEARCH_BATCH_SIZE
+
+logger = logging.getLogger(__name__)
+
+
+class SearchBatcher:
+    def __init__(self, indexer, max_batch_size=32, max_wait_ms=5.0, executor=None, max_pending=256):
+        """
+        Coalesce concurrent searches into batched `ProductSearchIndexer.search_many` calls.
+
+        Queries arriving within `max_wait_ms` of the first one in a batch (or
+        until `max_batch_size` are waiting) share one query-encoder pass, one
+        FAISS matrix search and one cross-encoder `predict`.
+
+        Args:
+            indexer (ProductSearchIndexer): Index to search.
+            max_batch_size (int): Most queries per batch.
+            max_wait_ms (float): How long the first query in a batch waits for company.
+            executor (Concurrency.BoundedExecutor, optional): Where the blocking
+                search runs, subject to its queue limit. Defaults to the event
+                loop's default executor.
+            max_pending (int): Queries allowed to wait for a batch before
+                `QueueFullError` is raised.
+        """
+        self.indexer = indexer
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.executor = executor
+        self.max_pending = max_pending
+        self._queue = None
+        self._worker = None
+
+    def _ensure_started(self):
+        if self._worker is None or self._worker.done():
+            if self._queue is None:
+                self._queue = asyncio.Queue()
+            self._worker = asyncio.get_running_loop().create_task(self._run())
+
+    @property
+    def pending(self):
+        """Queries waiting for a batch."""
+        return self._queue.qsize() if self._queue is not None else 0
+
+    async def search(self, query, top_k=20, return_scores=False, rerank=True, filters=None, timings=None):
+        """
+        Queue one query and wait for its results. Same return value as `ProductSearchIndexer.search`.
+        If given, `timings` receives the milliseconds spent queued and in each stage of its batch.
+        """
+        self._ensure_started()
+        if self._queue.qsize() >= self.max_pending:
+            raise QueueFullError("search")
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put(((top_k, return_scores, rerank), (query, filters), future,
+                               (timings, time.perf_counter())))
+        return await future
+
+    async def _collect(self):
+        batch = [await self._queue.get()]
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = await self._collect()
+
+            # Queries only batch together when they ask for the same kind of results;
+            # differing filters only split the FAISS lookup inside `search_many`
+            groups = defaultdict(list)
+            for options, request, future, timing in batch:
+                groups[options].append((request, future, timing))
+
+            for (top_k, return_scores, rerank), items in groups.items():
+                queries = [query for (query, _), _, _ in items]
+                filters = [query_filters for (_, query_filters), _, _ in items]
+                started = time.perf_counter()
+                batch_timings = {}
+                SEARCH_BATCH_SIZE.observe(len(queries))
+                search = functools.partial(self.indexer.search_many, queries, top_k=top_k,
+                                           return_scores=return_scores, rerank=rerank, filters=filters,
+                                           timings=batch_timings)
+                try:
+                    if self.executor is not None:
+                        results = await self.executor.run(search)
+                    else:
+                        results = await loop.run_in_executor(None, search)
+                except Exception as e:
+                    logger.error("❌ Batched search failed:", exc_info=True)
+                    for _, future, _ in items:
+                        if not future.done():
+                            future.set_exception(e)
+                    continue
+                for (_, future, (timings, enqueued)), result in zip(items, results):
+                    # Every query in a batch shares its stage timings
+                    if timings is not None:
+                        timings["queue"] = round((started - enqueued) * 1000, 2)
+                        timings.update(batch_timings)
+                    if not future.done():
+                        future.set_result(result)
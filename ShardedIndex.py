@@ -0,0 +1,318 @@
+import os
+import json
+import heapq
+import itertools
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+import faiss
+import numpy as np
+
+
+# Inverted lists (and, on FAISS versions that support it, flat codes) are mapped rather than read
+MMAP_FLAGS = faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY | getattr(faiss, "IO_FLAG_MMAP_IFC", 0)
+
+
+def read_shard(path, mmap=True):
+    """Read a shard index, memory-mapped where the index type allows it."""
+    if mmap:
+        try:
+            return faiss.read_index(path, MMAP_FLAGS)
+        except RuntimeError:
+            pass
+    return faiss.read_index(path)
+
+
+def _inner_index(index):
+    """The index an IndexIDMap passes its search (and search parameters) on to."""
+    index = faiss.downcast_index(index)
+    while isinstance(index, (faiss.IndexIDMap, faiss.IndexIDMap2)):
+        index = faiss.downcast_index(index.index)
+    return index
+
+
+def supports_selection(index):
+    """Whether `index.search` can take an id selector; IndexPQ (flat PQ storage) cannot."""
+    return not isinstance(_inner_index(index), faiss.IndexPQ)
+
+
+def _typed_search_params(index):
+    """
+    Empty search parameters of the type `index` accepts. IVF and HNSW
+    indexes reject the generic `faiss.SearchParameters`, and their own types
+    replace the index's nprobe / efSearch, so the current values are copied over.
+    """
+    index = _inner_index(index)
+    if isinstance(index, faiss.IndexIVF):
+        params = faiss.SearchParametersIVF()
+        params.nprobe = index.nprobe
+    elif isinstance(index, faiss.IndexHNSW):
+        params = faiss.SearchParametersHNSW()
+        params.efSearch = index.hnsw.efSearch
+    else:
+        params = faiss.SearchParameters()
+    return params
+
+
+def selection_params(selection, index):
+    """
+    FAISS search parameters for `index` from a picklable selection:
+    {"bitmap"} (a mask of allowed ids, packed little-endian) or
+    {"exclude"} (ids to skip).
+    """
+    if not selection:
+        return None
+    if "bitmap" in selection:
+        bitmap = selection["bitmap"]
+        # The selector takes the length of the packed bitmap in bytes, not the number of ids
+        selector = faiss.IDSelectorBitmap(len(bitmap), faiss.swig_ptr(bitmap))
+        referenced = [selector, bitmap]
+    else:
+        batch = faiss.IDSelectorBatch(selection["exclude"])
+        selector = faiss.IDSelectorNot(batch)
+        referenced = [selector, batch]
+    params = _typed_search_params(index)
+    params.sel = selector
+    # FAISS does not own the selector or its bitmap; keep them alive with the parameters
+    params.referenced_objects = referenced
+    return params
+
+
+def _selected(selection, ids):
+    """Boolean array: which of `ids` (-1 for empty result slots) a picklable selection allows."""
+    if "bitmap" in selection:
+        bitmap = selection["bitmap"]
+        allowed = np.zeros(ids.shape, dtype=bool)
+        inside = (ids >= 0) & ((ids >> 3) < len(bitmap))
+        allowed[inside] = (bitmap[ids[inside] >> 3] >> (ids[inside] & 7)) & 1 == 1
+        return allowed
+    return (ids >= 0) & ~np.isin(ids, selection["exclude"])
+
+
+def search_selected(index, x, k, selection=None, params=None):
+    """
+    `index.search` restricted to the ids a picklable selection allows.
+
+    `params` may hold `selection_params(selection, index)` built in advance.
+    Indexes that cannot take a selector are searched for a growing number of
+    candidates until k of them pass the selection (or the index is exhausted).
+    """
+    if not selection:
+        return index.search(x, k)
+    if isinstance(index, ShardedIndex):
+        return index.search(x, k, params=selection)
+    if supports_selection(index):
+        return index.search(x, k, params=params or selection_params(selection, index))
+
+    fetch = k
+    while True:
+        fetch = min(fetch * 4, index.ntotal)
+        D, I = index.search(x, max(fetch, k))
+        allowed = _selected(selection, I)
+        if fetch >= index.ntotal or (allowed.sum(axis=1) >= k).all():
+            break
+    # Allowed hits first, in score order, padded like FAISS pads a short result
+    order = np.argsort(~allowed, axis=1, kind="stable")[:, :k]
+    allowed = np.take_along_axis(allowed, order, axis=1)
+    D = np.where(allowed, np.take_along_axis(D, order, axis=1), -np.inf).astype("float32")
+    I = np.where(allowed, np.take_along_axis(I, order, axis=1), -1)
+    return D, I
+
+
+def apply_search_params(index, nprobe=None, ef_search=None):
+    params = faiss.ParameterSpace()
+    for name, value in (("nprobe", nprobe), ("efSearch", ef_search)):
+        if value is None:
+            continue
+        try:
+            params.set_index_parameter(index, name, value)
+        except RuntimeError:
+            pass
+
+
+# Shards opened by this worker process, by path
+_worker_shards = {}
+
+
+def _search_shard(path, query_vecs, k, selection, nprobe, ef_search, mmap):
+    index = _worker_shards.get(path)
+    if index is None:
+        index = _worker_shards[path] = read_shard(path, mmap)
+    apply_search_params(index, nprobe, ef_search)
+    return search_selected(index, query_vecs, k, selection)
+
+
+def merge_top_k(shard_results, k):
+    """Merge per-shard (D, I) results, each sorted best first, into the global top-k with a heap."""
+    n = len(shard_results[0][0])
+    D = np.full((n, k), -np.inf, dtype="float32")
+    I = np.full((n, k), -1, dtype="int64")
+    for q in range(n):
+        merged = heapq.merge(*(zip(shard_D[q], shard_I[q]) for shard_D, shard_I in shard_results),
+                             key=lambda hit: -hit[0])
+        for rank, (score, idx) in enumerate(itertools.islice(((s, i) for s, i in merged if i >= 0), k)):
+            D[q, rank] = score
+            I[q, rank] = idx
+    return D, I
+
+
+class ShardedIndex:
+    def __init__(self, directory, num_shards, new_shard, workers=None, mmap=True, fresh=False):
+        """
+        FAISS-like facade over `num_shards` IndexIDMap2 shards on disk.
+        Product FAISS id i lives in shard i % num_shards.
+
+        A serving process never loads the shards itself: searches are
+        scattered to worker processes that open each shard memory-mapped
+        (where FAISS allows), so API workers on one host share pages rather
+        than each holding the catalogue, and the per-shard top-k are merged
+        with a heap. Writes (build, upsert, compaction) load the shards into
+        this process, which then searches them on threads instead.
+
+        Args:
+            directory (str): Directory holding `shard_<i>.faiss` and `shards.json`.
+            num_shards (int): Number of shards.
+            new_shard (Callable[[], faiss.Index]): Creates an empty shard.
+            workers (int, optional): Search processes. Defaults to one per shard.
+            mmap (bool): Memory-map shards in the search processes.
+            fresh (bool): Start from empty shards instead of what is on disk.
+        """
+        self.directory = directory
+        self.num_shards = num_shards
+        self.new_shard = new_shard
+        self.workers = workers or num_shards
+        self.mmap = mmap
+        self.paths = [os.path.join(directory, f"shard_{i}.faiss") for i in range(num_shards)]
+        self.manifest_path = os.path.join(directory, "shards.json")
+        self.nprobe = None
+        self.ef_search = None
+        self._pool = None
+        self._threads = None
+
+        self._manifest = {"ntotal": [0] * num_shards, "is_trained": None}
+        if not fresh and self.exists(directory):
+            with open(self.manifest_path, "r") as f:
+                self._manifest = json.load(f)
+            if len(self._manifest["ntotal"]) != num_shards:
+                raise ValueError(f"❌ {directory} holds {len(self._manifest['ntotal'])} shards, "
+                                 f"expected {num_shards}.")
+            self._shards = None
+        else:
+            self._shards = [new_shard() for _ in range(num_shards)]
+
+    @staticmethod
+    def exists(directory):
+        return os.path.exists(os.path.join(directory, "shards.json"))
+
+    @property
+    def shards(self):
+        """Writable in-process copies of the shards, loaded on first write."""
+        if self._shards is None:
+            self._shards = [faiss.read_index(path) for path in self.paths]
+            for shard in self._shards:
+                apply_search_params(shard, self.nprobe, self.ef_search)
+        return self._shards
+
+    @property
+    def ntotal(self):
+        if self._shards is None:
+            return sum(self._manifest["ntotal"])
+        return sum(shard.ntotal for shard in self._shards)
+
+    @property
+    def is_trained(self):
+        if self._shards is None:
+            return bool(self._manifest["is_trained"])
+        return all(shard.is_trained for shard in self._shards)
+
+    def set_search_params(self, nprobe=None, ef_search=None):
+        self.nprobe = nprobe if nprobe is not None else self.nprobe
+        self.ef_search = ef_search if ef_search is not None else self.ef_search
+        if self._shards is not None:
+            for shard in self._shards:
+                apply_search_params(shard, self.nprobe, self.ef_search)
+
+    def train(self, x):
+        # Every shard shares one trained quantizer, so scores are comparable across shards
+        shards = self.shards
+        if any(shard.ntotal for shard in shards):
+            raise ValueError("❌ Shards can only be trained while empty.")
+        shards[0].train(x)
+        for i in range(1, self.num_shards):
+            shards[i] = faiss.clone_index(shards[0])
+
+    def _shard_of(self, ids):
+        return np.asarray(ids, dtype="int64") % self.num_shards
+
+    def add_with_ids(self, x, ids):
+        ids = np.asarray(ids, dtype="int64")
+        owners = self._shard_of(ids)
+        for i, shard in enumerate(self.shards):
+            mine = owners == i
+            if mine.any():
+                shard.add_with_ids(np.ascontiguousarray(x[mine]), ids[mine])
+
+    def remove_ids(self, selector):
+        # Raises on the first shard for index types that cannot remove ids, before anything changes
+        return sum(shard.remove_ids(selector) for shard in self.shards)
+
+    def reconstruct_batch(self, ids):
+        ids = np.asarray(ids, dtype="int64")
+        owners = self._shard_of(ids)
+        vectors = np.empty((len(ids), self.shards[0].d), dtype="float32")
+        for i, shard in enumerate(self.shards):
+            mine = np.flatnonzero(owners == i)
+            if len(mine):
+                vectors[mine] = shard.reconstruct_batch(ids[mine])
+        return vectors
+
+    def search(self, x, k, params=None):
+        """
+        Search every shard in parallel and merge the per-shard top-k.
+
+        Args:
+            x (np.ndarray): float32 query vectors.
+            k (int): Results per query.
+            params (Dict, optional): Picklable selection, see `selection_params`.
+
+        Returns:
+            Tuple[np.ndarray, np.ndarray]: Scores and FAISS ids, like `faiss.Index.search`.
+        """
+        x = np.ascontiguousarray(x, dtype="float32")
+        if self._shards is not None:
+            if self._threads is None:
+                self._threads = ThreadPoolExecutor(max_workers=self.num_shards, thread_name_prefix="shard")
+            results = list(self._threads.map(lambda shard: search_selected(shard, x, k, params), self._shards))
+        else:
+            if self._pool is None:
+                self._pool = ProcessPoolExecutor(max_workers=self.workers,
+                                                 mp_context=multiprocessing.get_context("spawn"))
+            futures = [self._pool.submit(_search_shard, path, x, k, params, self.nprobe, self.ef_search, self.mmap)
+                       for path, count in zip(self.paths, self._manifest["ntotal"]) if count]
+            results = [future.result() for future in futures]
+        if not results:
+            return np.full((len(x), k), -np.inf, dtype="float32"), np.full((len(x), k), -1, dtype="int64")
+        return merge_top_k(results, k)
+
+    def save(self):
+        if self._shards is None:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        for shard, path in zip(self._shards, self.paths):
+            # Replaced rather than overwritten, so processes mapping the old file keep a consistent view
+            faiss.write_index(shard, f"{path}.tmp")
+            os.replace(f"{path}.tmp", path)
+        self._manifest = {"ntotal": [shard.ntotal for shard in self._shards], "is_trained": self.is_trained}
+        with open(f"{self.manifest_path}.tmp", "w") as f:
+            json.dump(self._manifest, f)
+        os.replace(f"{self.manifest_path}.tmp", self.manifest_path)
+
+    def size_bytes(self):
+        return sum(os.path.getsize(path) for path in self.paths if os.path.exists(path))
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+        if self._threads is not None:
+            self._threads.shutdown(wait=False)
+            self._threads = None
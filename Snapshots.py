@@ -0,0 +1,111 @@
+import os
+import json
+import time
+import shutil
+from contextlib import contextmanager
+
+
+@contextmanager
+def atomic_write(path, mode="w"):
+    """
+    Write to a temporary file next to `path` and rename it over `path` once
+    complete, so readers (and hard links held by published snapshots) never
+    see a partially written file.
+    """
+    tmp_path = f"{path}.tmp"
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(tmp_path, mode) as f:
+        yield f
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+class SnapshotStore:
+    def __init__(self, root="data/snapshots", keep=3):
+        """
+        Versioned, immutable copies of a saved index.
+
+        Each snapshot is a directory `<root>/<version>` holding every index
+        file under a fixed name. `<root>/CURRENT.json` names the published
+        version and is replaced atomically, so a reader always sees one
+        complete snapshot. Files the indexer replaces atomically are
+        hard-linked from the working index (copied across filesystems); files
+        it appends to in place are listed in `publish(copy=...)` and copied,
+        so a snapshot never changes underneath readers. Snapshots are opened
+        read-only, see `index_paths`.
+
+        Args:
+            root (str): Directory holding the snapshots and manifest.
+            keep (int): Snapshots kept on disk, including the current one.
+        """
+        self.root = root
+        self.keep = keep
+        self.manifest_path = os.path.join(root, "CURRENT.json")
+
+    def current(self):
+        """Version of the published snapshot, or None if nothing is published yet."""
+        try:
+            with open(self.manifest_path, "r") as f:
+                return json.load(f)["version"]
+        except FileNotFoundError:
+            return None
+
+    def path(self, version):
+        return os.path.join(self.root, version)
+
+    def index_paths(self, version):
+        """`ProductSearchIndexer` arguments that open a snapshot read-only."""
+        directory = self.path(version)
+        return {
+            "read_only": True,
+            "index_path": os.path.join(directory, "index.faiss"),
+            "id_map_path": os.path.join(directory, "id_map.bin"),
+            "docstore_path": os.path.join(directory, "docstore"),
+        }
+
+    def publish(self, files, copy=()):
+        """
+        Publish files as a new snapshot and make it current.
+
+        Args:
+            files (Dict[str, str]): Source path by name inside the snapshot,
+                see `ProductSearchIndexer.state_files`.
+            copy (Iterable[str]): Names of files that are appended to in place
+                and must be copied rather than hard-linked.
+
+        Returns:
+            str: The new version.
+        """
+        version = time.strftime("%Y%m%d-%H%M%S", time.gmtime()) + f"-{time.time_ns() % 1_000_000_000:09d}"
+        staging = os.path.join(self.root, f".staging-{version}")
+        for name, source in files.items():
+            if not os.path.exists(source):
+                continue
+            target = os.path.join(staging, name)
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            if name in copy:
+                shutil.copy2(source, target)
+                continue
+            try:
+                os.link(source, target)
+            except OSError:
+                shutil.copy2(source, target)
+        os.makedirs(staging, exist_ok=True)
+        os.rename(staging, self.path(version))
+
+        with atomic_write(self.manifest_path) as f:
+            json.dump({"version": version, "published_at": time.time(), "files": sorted(files)}, f)
+        print(f"📸 Published index snapshot {version}.")
+        self._prune()
+        return version
+
+    def _prune(self):
+        """Drop old snapshots and abandoned staging directories. Processes still reading them keep their open files."""
+        current = self.current()
+        entries = sorted(os.listdir(self.root))
+        versions = [name for name in entries if not name.startswith(".") and os.path.isdir(self.path(name))]
+        stale = [name for name in versions[:-self.keep] if name != current]
+        stale += [name for name in entries if name.startswith(".staging-")]
+        for name in stale:
+            shutil.rmtree(self.path(name), ignore_errors=True)
@@ -0,0 +1,118 @@
+import re
+from typing import Optional
+
+
+def convert_doc(doc):
+    doc['id'] = str(doc['_id'])
+    del doc['_id']
+    return doc
+
+
+class TextCleaner:
+    def __init__(self):
+        # You can add custom normalization dictionaries here if needed
+        self.spec_patterns = [
+            (re.compile(r"\b(\d+)[ ]?H\b", re.IGNORECASE), r"\1 hours"),
+            (re.compile(r"\bIPX[\d]+\b", re.IGNORECASE), "water-resistant"),
+            (re.compile(r"\bBT\b", re.IGNORECASE), "Bluetooth"),
+            (re.compile(r"\b(\d{2})K\b", re.IGNORECASE), r"\1,000"),  # 30K → 30,000
+        ]
+        # Compiled once here rather than looked up in re's cache on every call
+        self.html_tag = re.compile(r"<.*?>")
+        self.non_ascii = re.compile(r"[^\x00-\x7F]+")
+        self.price = re.compile(r"₹[\d,]+")
+        self.symbols = re.compile(r"[\*\•\|\~\+\=\_]")
+        self.punctuation = re.compile(r"[.,;:!?]{2,}")
+        self.whitespace = re.compile(r"\s+")
+
+    def clean_text(self, text: Optional[str]) -> str:
+        if not text:
+            return ""
+
+        # Remove HTML tags
+        text = self.html_tag.sub("", text)
+
+        # Remove emojis & non-ASCII
+        text = self.non_ascii.sub(" ", text)
+
+        # Normalize price mentions (₹1999 → "under 2000")
+        text = self.price.sub(" ", text)
+
+        # Apply product spec normalization
+        for pattern, repl in self.spec_patterns:
+            text = pattern.sub(repl, text)
+
+        # Remove special symbols
+        text = self.symbols.sub(" ", text)
+
+        # Remove extra punctuation
+        text = self.punctuation.sub(".", text)
+
+        # Replace multiple spaces with one
+        text = self.whitespace.sub(" ", text)
+
+        # Lowercase and trim
+        return text.strip().lower()
+
+
+cleaner = TextCleaner()
+
+
+PRICE_PATTERN = re.compile(r"\d[\d,]*(?:\.\d+)?")
+
+
+def parse_price(value):
+    """Numeric price from a number or a string like "₹1,299.00"; None if there is none."""
+    if isinstance(value, (int, float)):
+        return float(value)
+    if isinstance(value, str):
+        match = PRICE_PATTERN.search(value)
+        if match:
+            return float(match.group().replace(",", ""))
+    return None
+
+
+def build_product_record(item):
+    """
+    Flatten one Mongo document into a (product_id, cleaned_text, attributes)
+    tuple, or None if it has no text. Attributes hold the filterable `price`
+    and category ladder names.
+    """
+    item = convert_doc(item)
+
+    product_id = item.get('id')
+    title = item.get('title', '')
+    description = item.get('description', '')
+    bullet_points = item.get('bullet_points', '')
+    query = item.get('query', '')
+    caption = ""
+
+    # 🔹 Extract category names from nested ladder structure
+    category_names = []
+    try:
+        if "category" in item and isinstance(item["category"], list):
+            for cat in item["category"]:
+                if "ladder" in cat and isinstance(cat["ladder"], list):
+                    category_names.extend(c.get("name", "") for c in cat["ladder"])
+    except Exception as e:
+        print(f"⚠️ Category parsing failed for {product_id}: {e}")
+
+    # Join all category names into one string
+    category_text = " ".join(category_names)
+
+    # 🔹 Combine all parts into a single string
+    raw_text = f"{title}. {bullet_points}. {description}. {caption}. {query}. {category_text}"
+
+    # 🔹 Clean the final text before embedding
+    cleaned_text = cleaner.clean_text(raw_text)
+
+    if product_id and cleaned_text.strip():
+        attributes = {"price": parse_price(item.get('price')), "categories": category_names}
+        return product_id, cleaned_text, attributes
+    return None
+
+
+def build_product_text(item):
+    """Flatten one Mongo document into a (product_id, cleaned_text) tuple, or None if it has no text."""
+    record = build_product_record(item)
+    return record[:2] if record else None
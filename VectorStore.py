@@ -0,0 +1,54 @@
+import os
+import numpy as np
+
+
+class VectorStore:
+    def __init__(self, path="data/vectors", dimension=384, dtype="float32"):
+        """
+        Append-only on-disk full-precision vectors keyed by FAISS row, used to
+        refine shortlists from a quantized index.
+
+        `<path>.vecs` holds one `dimension`-wide row per FAISS id. The file is
+        memory-mapped, so only shortlisted rows are paged in and API workers
+        on one host share those pages.
+
+        Args:
+            path (str): File prefix for the `.vecs` file.
+            dimension (int): Embedding dimension.
+            dtype (str): Storage precision, "float32" or "float16".
+        """
+        self.vectors_path = f"{path}.vecs"
+        self.dimension = dimension
+        self.dtype = np.dtype(dtype)
+        self._open()
+
+    def _open(self):
+        row_bytes = self.dimension * self.dtype.itemsize
+        size = os.path.getsize(self.vectors_path) // row_bytes if os.path.exists(self.vectors_path) else 0
+        if size:
+            self._vectors = np.memmap(self.vectors_path, dtype=self.dtype, mode="r", shape=(size, self.dimension))
+        else:
+            self._vectors = np.empty((0, self.dimension), dtype=self.dtype)
+
+    def __len__(self):
+        return len(self._vectors)
+
+    def append(self, vectors):
+        """Append vectors as the next rows."""
+        os.makedirs(os.path.dirname(self.vectors_path) or ".", exist_ok=True)
+        with open(self.vectors_path, "ab") as f:
+            # Drops a partial row left by a crash mid-append
+            f.truncate(len(self) * self.dimension * self.dtype.itemsize)
+            f.write(np.ascontiguousarray(vectors, dtype=self.dtype).tobytes())
+        self._open()
+
+    def get(self, rows):
+        """float32 vectors for the given rows; rows outside the store are zeros."""
+        rows = np.asarray(rows, dtype="int64")
+        vectors = np.zeros((len(rows), self.dimension), dtype="float32")
+        valid = np.flatnonzero((rows >= 0) & (rows < len(self)))
+        if len(valid):
+            # Sorted row order keeps memmap reads sequential
+            read_order = valid[np.argsort(rows[valid], kind="stable")]
+            vectors[read_order] = self._vectors[rows[read_order]]
+        return vectors
@@ -1,6 +1,6 @@
 import os
 from dotenv import load_dotenv
-from pymongo import MongoClient
+from pymongo import MongoClient, AsyncMongoClient
 from pymongo.server_api import ServerApi
 
 # Load environment variables
@@ -16,9 +16,17 @@ client = MongoClient(MONGO_URI, server_api=ServerApi('1'))
 db = client[DB_NAME]
 collection = db[COLLECTION_NAME]
 
-# Optional: Test connection
-try:
-    client.admin.command("ping")
-    print("✅ Connected to MongoDB")
-except Exception as e:
-    print("❌ MongoDB connection error:", e)
\ No newline at end of file
+# Async client for request handlers, so Mongo round trips do not block the event loop
+async_client = AsyncMongoClient(MONGO_URI, server_api=ServerApi('1'))
+async_collection = async_client[DB_NAME][COLLECTION_NAME]
+
+# Clients connect lazily, so importing this module never waits on MongoDB
+def ping():
+    """Check the connection; returns True if MongoDB answered."""
+    try:
+        client.admin.command("ping")
+        print("✅ Connected to MongoDB")
+        return True
+    except Exception as e:
+        print("❌ MongoDB connection error:", e)
+        return False
\ No newline at end of file
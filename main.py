@@ -5,16 +5,23 @@ import os
 from bson import ObjectId
 from fastapi.middleware.cors import CORSMiddleware
 
-from fastapi import FastAPI, UploadFile, File, Form
+from fastapi import FastAPI, UploadFile, File, Form, Header, Response
 from fastapi.responses import JSONResponse
-from typing import Optional
-from pydantic import BaseModel
-import shutil
-import uuid
-from Indexer import ProductSearchIndexer
-from QueryParser import QueryRewriter
-from ImageMaster import BLIPCaptionGenerator
-from AudioMaster import AudioSearchPipeline
+from typing import Optional, List
+from pydantic import BaseModel, Field
+import time
+import asyncio
+import logging
+from Indexer import ProductSearchIndexer, RerankCascade
+from QueryParser import QueryRewriter, CachedQueryRewriter, HybridQueryParser
+from SearchBatcher import SearchBatcher
+from Concurrency import BoundedExecutor, AsyncLimiter, QueueFullError
+from Snapshots import SnapshotStore
+from Caching import LRUCache
+from ModelRegistry import ModelRegistry, default_device
+import Metrics
+from Metrics import span, REQUEST_SECONDS, QUEUE_DEPTH, INDEX_VECTORS, INDEX_TOMBSTONES, MODEL_READY
+logger = logging.getLogger(__name__)
 app = FastAPI()
 app.add_middleware(
     CORSMiddleware,
@@ -23,10 +30,128 @@ app.add_middleware(
     allow_methods=["*"],       # Allow all HTTP methods
     allow_headers=["*"],       # Allow all headers
 )
-indexer = ProductSearchIndexer()
-QueryRewriter = QueryRewriter()
-image_master= BLIPCaptionGenerator(device="cuda")
-audio_master = AudioSearchPipeline()
+# Adaptive reranking depth; RERANK_CASCADE=0 reranks every candidate
+cascade = None
+if os.getenv("RERANK_CASCADE", "1") == "1":
+    budget = os.getenv("RERANK_BUDGET_MS")
+    cascade = RerankCascade(skip_margin=float(os.getenv("RERANK_SKIP_MARGIN", "0.15")),
+                            depth_window=float(os.getenv("RERANK_DEPTH_WINDOW", "0.2")),
+                            max_depth=int(os.getenv("RERANK_MAX_DEPTH", "20")),
+                            time_budget_ms=float(budget) if budget else None,
+                            max_tokens=int(os.getenv("RERANK_MAX_TOKENS", "128")))
+snapshots = SnapshotStore(os.getenv("SNAPSHOT_DIR", "data/snapshots"))
+# Per-model CPU inference backends (see InferenceBackends.BACKENDS) and intra-op threads per worker
+INFERENCE_THREADS = int(os.getenv("INFERENCE_THREADS", "0")) or None
+# PRODUCT_BACKEND should match the build's --encoder-backend so upserted products embed like the rest
+TEXT_BACKENDS = {"product": os.getenv("PRODUCT_BACKEND", "torch"), "query": os.getenv("QUERY_BACKEND", "torch"),
+                 "reranker": os.getenv("RERANKER_BACKEND", "torch")}
+
+def load_indexer(models=None):
+    """Open the published snapshot, or the working index under data/ when none is published yet."""
+    version = snapshots.current()
+    paths = snapshots.index_paths(version) if version else {}
+    loaded = ProductSearchIndexer(**paths, models=models, cascade=cascade,
+                                  hybrid=os.getenv("HYBRID_SEARCH", "1") == "1",
+                                  refine_factor=int(os.getenv("REFINE_FACTOR", "0")),
+                                  shard_workers=int(os.getenv("SHARD_WORKERS", "0")) or None,
+                                  use_embedding_cache=False, backends=TEXT_BACKENDS,
+                                  num_threads=INFERENCE_THREADS)
+    loaded.snapshot_version = version
+    return loaded
+
+def load_caption_model():
+    from ImageMaster import BLIPCaptionGenerator
+    return BLIPCaptionGenerator(device=default_device(), backend=os.getenv("CAPTION_BACKEND", "torch"),
+                                num_threads=INFERENCE_THREADS)
+
+def load_transcribe_model():
+    from AudioMaster import AudioSearchPipeline
+    return AudioSearchPipeline(whisper_model_size=os.getenv("WHISPER_MODEL", "base"),
+                               use_gpu=default_device() != "cpu",
+                               backend=os.getenv("WHISPER_BACKEND", "torch"),
+                               fast_decode=os.getenv("WHISPER_FAST_DECODE", "0") == "1",
+                               language=os.getenv("WHISPER_LANGUAGE") or None,
+                               num_threads=INFERENCE_THREADS)
+
+# Throwaway inferences so the first real request does not pay for lazy initialisation
+def warm_up_indexer(loaded):
+    if loaded.get_index_size():
+        loaded.search_many(["warm up"], top_k=1)
+
+def warm_up_caption(model):
+    from PIL import Image
+    model.generate_caption(Image.new("RGB", (384, 384)), max_new_tokens=5)
+
+def warm_up_transcribe(model):
+    import numpy as np
+    model.transcribe_audio(np.zeros(16000, dtype=np.float32))
+
+# Every model loads on first use (or during warm-up); text search only needs the indexer
+models = ModelRegistry()
+models.register("indexer", load_indexer, warmup=warm_up_indexer,
+                on_load=lambda loaded: setattr(search_batcher, "indexer", loaded))
+models.register("caption", load_caption_model, warmup=warm_up_caption)
+models.register("transcribe", load_transcribe_model, warmup=warm_up_transcribe)
+
+# Blocking model inference runs on dedicated bounded pools; async I/O is bounded on the loop.
+# Work beyond a stage's queue limit is rejected with a 503 instead of piling up.
+caption_executor = BoundedExecutor("caption", max_workers=int(os.getenv("CAPTION_WORKERS", "1")),
+                                   max_queue=int(os.getenv("CAPTION_QUEUE", "8")))
+transcribe_executor = BoundedExecutor("transcribe", max_workers=int(os.getenv("TRANSCRIBE_WORKERS", "1")),
+                                      max_queue=int(os.getenv("TRANSCRIBE_QUEUE", "8")))
+# The search batcher runs one batch at a time; its own queue bounds what waits
+search_executor = BoundedExecutor("search", max_workers=1, max_queue=0)
+# Offline /search/batch jobs get their own pool, so a 1000-query batch never holds up interactive /search
+batch_search_executor = BoundedExecutor("search_batch", max_workers=int(os.getenv("SEARCH_BATCH_WORKERS", "1")),
+                                        max_queue=int(os.getenv("SEARCH_BATCH_QUEUE", "2")))
+rewrite_limiter = AsyncLimiter("rewrite", max_concurrency=int(os.getenv("REWRITE_CONCURRENCY", "16")),
+                               max_queue=int(os.getenv("REWRITE_QUEUE", "64")))
+mongo_limiter = AsyncLimiter("mongo", max_concurrency=int(os.getenv("MONGO_CONCURRENCY", "32")),
+                             max_queue=int(os.getenv("MONGO_QUEUE", "128")))
+
+# Concurrent /search requests share encoder, FAISS and reranker passes
+search_batcher = SearchBatcher(
+    None,  # set when the indexer model loads
+    max_batch_size=int(os.getenv("SEARCH_MAX_BATCH_SIZE", "32")),
+    max_wait_ms=float(os.getenv("SEARCH_BATCH_WINDOW_MS", "5")),
+    executor=search_executor,
+    max_pending=int(os.getenv("SEARCH_QUEUE", "256")),
+)
+# Head-heavy query traffic: repeat rewrites come from cache instead of a Gemini round trip
+try:
+    llm_rewriter = CachedQueryRewriter(
+        QueryRewriter(),
+        max_size=int(os.getenv("REWRITE_CACHE_SIZE", "10000")),
+        ttl=float(os.getenv("REWRITE_CACHE_TTL", "86400")),
+        persistent_path=os.getenv("REWRITE_CACHE_PATH"),
+    )
+except ValueError as e:
+    print(f"⚠️ {e} Falling back to rule-based query parsing only.")
+    llm_rewriter = None
+# Most queries are parsed locally; only low-confidence or non-English ones reach the LLM
+QueryRewriter = HybridQueryParser(llm_rewriter, min_confidence=float(os.getenv("RULE_PARSER_MIN_CONFIDENCE", "0.6")))
+
+# Read by the Prometheus gauges at scrape time
+for name, stage in (("caption", caption_executor), ("transcribe", transcribe_executor),
+                    ("search_batch", batch_search_executor), ("rewrite", rewrite_limiter),
+                    ("mongo", mongo_limiter)):
+    QUEUE_DEPTH.labels(name).set_function(lambda stage=stage: stage.in_flight)
+QUEUE_DEPTH.labels("search").set_function(lambda: search_batcher.pending)
+INDEX_VECTORS.set_function(lambda: models.peek("indexer").get_index_size() if models.is_ready("indexer") else 0)
+INDEX_TOMBSTONES.set_function(lambda: len(models.peek("indexer").tombstones) if models.is_ready("indexer") else 0)
+for name in ("indexer", "caption", "transcribe"):
+    MODEL_READY.labels(name).set_function(lambda name=name: models.is_ready(name))
+
+# Under `gunicorn --preload` these load once in the master and are shared copy-on-write by the workers
+PRELOAD_MODELS = [name for name in os.getenv("PRELOAD_MODELS", "").split(",") if name]
+if PRELOAD_MODELS:
+    models.preload(PRELOAD_MODELS)
+
+@app.exception_handler(QueueFullError)
+async def queue_full_handler(request, exc):
+    return JSONResponse(status_code=503, headers={"Retry-After": "1"},
+                        content={"error": f"Server busy: {exc.stage} queue is full. Retry shortly."})
+
 def load_data(path):
     data = pd.read_csv(path)
     return data
@@ -58,81 +183,251 @@ def read_items():
 # @app.get("/items/{ids}")
 from bson import ObjectId
 
+# Only the fields the UI renders are fetched; hot products are served from memory
+PRODUCT_PROJECTION = {field: 1 for field in
+                      os.getenv("PRODUCT_FIELDS", "title,price,images,image,url,rating,category").split(",") if field}
+product_cache = LRUCache(max_size=int(os.getenv("PRODUCT_CACHE_SIZE", "50000")),
+                         ttl=float(os.getenv("PRODUCT_CACHE_TTL", "300")))
+
+def _cached_products(ids):
+    """Split ids into cached documents and ids still to fetch."""
+    found, missing = {}, []
+    for pid in ids:
+        item = product_cache.get(pid)
+        if item is None:
+            missing.append(pid)
+        else:
+            found[pid] = item
+    return found, missing
+
+def _store_product(found, item):
+    item["id"] = str(item["_id"])
+    del item["_id"]
+    product_cache.set(item["id"], item)
+    found[item["id"]] = item
+
+def _in_rank_order(ids, found):
+    # $in returns documents in arbitrary order; search order is the ranking. Copies keep the cache intact.
+    return [dict(found[pid]) for pid in ids if pid in found]
+
 def get_items(ids):
     try:
-        # Convert string IDs to ObjectId instances
-        object_ids = [ObjectId(id.strip()) for id in ids]
-
-        # Query using ObjectId
-        cursor = db.collection.find({"_id": {"$in": object_ids}})
-        items = []
+        ids = [id.strip() for id in ids]
+        found, missing = _cached_products(ids)
+        if missing:
+            # Convert string IDs to ObjectId instances
+            object_ids = [ObjectId(id) for id in missing]
+            for item in db.collection.find({"_id": {"$in": object_ids}}, PRODUCT_PROJECTION):
+                _store_product(found, item)
+        return _in_rank_order(ids, found)
 
-        for item in cursor:
-            item["id"] = str(item["_id"])
-            del item["_id"]
-            items.append(item)
+    except Exception as e:
+        return {"error": str(e)}
 
-        return items
+async def aget_items(ids):
+    """Async `get_items` for request handlers."""
+    try:
+        ids = [id.strip() for id in ids]
+        found, missing = _cached_products(ids)
+        if missing:
+            object_ids = [ObjectId(id) for id in missing]
+            async with mongo_limiter:
+                async for item in db.async_collection.find({"_id": {"$in": object_ids}}, PRODUCT_PROJECTION):
+                    _store_product(found, item)
+        return _in_rank_order(ids, found)
 
+    except QueueFullError:
+        raise
     except Exception as e:
         return {"error": str(e)}
+
+async def _timed(timings, stage, awaitable):
+    """Await a stage and record its wall time in milliseconds."""
+    with span(stage, timings):
+        return await awaitable
+
+UPLOAD_CHUNK_SIZE = 64 * 1024
+
+# Uploads are decoded straight from the request body; nothing is written to disk
+def _caption_upload(upload):
+    return models.get("caption").generate_caption(upload.file)
+
+def _transcribe_upload(upload):
+    audio_master = models.get("transcribe")
+    chunks = iter(lambda: upload.file.read(UPLOAD_CHUNK_SIZE), b"")
+    # Undecodable audio is dropped like a failed transcription, leaving the text and image inputs
+    try:
+        waveform = audio_master.decode_audio_stream(chunks)
+    except Exception:
+        logger.warning("⚠️ Could not decode voice upload", exc_info=True)
+        return None
+    return audio_master.process(waveform)
+
 @app.post("/search")
 async def handle_input(
+    response: Response,
     text: Optional[str] = Form(None),
     image:  UploadFile | str | None = File(None),
-    voice: UploadFile | str | None = File(None)
+    voice: UploadFile | str | None = File(None),
+    x_profile: Optional[str] = Header(None)
 ):
     if not text and not image and not voice:
         return JSONResponse(status_code=400, content={"error": "No input provided"})
     result = {}
-    q = ""
-    # Handle text input
-    if text:
-        q = q + text
+    timings = {}
+    # Queue wait, encoding, FAISS, BM25, docstore and reranking inside the batched search
+    search_timings = {}
+    request_start = time.perf_counter()
 
-    # === Handle Image ===
+    # === Handle Image and Voice ===
+    # Independent stages run concurrently, so latency is the slowest one rather than the sum
+    stages = []
     if image:
-        image_path = f"temp_{uuid.uuid4()}_{image.filename}"
-        with open(image_path, "wb") as buffer:
-            shutil.copyfileobj(image.file, buffer)
-        
         # You can add preprocessing logic here (e.g., image classification)
-        # result["image_stored_as"] = image_path
-        q_image= image_master.generate_caption(image_path)
-        print(q_image)
-        q = q + " " + q_image
-        # Delete after processing
-        os.remove(image_path)
-
-    # === Handle Voice ===
+        stages.append(_timed(timings, "caption",
+                             caption_executor.run(_caption_upload, image)))
     if voice:
-        voice_path = f"temp_{uuid.uuid4()}_{voice.filename}"
-        with open(voice_path, "wb") as buffer:
-            shutil.copyfileobj(voice.file, buffer)
-        
         # You can add voice processing logic here (e.g., speech-to-text)
-        # result["voice_stored_as"] = voice_path
-        q_audio=audio_master.process(voice_path)
-        q = q + " " + q_audio
-        print(q_audio)
+        stages.append(_timed(timings, "transcribe",
+                             transcribe_executor.run(_transcribe_upload, voice)))
+    stage_outputs = await asyncio.gather(*stages)
+    logger.debug("Caption/transcript: %s", stage_outputs)
+
+    # Handle text input, then append caption and transcript
+    q = " ".join(part for part in [text, *stage_outputs] if part)
 
-        # Delete after processing
-        os.remove(voice_path)
     # === Search Logic ===
-    structured_query = QueryRewriter.rewrite(q)
+    async with rewrite_limiter:
+        structured_query = await _timed(timings, "rewrite", QueryRewriter.arewrite(q))
     super_query = " ".join([
     structured_query.get("query") or "",
     structured_query.get("category") or "",
     structured_query.get("intent") or ""
 ]).strip()
-    print(super_query)
-    search_ids = indexer.search(super_query)
-    print(search_ids)
-    products = get_items(search_ids)
+    logger.debug("Search query: %s", super_query)
+    # Structured constraints filter inside the vector search instead of only shaping the query text
+    filters = {"price_max": structured_query.get("price_max"), "category": structured_query.get("category")}
+    await models.aget("indexer")
+    search_ids = await _timed(timings, "search", search_batcher.search(super_query, filters=filters,
+                                                                       timings=search_timings))
+    logger.debug("Search results: %s", search_ids)
+    products = await _timed(timings, "hydrate", aget_items(search_ids))
+    elapsed = time.perf_counter() - request_start
+    REQUEST_SECONDS.labels("search").observe(elapsed)
+    timings["total"] = round(elapsed * 1000, 2)
     result["products"] = products
     result["structured_query"] = structured_query
+    result["timings_ms"] = timings
+    # Opt-in per-request breakdown: `X-Profile: 1`
+    if x_profile == "1":
+        result["profile_ms"] = {**timings, "search_stages": search_timings}
+        response.headers["Server-Timing"] = ", ".join(
+            f"{stage};dur={ms}" for stage, ms in {**timings, **search_timings}.items())
     return result
 
+class BatchSearchRequest(BaseModel):
+    queries: List[str] = Field(..., min_length=1, max_length=1000)
+    top_k: int = Field(20, ge=1, le=200)
+    rerank: bool = True
+    return_scores: bool = False
+    price_max: Optional[float] = None
+    category: Optional[str] = None
+
+
+# Runs on its own bounded pool; requests beyond SEARCH_BATCH_QUEUE are rejected with a 503
+@app.post("/search/batch")
+async def search_batch(request: BatchSearchRequest):
+    with REQUEST_SECONDS.labels("search_batch").time():
+        indexer = await models.aget("indexer")
+        results = await batch_search_executor.run(indexer.search_many, request.queries, top_k=request.top_k,
+                                            return_scores=request.return_scores, rerank=request.rerank,
+                                            filters={"price_max": request.price_max, "category": request.category})
+    if request.return_scores:
+        results = [[{"id": pid, "score": float(score)} for pid, score in query_results] for query_results in results]
+    return {"results": [{"query": query, "products": query_results}
+                        for query, query_results in zip(request.queries, results)]}
+
+# Swapping the indexer is one reference assignment on the event loop; searches already
+# running hold the old indexer and finish on it, so it is only closed after a grace period
+SNAPSHOT_POLL_SECONDS = float(os.getenv("SNAPSHOT_POLL_SECONDS", "30"))
+SNAPSHOT_RETIRE_SECONDS = float(os.getenv("SNAPSHOT_RETIRE_SECONDS", "60"))
+reload_lock = asyncio.Lock()
+
+async def reload_index():
+    """Load the published snapshot with the already loaded models and swap it in. Returns whether it changed."""
+    async with reload_lock:
+        retired = models.peek("indexer")
+        # An indexer that has not loaded yet will open the current snapshot when it does
+        if retired is None or snapshots.current() in (None, retired.snapshot_version):
+            return False
+        loop = asyncio.get_running_loop()
+        loaded = await loop.run_in_executor(None, load_indexer, retired.models)
+        models.replace("indexer", loaded)
+        loop.call_later(SNAPSHOT_RETIRE_SECONDS, retired.close)
+        # A rebuilt catalogue may have changed product documents
+        product_cache.clear()
+        print(f"🔄 Swapped in index snapshot {loaded.snapshot_version} ({loaded.get_index_size()} products).")
+        return True
+
+async def watch_snapshots():
+    while True:
+        await asyncio.sleep(SNAPSHOT_POLL_SECONDS)
+        try:
+            await reload_index()
+        except Exception as e:
+            print(f"❌ Loading index snapshot failed, keeping the current one: {e}")
+
+@app.on_event("startup")
+async def start_snapshot_watcher():
+    if SNAPSHOT_POLL_SECONDS > 0:
+        asyncio.get_running_loop().create_task(watch_snapshots())
+
+# Loaded in this order after startup, so text search is ready before BLIP and Whisper
+WARMUP_MODELS = [name for name in os.getenv("WARMUP_MODELS", "indexer,caption,transcribe").split(",") if name]
+
+@app.on_event("startup")
+async def start_model_warmup():
+    if WARMUP_MODELS:
+        models.warm_up_in_background(WARMUP_MODELS)
+
+@app.get("/ready")
+def ready():
+    """Ready once text search can be served; image and voice report their own state."""
+    modalities = {"text": models.is_ready("indexer"), "image": models.is_ready("caption"),
+                  "voice": models.is_ready("transcribe")}
+    return JSONResponse(status_code=200 if modalities["text"] else 503,
+                        content={"ready": modalities["text"], "modalities": modalities, "models": models.status()})
+
+@app.post("/admin/reload")
+async def admin_reload(x_admin_token: Optional[str] = Header(None)):
+    admin_token = os.getenv("ADMIN_TOKEN")
+    if admin_token and x_admin_token != admin_token:
+        return JSONResponse(status_code=403, content={"error": "Invalid admin token"})
+    reloaded = await reload_index()
+    current = models.peek("indexer")
+    return {"reloaded": reloaded, "version": current.snapshot_version if current else None,
+            "size": current.get_index_size() if current else 0}
+
+def _rewrite_cache_stats():
+    stats = QueryRewriter.stats().get("rewrite_cache")
+    if stats is None:
+        return None
+    return {"hits": stats["memory_hits"] + stats["persistent_hits"] + stats["coalesced"],
+            "misses": stats["misses"], "size": stats["memory_size"]}
+
+Metrics.caches.add("product", lambda: {"hits": product_cache.hits, "misses": product_cache.misses,
+                                       "size": len(product_cache)})
+Metrics.caches.add("rewrite", _rewrite_cache_stats)
+
+@app.get("/metrics")
+def metrics():
+    payload, content_type = Metrics.render()
+    return Response(content=payload, media_type=content_type)
+
+@app.get("/stats")
+def stats():
+    return {"query_parser": QueryRewriter.stats(), "product_cache": {"size": len(product_cache)}}
+
 @app.get("/")
 def read_root():
     data = load_data('./amazon_products.csv')
@@ -0,0 +1,98 @@
+import os
+import sys
+import zlib
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# db.py needs a database name at import; clients connect lazily and tests swap in local collections
+os.environ.setdefault("MONGODB_DB_NAME", "test")
+os.environ.setdefault("MONGODB_COLLECTION", "products")
+
+from Indexer import ProductSearchIndexer
+
+
+DIMENSION = 384
+
+
+class HashEncoder:
+    """Deterministic stand-in for a SentenceTransformer: a normalised sum of per-word random vectors."""
+
+    def encode(self, texts, batch_size=32, normalize_embeddings=True, **kwargs):
+        embeddings = np.zeros((len(texts), DIMENSION), dtype="float32")
+        for row, text in enumerate(texts):
+            for word in text.lower().split():
+                embeddings[row] += np.random.default_rng(zlib.crc32(word.encode())).standard_normal(DIMENSION)
+        norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+        return embeddings / np.where(norms > 0, norms, 1)
+
+
+class OverlapReranker:
+    """Stand-in for a CrossEncoder: scores a pair by the words query and text share."""
+
+    def predict(self, pairs, **kwargs):
+        return np.array([len(set(query.lower().split()) & set(text.lower().split())) for query, text in pairs],
+                        dtype="float32")
+
+
+COLOURS = ["red", "blue", "green", "black", "white", "grey", "pink", "brown"]
+ITEMS = [("yoga mat", "Yoga"), ("running shoes", "Footwear"), ("water bottle", "Kitchen"),
+         ("wireless earbuds", "Electronics"), ("cotton kurta", "Clothing")]
+
+
+def product_id(i):
+    # The all-zero ObjectId is reserved by IdMap
+    return f"{i + 1:024x}"
+
+
+def catalogue(size=400):
+    """(product_id, text, attributes) tuples with varied texts, prices and categories."""
+    products = []
+    for i in range(size):
+        item, category = ITEMS[i % len(ITEMS)]
+        colour = COLOURS[(i // len(ITEMS)) % len(COLOURS)]
+        text = f"{colour} {item} model{i}"
+        products.append((product_id(i), text, {"price": float(100 + (i * 37) % 900), "categories": [category]}))
+    return products
+
+
+@pytest.fixture(scope="session")
+def tiny_model_path(tmp_path_factory):
+    """A randomly initialised one-layer SentenceTransformer saved to disk, for code that loads models by name."""
+    import torch
+    from sentence_transformers import SentenceTransformer, models
+    from transformers import BertConfig, BertModel, BertTokenizer
+
+    root = tmp_path_factory.mktemp("tiny_model")
+    words = sorted({word for _, text, _ in catalogue() for word in text.split()})
+    (root / "vocab.txt").write_text("\n".join(["[PAD]", "[UNK]", "[CLS]", "[SEP]", "[MASK]", *words]))
+    torch.manual_seed(0)
+    config = BertConfig(vocab_size=len(words) + 5, hidden_size=DIMENSION, num_hidden_layers=1,
+                        num_attention_heads=4, intermediate_size=64)
+    BertModel(config).save_pretrained(root / "bert")
+    BertTokenizer(str(root / "vocab.txt")).save_pretrained(root / "bert")
+    SentenceTransformer(modules=[models.Transformer(str(root / "bert")), models.Pooling(DIMENSION)]).save(
+        str(root / "model"))
+    return str(root / "model")
+
+
+@pytest.fixture
+def make_indexer(tmp_path):
+    """Build a `ProductSearchIndexer` under tmp_path with the stand-in models."""
+    models = (HashEncoder(), HashEncoder(), OverlapReranker())
+    opened = []
+
+    def make(directory="index", **kwargs):
+        root = tmp_path / directory
+        root.mkdir(exist_ok=True)
+        kwargs.setdefault("use_embedding_cache", False)
+        kwargs.setdefault("models", models)
+        indexer = ProductSearchIndexer(index_path=str(root / "index.faiss"), id_map_path=str(root / "id_map.json"),
+                                       **kwargs)
+        opened.append(indexer)
+        return indexer
+
+    yield make
+    for indexer in opened:
+        indexer.close()
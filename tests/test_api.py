@@ -0,0 +1,169 @@
+import asyncio
+import time
+from types import SimpleNamespace
+
+import httpx
+import pytest
+
+import db
+from Benchmark import LocalCollection, SyntheticCatalogue
+from Caching import LRUCache
+from IndexCreaterScript import build_index
+from ModelRegistry import ModelRegistry
+from QueryParser import HybridQueryParser
+from SearchBatcher import SearchBatcher
+
+
+class StubCaptioner:
+    """Stand-in for `BLIPCaptionGenerator` that remembers the image bytes it was given."""
+
+    def __init__(self, caption="yoga mat", delay=0.0):
+        self.caption = caption
+        self.delay = delay
+        self.images = []
+
+    def generate_caption(self, image):
+        self.images.append(image.read())
+        time.sleep(self.delay)
+        return self.caption
+
+
+class StubTranscriber:
+    """Stand-in for `AudioSearchPipeline`; audio that is not `b"RIFF..."` fails to decode."""
+
+    def __init__(self, transcript="running shoes", delay=0.0):
+        self.transcript = transcript
+        self.delay = delay
+        self.audio = []
+
+    def decode_audio_stream(self, chunks):
+        data = b"".join(chunks)
+        self.audio.append(data)
+        if not data.startswith(b"RIFF"):
+            raise RuntimeError("invalid data found when processing input")
+        return data
+
+    def process(self, waveform):
+        time.sleep(self.delay)
+        return self.transcript
+
+
+@pytest.fixture
+def api(monkeypatch, make_indexer):
+    import main
+
+    catalogue = SyntheticCatalogue(200)
+    collection = LocalCollection(catalogue)
+    monkeypatch.setattr(db, "collection", collection)
+    monkeypatch.setattr(db, "async_collection", collection)
+    indexer = make_indexer(index_type="flat")
+    build_index(indexer, chunk_size=128)
+
+    captioner, transcriber = StubCaptioner(delay=0.3), StubTranscriber(delay=0.3)
+    registry = ModelRegistry()
+    registry.register("indexer", lambda: indexer)
+    registry.register("caption", lambda: captioner)
+    registry.register("transcribe", lambda: transcriber)
+    monkeypatch.setattr(main, "models", registry)
+    # The module's batcher binds to the first event loop it runs on; each test gets its own
+    monkeypatch.setattr(main, "search_batcher", SearchBatcher(indexer, max_wait_ms=1))
+    monkeypatch.setattr(main, "QueryRewriter", HybridQueryParser(None))
+    monkeypatch.setattr(main, "product_cache", LRUCache())
+    return SimpleNamespace(main=main, catalogue=catalogue, captioner=captioner, transcriber=transcriber)
+
+
+# Each call runs its own event loop, so a test makes at most one /search request
+def request(api, method, path, **kwargs):
+    async def send():
+        transport = httpx.ASGITransport(app=api.main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            return await client.request(method, path, **kwargs)
+
+    return asyncio.run(send())
+
+
+def test_image_and_voice_stages_run_concurrently(api):
+    files = {"image": ("mat.png", b"PNG image", "image/png"), "voice": ("shoes.wav", b"RIFF audio", "audio/wav")}
+
+    start = time.perf_counter()
+    response = request(api, "POST", "/search", data={"text": "blue"}, files=files)
+    elapsed = time.perf_counter() - start
+
+    assert response.status_code == 200
+    timings = response.json()["timings_ms"]
+    assert timings["caption"] >= 300 and timings["transcribe"] >= 300
+    assert elapsed < 0.55
+    assert response.json()["products"]
+
+
+def test_uploads_are_decoded_from_the_request_body(api, tmp_path_factory, monkeypatch):
+    workdir = tmp_path_factory.mktemp("workdir")
+    monkeypatch.chdir(workdir)
+    audio = b"RIFF" + bytes(200 * 1024)
+    files = {"image": ("mat.png", b"PNG image", "image/png"), "voice": ("shoes.wav", audio, "audio/wav")}
+
+    response = request(api, "POST", "/search", files=files)
+
+    assert response.status_code == 200
+    assert api.captioner.images == [b"PNG image"] and api.transcriber.audio == [audio]
+    assert list(workdir.iterdir()) == []
+
+
+def test_undecodable_voice_is_dropped_and_text_still_searches(api):
+    files = {"voice": ("noise.wav", b"not audio", "audio/wav")}
+
+    response = request(api, "POST", "/search", data={"text": "blue yoga mat"}, files=files)
+
+    assert response.status_code == 200
+    assert api.transcriber.audio == [b"not audio"]
+    assert "running" not in response.json()["structured_query"]["query"]
+    assert response.json()["products"]
+
+
+def test_batch_search_returns_scored_filtered_results_per_query(api):
+    queries = [query for query, _ in api.catalogue.queries(5)]
+
+    response = request(api, "POST", "/search/batch",
+                       json={"queries": queries, "top_k": 5, "return_scores": True, "price_max": 5000})
+
+    assert response.status_code == 200
+    results = response.json()["results"]
+    assert [result["query"] for result in results] == queries
+    for result in results:
+        assert 0 < len(result["products"]) <= 5
+        scores = [product["score"] for product in result["products"]]
+        assert scores == sorted(scores, reverse=True)
+        prices = [api.catalogue._fields(SyntheticCatalogue.position(product["id"]))["price"]
+                  for product in result["products"]]
+        assert max(prices) <= 5000
+
+
+def test_batch_search_rejects_oversized_batches(api):
+    response = request(api, "POST", "/search/batch", json={"queries": ["yoga mat"] * 1001})
+
+    assert response.status_code == 422
+
+
+@pytest.mark.parametrize("profile", [True, False])
+def test_profile_header_returns_the_stage_breakdown(api, profile):
+    headers = {"X-Profile": "1"} if profile else {}
+
+    response = request(api, "POST", "/search", data={"text": "blue yoga mat"}, headers=headers)
+
+    assert ("profile_ms" in response.json()) == profile == ("Server-Timing" in response.headers)
+    if profile:
+        breakdown = response.json()["profile_ms"]
+        assert {"rewrite", "search", "hydrate", "total"} <= set(breakdown)
+        assert breakdown["search_stages"]["queue"] >= 0
+        assert response.headers["Server-Timing"].startswith("rewrite;dur=")
+
+def test_metrics_endpoint_exports_stages_queues_and_caches(api):
+    request(api, "POST", "/search", data={"text": "blue yoga mat"})
+
+    response = request(api, "GET", "/metrics")
+
+    assert response.status_code == 200
+    for name in ('intentsearch_stage_seconds_count{stage="rewrite"}', 'intentsearch_queue_depth{stage="caption"}',
+                 "intentsearch_index_vectors 200.0", 'intentsearch_cache_lookups_total{cache="product",result="miss"}',
+                 'intentsearch_model_ready{model="indexer"} 1.0'):
+        assert name in response.text
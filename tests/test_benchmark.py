@@ -0,0 +1,50 @@
+import argparse
+import json
+
+import db
+from Benchmark import LocalCollection, SyntheticCatalogue, compare, flatten, run
+
+
+def test_synthetic_catalogue_is_deterministic():
+    catalogue = SyntheticCatalogue(100, seed=3)
+
+    assert catalogue.document(42) == SyntheticCatalogue(100, seed=3).document(42)
+    assert catalogue.queries(10) == SyntheticCatalogue(100, seed=3).queries(10)
+    assert [catalogue.position(catalogue.object_id(i)) for i in (0, 1, 99)] == [0, 1, 99]
+    assert str(catalogue.object_id(0)) != "0" * 24
+
+
+def test_local_collection_answers_the_indexer_and_api_queries():
+    catalogue = SyntheticCatalogue(20)
+    collection = LocalCollection(catalogue)
+    ids = [catalogue.object_id(i) for i in (7, 3, 25)]
+
+    assert [doc["_id"] for doc in collection.find({"_id": {"$in": ids}}, {"title": 1})] == ids[:2]
+    assert set(next(collection.find({}, {"title": 1}))) == {"_id", "title"}
+    assert len(list(collection.find({"_id": {"$gt": catalogue.object_id(14)}}).sort("_id"))) == 5
+
+
+def test_run_reports_every_setting(monkeypatch, tmp_path):
+    import main
+
+    for name in ("collection", "async_collection"):
+        monkeypatch.setattr(db, name, getattr(db, name))
+    monkeypatch.setattr(main, "QueryRewriter", main.QueryRewriter)
+    args = argparse.Namespace(size=300, seed=0, configs=["flat", "hnsw:int8"], shards=None, no_hybrid=False,
+                              stub_models=True, queries=30, k=10, top_k=20, concurrency=[1, 4], requests=20,
+                              rewrite_latency_ms=0.0, ann_sample=0, chunk_size=128, batch_size=100,
+                              encode_batch_size=64, workers=1, workdir=str(tmp_path / "work"),
+                              output=str(tmp_path / "results.json"), compare=None)
+
+    results = run(args)
+
+    assert json.loads((tmp_path / "results.json").read_text())["configs"][0]["name"] == "flat"
+    for config in results["configs"]:
+        assert config["build"]["products"] == 300
+        assert [row["setting"] for row in config["search"]] == ["dense_only", "full_rerank", "cascade_rerank"]
+        assert [row["concurrency"] for row in config["concurrency"]] == [1, 4]
+        assert all(row["errors"] == 0 for row in config["concurrency"])
+    metrics = flatten(results)
+    # Known-item queries find their product with the stand-in models too
+    assert all(value >= 0.5 for key, value in metrics.items() if key.endswith("recall_at_k"))
+    compare(results, results)
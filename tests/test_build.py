@@ -0,0 +1,117 @@
+import pytest
+
+import db
+from Benchmark import LocalCollection, SyntheticCatalogue
+from IndexCreaterScript import Checkpoint, StageTimer, build_index, chunked, iter_cleaned, iter_products, prune_deleted
+
+
+def use_catalogue(monkeypatch, size):
+    catalogue = SyntheticCatalogue(size)
+    monkeypatch.setattr(db, "collection", LocalCollection(catalogue))
+    return catalogue
+
+
+def test_chunked_keeps_the_remainder():
+    assert list(chunked(range(7), 3)) == [[0, 1, 2], [3, 4, 5], [6]]
+    assert list(chunked([], 3)) == []
+
+
+def test_products_stream_as_cleaned_records(monkeypatch):
+    use_catalogue(monkeypatch, 5)
+
+    products = list(iter_cleaned(iter_products(batch_size=2)))
+
+    assert [pid for pid, _, _ in products] == [str(SyntheticCatalogue.object_id(i)) for i in range(5)]
+    assert all(text and attributes["categories"] for _, text, attributes in products)
+
+
+def test_build_index_streams_bounded_chunks(monkeypatch, make_indexer):
+    catalogue = use_catalogue(monkeypatch, 230)
+    indexer = make_indexer(index_type="flat")
+    added = []
+    add_embeddings = indexer.add_embeddings
+
+    def record(product_ids, *args, **kwargs):
+        added.append(len(product_ids))
+        return add_embeddings(product_ids, *args, **kwargs)
+
+    monkeypatch.setattr(indexer, "add_embeddings", record)
+    timer = StageTimer()
+
+    indexed = build_index(indexer, chunk_size=64, batch_size=50, encode_batch_size=16, timer=timer)
+
+    assert indexed == indexer.get_index_size() == 230
+    assert added == [64, 64, 64, 38]
+    assert timer.docs["fetch"] == timer.docs["clean"] == timer.docs["encode"] == 230
+    query, pid = catalogue.query(17)
+    assert pid in indexer.search(query, top_k=5, rerank=False)
+
+
+def test_checkpoint_round_trip(tmp_path):
+    path = str(tmp_path / "checkpoint.json")
+    checkpoint = Checkpoint(path)
+    assert checkpoint.query() == {}
+
+    list(checkpoint.track([{"_id": SyntheticCatalogue.object_id(3)}, {"_id": SyntheticCatalogue.object_id(9)}]))
+    checkpoint.save()
+
+    reloaded = Checkpoint(path)
+    assert reloaded.value == SyntheticCatalogue.object_id(9)
+    assert reloaded.query() == {"_id": {"$gt": SyntheticCatalogue.object_id(9)}}
+    # A watermark over another field is not comparable
+    assert Checkpoint(path, field="updated_at").value is None
+
+
+def test_incremental_build_indexes_only_new_documents(monkeypatch, make_indexer, tmp_path):
+    path = str(tmp_path / "checkpoint.json")
+    use_catalogue(monkeypatch, 150)
+    indexer = make_indexer(index_type="flat")
+    assert build_index(indexer, chunk_size=64, checkpoint=Checkpoint(path)) == 150
+
+    catalogue = use_catalogue(monkeypatch, 230)
+    assert build_index(indexer, chunk_size=64, checkpoint=Checkpoint(path)) == 80
+
+    assert indexer.get_index_size() == 230
+    query, pid = catalogue.query(200)
+    assert pid in indexer.search(query, top_k=5, rerank=False)
+
+
+def test_interrupted_build_resumes_from_the_last_checkpoint(monkeypatch, make_indexer, tmp_path):
+    path = str(tmp_path / "checkpoint.json")
+    use_catalogue(monkeypatch, 230)
+    indexer = make_indexer(index_type="flat")
+    add_embeddings = indexer.add_embeddings
+    chunks = []
+
+    def crash_on_third_chunk(*args, **kwargs):
+        chunks.append(len(args[0]))
+        if len(chunks) == 3:
+            raise RuntimeError("killed")
+        return add_embeddings(*args, **kwargs)
+
+    monkeypatch.setattr(indexer, "add_embeddings", crash_on_third_chunk)
+    with pytest.raises(RuntimeError):
+        build_index(indexer, chunk_size=50, checkpoint=Checkpoint(path), checkpoint_every=1)
+    indexer.close()
+
+    resumed = make_indexer(index_type="flat")
+    assert resumed.get_index_size() == 100
+    assert Checkpoint(path).value == SyntheticCatalogue.object_id(99)
+
+    assert build_index(resumed, chunk_size=50, checkpoint=Checkpoint(path)) == 130
+    assert resumed.get_index_size() == 230
+    assert len(resumed.pid_to_id) == 230
+
+
+def test_prune_deleted_removes_products_gone_from_mongo(monkeypatch, make_indexer):
+    use_catalogue(monkeypatch, 230)
+    indexer = make_indexer(index_type="flat")
+    build_index(indexer, chunk_size=64)
+
+    use_catalogue(monkeypatch, 200)
+    prune_deleted(indexer)
+
+    assert indexer.get_index_size() == 200
+    assert str(SyntheticCatalogue.object_id(210)) not in indexer.pid_to_id
+    query, pid = SyntheticCatalogue(230).query(210)
+    assert pid not in indexer.search(query, top_k=10, rerank=False)
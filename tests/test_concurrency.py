@@ -0,0 +1,87 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from Concurrency import AsyncLimiter, BoundedExecutor, QueueFullError
+from SearchBatcher import SearchBatcher
+
+
+class RecordingIndexer:
+    """Answers `search_many` with the query echoed back and records every call."""
+
+    def __init__(self, delay=0.0):
+        self.calls = []
+        self.delay = delay
+
+    def search_many(self, queries, top_k=20, return_scores=False, rerank=True, filters=None, timings=None):
+        self.calls.append((list(queries), filters))
+        time.sleep(self.delay)
+        return [[f"{query}:{(query_filters or {}).get('category')}"] for query, query_filters in zip(queries, filters)]
+
+
+def test_bounded_executor_rejects_work_beyond_its_queue():
+    executor = BoundedExecutor("test", max_workers=1, max_queue=1)
+    release = threading.Event()
+
+    async def scenario():
+        running = [asyncio.ensure_future(executor.run(release.wait)) for _ in range(2)]
+        await asyncio.sleep(0.05)
+        with pytest.raises(QueueFullError):
+            await executor.run(release.wait)
+        release.set()
+        await asyncio.gather(*running)
+        return executor.in_flight
+
+    try:
+        assert asyncio.run(scenario()) == 0
+    finally:
+        executor.shutdown()
+
+
+def test_async_limiter_rejects_callers_beyond_capacity():
+    limiter = AsyncLimiter("test", max_concurrency=1, max_queue=0)
+
+    async def scenario():
+        async with limiter:
+            with pytest.raises(QueueFullError):
+                async with limiter:
+                    pass
+        return limiter.in_flight
+
+    assert asyncio.run(scenario()) == 0
+
+
+def test_batcher_coalesces_queries_with_different_filters_through_the_executor():
+    indexer = RecordingIndexer()
+    executor = BoundedExecutor("search", max_workers=1, max_queue=0)
+    batcher = SearchBatcher(indexer, max_batch_size=8, max_wait_ms=50, executor=executor)
+    requests = [("mat", {"category": "yoga"}), ("shoes", {"category": "footwear"}), ("bottle", None)]
+
+    async def scenario():
+        return await asyncio.gather(*(batcher.search(query, filters=filters) for query, filters in requests))
+
+    try:
+        results = asyncio.run(scenario())
+    finally:
+        executor.shutdown()
+
+    # One search_many call for the three queries, each keeping its own filters
+    assert indexer.calls == [(["mat", "shoes", "bottle"], [{"category": "yoga"}, {"category": "footwear"}, None])]
+    assert results == [["mat:yoga"], ["shoes:footwear"], ["bottle:None"]]
+
+
+def test_batcher_rejects_queries_beyond_max_pending():
+    batcher = SearchBatcher(RecordingIndexer(delay=0.2), max_batch_size=1, max_wait_ms=0, max_pending=1)
+
+    async def scenario():
+        first = asyncio.ensure_future(batcher.search("a"))
+        await asyncio.sleep(0.05)
+        queued = asyncio.ensure_future(batcher.search("b"))
+        await asyncio.sleep(0)
+        with pytest.raises(QueueFullError):
+            await batcher.search("c")
+        return await first, await queued
+
+    assert asyncio.run(scenario()) == (["a:None"], ["b:None"])
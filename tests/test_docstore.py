@@ -0,0 +1,41 @@
+import os
+
+from DocStore import DocumentStore
+
+
+def test_append_and_get_across_reopen(tmp_path):
+    path = str(tmp_path / "docstore")
+    store = DocumentStore(path)
+
+    assert store.append(["red yoga mat", "योगा मैट"]) == 0
+    assert store.append(["", "blue water bottle"]) == 2
+    store.close()
+    reopened = DocumentStore(path)
+
+    assert len(reopened) == 4
+    assert reopened.get([3, 1, 2, 0]) == ["blue water bottle", "योगा मैट", "", "red yoga mat"]
+    assert reopened.get([-1, 4]) == ["", ""]
+
+
+def test_empty_store_returns_blank_texts(tmp_path):
+    store = DocumentStore(str(tmp_path / "docstore"))
+
+    assert len(store) == 0
+    assert store.get([0, 1]) == ["", ""]
+
+
+def test_offsets_past_the_data_are_dropped_and_overwritten(tmp_path):
+    path = str(tmp_path / "docstore")
+    store = DocumentStore(path)
+    store.append(["first", "second"])
+    store.close()
+    # A crash after the offsets were written but before the texts were
+    with open(f"{path}.idx", "ab") as f:
+        f.write((100).to_bytes(8, "little"))
+
+    reopened = DocumentStore(path)
+    assert len(reopened) == 2
+    reopened.append(["third"])
+
+    assert reopened.get([0, 1, 2]) == ["first", "second", "third"]
+    assert os.path.getsize(f"{path}.idx") == 4 * 8
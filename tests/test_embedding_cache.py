@@ -0,0 +1,57 @@
+import os
+
+import numpy as np
+
+from EmbeddingCache import EmbeddingCache
+from conftest import catalogue
+
+
+def vectors_for(keys, dimension=8):
+    return np.stack([np.full(dimension, int(key) % 1000, dtype="float32") for key in keys])
+
+
+def test_put_flushes_to_disk_once_the_buffer_is_full(tmp_path):
+    cache = EmbeddingCache(str(tmp_path / "cache"), model_name="m", dimension=8, dtype="float32", flush_rows=10)
+    keys = cache.make_keys([f"product {i}" for i in range(25)])
+
+    for start in range(0, 25, 5):
+        cache.put(keys[start:start + 5], vectors_for(keys[start:start + 5]))
+
+    # Two full buffers reached disk; only the last five entries are still held in memory
+    assert os.path.getsize(cache.keys_path) == 20 * 8
+    assert len(cache._new_keys) == 5
+    assert len(cache) == 25
+
+
+def test_lookups_after_several_flushes_and_reopen(tmp_path):
+    path = str(tmp_path / "cache")
+    cache = EmbeddingCache(path, model_name="m", dimension=8, dtype="float32", flush_rows=7)
+    keys = cache.make_keys([f"product {i}" for i in range(50)])
+    shuffled = np.random.default_rng(0).permutation(len(keys))
+    for start in range(0, 50, 3):
+        chunk = keys[shuffled[start:start + 3]]
+        cache.put(chunk, vectors_for(chunk))
+
+    vectors, hit = cache.get(keys)
+    assert hit.all()
+    np.testing.assert_array_equal(vectors, vectors_for(keys))
+
+    cache.flush()
+    reopened = EmbeddingCache(path, model_name="m", dimension=8, dtype="float32")
+    vectors, hit = reopened.get(np.concatenate([keys, reopened.make_keys(["never cached"])]))
+    assert hit[:50].all() and not hit[50]
+    np.testing.assert_array_equal(vectors[:50], vectors_for(keys))
+    assert reopened.stats()["hits"] == 50 and reopened.stats()["misses"] == 1
+
+
+def test_rebuild_reuses_cached_embeddings(make_indexer, tmp_path):
+    cache_path = str(tmp_path / "embedding_cache")
+    first = make_indexer("first", use_embedding_cache=True, embedding_cache_path=cache_path, hybrid=False)
+    first.append(catalogue())
+    second = make_indexer("second", use_embedding_cache=True, embedding_cache_path=cache_path, hybrid=False)
+    second.append(catalogue())
+
+    assert first.embedding_cache.stats()["misses"] == len(catalogue())
+    assert second.embedding_cache.stats()["hits"] == len(catalogue())
+    assert second.search("red yoga mat model0", top_k=1, rerank=False) == first.search(
+        "red yoga mat model0", top_k=1, rerank=False)
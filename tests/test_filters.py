@@ -0,0 +1,90 @@
+import faiss
+import numpy as np
+import pytest
+
+from AttributeStore import AttributeStore
+from ShardedIndex import search_selected, selection_params
+from conftest import catalogue, product_id
+
+
+CONFIGS = [
+    {"index_type": "flat"},
+    {"index_type": "ivf_flat"},
+    {"index_type": "ivf_pq", "pq_m": 8, "pq_nbits": 4},
+    {"index_type": "hnsw"},
+    {"index_type": "flat", "storage": "pq", "pq_m": 8, "pq_nbits": 4},
+    {"index_type": "hnsw", "num_shards": 2},
+]
+ATTRIBUTES = {pid: attributes for pid, _, attributes in catalogue()}
+
+
+def config_id(config):
+    return "-".join(str(value) for value in config.values())
+
+
+def respects(pid, price_max=None, category=None):
+    attributes = ATTRIBUTES[pid]
+    return ((price_max is None or attributes["price"] <= price_max)
+            and (category is None or category.lower() in (name.lower() for name in attributes["categories"])))
+
+
+@pytest.mark.parametrize("config", CONFIGS, ids=config_id)
+def test_filtered_search_respects_filters(make_indexer, config):
+    indexer = make_indexer(nlist=8, **config)
+    indexer.append(catalogue())
+    indexer.delete([product_id(1)])
+    filters = {"price_max": 400.0, "category": "footwear"}
+
+    results = indexer.search("red running shoes", top_k=10, filters=filters)
+
+    assert results
+    assert all(respects(pid, **filters) for pid in results)
+    assert product_id(1) not in results
+
+
+@pytest.mark.parametrize("config", CONFIGS, ids=config_id)
+def test_search_many_applies_each_querys_filters(make_indexer, config):
+    indexer = make_indexer(nlist=8, **config)
+    indexer.append(catalogue())
+    filters = [{"category": "kitchen"}, {"price_max": 200.0}, None, {"category": "no such category at all"}]
+
+    results = indexer.search_many(["blue water bottle"] * 4, top_k=10, filters=filters)
+
+    assert all(respects(pid, category="kitchen") for pid in results[0])
+    assert all(respects(pid, price_max=200.0) for pid in results[1])
+    # No filter, and a category that matches nothing, both search everything
+    assert results[2] == results[3] == indexer.search("blue water bottle", top_k=10)
+
+
+def test_filter_nothing_passes_returns_no_results(make_indexer):
+    indexer = make_indexer(index_type="hnsw")
+    indexer.append(catalogue())
+
+    assert indexer.search("yoga mat", filters={"price_max": 1.0}) == []
+
+
+def test_bitmap_selection_stays_within_the_packed_mask():
+    vectors = np.eye(64, dtype="float32")[:, :16].copy()
+    index = faiss.IndexIDMap2(faiss.IndexFlatIP(16))
+    index.add_with_ids(np.vstack([vectors] * 2), np.arange(128))
+    mask = np.zeros(10, dtype=bool)
+    mask[[2, 7]] = True
+    selection = {"bitmap": np.packbits(mask, bitorder="little")}
+
+    _, I = search_selected(index, np.ones((1, 16), dtype="float32"), 5, selection,
+                           selection_params(selection, index))
+
+    assert set(I[0][I[0] >= 0]) == {2, 7}
+
+
+def test_category_filter_matches_whole_terms(tmp_path):
+    store = AttributeStore(str(tmp_path / "attributes"))
+    store.append([{"price": 10.0, "categories": ["Home & Kitchen"]},
+                  {"price": 10.0, "categories": ["Automobiles"]},
+                  {"price": 10.0, "categories": ["Mobiles"]},
+                  {"price": 10.0, "categories": ["Tea Bags"]},
+                  {"price": 10.0, "categories": ["Bags, Wallets and Luggage"]}])
+
+    assert list(store.eligible(5, category="kitchen")) == [True, False, False, False, False]
+    assert list(store.eligible(5, category="mobiles")) == [False, False, True, False, False]
+    assert list(store.eligible(5, category="bags")) == [False, False, False, False, True]
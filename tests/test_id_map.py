@@ -0,0 +1,82 @@
+import json
+import os
+
+import numpy as np
+import pytest
+
+import db
+from Benchmark import LocalCollection, SyntheticCatalogue
+from IdMap import IdMap
+from conftest import product_id
+
+
+def test_round_trip_through_the_packed_file(tmp_path):
+    path = str(tmp_path / "id_map")
+    id_map = IdMap(path)
+    id_map.extend([product_id(i) for i in range(5)])
+    id_map.save()
+    id_map.extend([product_id(5)])
+    id_map[1] = None
+    id_map.save()
+
+    reopened = IdMap(path)
+
+    assert os.path.getsize(f"{path}.bin") == 6 * 12
+    assert isinstance(reopened._ids, np.memmap)
+    assert list(reopened) == [product_id(0), None, product_id(2), product_id(3), product_id(4), product_id(5)]
+    assert reopened[5] == product_id(5)
+
+
+def test_invalid_ids_leave_the_map_unchanged(tmp_path):
+    id_map = IdMap(str(tmp_path / "id_map"))
+
+    for bad in ("not-an-object-id", "0" * 24):
+        with pytest.raises(ValueError):
+            id_map.extend([product_id(0), bad])
+
+    assert len(id_map) == 0
+
+
+def test_writes_never_touch_a_hard_linked_snapshot(tmp_path):
+    path = str(tmp_path / "id_map")
+    id_map = IdMap(path)
+    id_map.extend([product_id(i) for i in range(3)])
+    id_map.save()
+    os.link(f"{path}.bin", tmp_path / "snapshot.bin")
+    published = (tmp_path / "snapshot.bin").read_bytes()
+
+    id_map[0] = None
+    id_map.extend([product_id(3)])
+    id_map.save()
+
+    assert (tmp_path / "snapshot.bin").read_bytes() == published
+    assert list(IdMap(path)) == [None, product_id(1), product_id(2), product_id(3)]
+
+
+def test_legacy_json_map_is_converted(tmp_path):
+    path = str(tmp_path / "id_map")
+    with open(f"{path}.json", "w") as f:
+        json.dump([product_id(0), None, product_id(2)], f)
+
+    id_map = IdMap(path)
+    id_map.save()
+
+    assert list(IdMap(path)) == [product_id(0), None, product_id(2)]
+
+
+def test_products_are_hydrated_in_rank_order_and_cached(monkeypatch):
+    import main
+
+    collection = LocalCollection(SyntheticCatalogue(50))
+    monkeypatch.setattr(db, "collection", collection)
+    monkeypatch.setattr(main, "product_cache", main.LRUCache(max_size=100))
+    ranked = [str(SyntheticCatalogue.object_id(i)) for i in (31, 4, 17)]
+
+    products = main.get_items(ranked)
+    products[0]["title"] = "edited by the caller"
+    monkeypatch.setattr(collection, "find", lambda *args, **kwargs: pytest.fail("served from the cache"))
+
+    assert [product["id"] for product in products] == ranked
+    assert set(products[0]) <= {"id", *main.PRODUCT_PROJECTION}
+    assert [product["id"] for product in main.get_items(ranked[::-1])] == ranked[::-1]
+    assert main.get_items(ranked)[0]["title"] != "edited by the caller"
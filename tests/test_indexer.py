@@ -0,0 +1,163 @@
+import faiss
+import pytest
+
+from Evaluation import recall_report
+from Indexer import TRAINING_POINTS_PER_CENTROID, build_faiss_index, min_training_size
+from conftest import HashEncoder, catalogue, product_id
+
+
+APPROXIMATE_CONFIGS = [
+    {"index_type": "ivf_flat"},
+    {"index_type": "ivf_pq", "pq_m": 8, "pq_nbits": 4},
+    {"index_type": "hnsw"},
+    {"index_type": "hnsw", "storage": "int8"},
+    {"index_type": "flat", "storage": "pq", "pq_m": 8, "pq_nbits": 4},
+    {"index_type": "flat", "storage": "pq", "pq_m": 8, "pq_nbits": 4, "refine_factor": 3},
+    {"index_type": "ivf_flat", "num_shards": 2},
+]
+
+
+def config_id(config):
+    return "-".join(str(value) for value in config.values())
+
+
+@pytest.mark.parametrize("config", APPROXIMATE_CONFIGS, ids=config_id)
+def test_search_after_delete_skips_tombstoned_products(make_indexer, config):
+    indexer = make_indexer(nlist=8, hybrid=False, **config)
+    indexer.append(catalogue())
+    deleted = {product_id(i) for i in range(0, 50, 5)}
+
+    assert indexer.delete(deleted) == len(deleted)
+    results = indexer.search("red yoga mat model0", top_k=20, rerank=False)
+
+    assert results
+    assert not deleted & set(results)
+
+
+@pytest.mark.parametrize("config", APPROXIMATE_CONFIGS, ids=config_id)
+def test_upsert_replaces_the_previous_vector(make_indexer, config):
+    indexer = make_indexer(nlist=8, hybrid=False, **config)
+    indexer.append(catalogue())
+
+    indexer.upsert([(product_id(3), "purple umbrella", {"price": 250.0, "categories": ["Bags"]})])
+    results = indexer.search("purple umbrella", top_k=10, rerank=False)
+
+    # Coarse PQ codes may rank a near neighbour first, but the product appears once, with its new text
+    assert results.count(product_id(3)) == 1
+    assert indexer.get_index_size() == len(catalogue())
+
+
+@pytest.mark.parametrize("config, attribute, value", [
+    ({"index_type": "ivf_flat", "nprobe": 5}, "nprobe", 5),
+    ({"index_type": "hnsw", "ef_search": 48}, "efSearch", 48),
+], ids=["ivf", "hnsw"])
+def test_selection_keeps_tuned_search_params(make_indexer, config, attribute, value):
+    indexer = make_indexer(nlist=8, hybrid=False, **config)
+    indexer.append(catalogue())
+    indexer.delete([product_id(0)])
+
+    _, params = indexer._search_params()
+    assert getattr(params, attribute) == value
+
+    indexer.set_search_params(nprobe=3, ef_search=24)
+    _, params = indexer._search_params()
+    assert getattr(params, attribute) == (3 if attribute == "nprobe" else 24)
+
+
+def test_compaction_drops_tombstones_and_keeps_search_working(make_indexer):
+    indexer = make_indexer(index_type="hnsw", hybrid=False, compaction_ratio=0.01)
+    indexer.append(catalogue())
+    deleted = [product_id(i) for i in range(20)]
+
+    indexer.delete(deleted)
+
+    assert not indexer.tombstones
+    assert indexer.index.ntotal == len(catalogue()) - len(deleted)
+    assert not set(deleted) & set(indexer.search("red yoga mat", top_k=20, rerank=False))
+
+
+def test_reopened_index_keeps_deletes(make_indexer):
+    indexer = make_indexer(index_type="ivf_flat", nlist=8, hybrid=False)
+    indexer.append(catalogue())
+    indexer.delete([product_id(0)])
+    indexer.close()
+
+    reopened = make_indexer(hybrid=False)
+
+    assert reopened.meta["index_type"] == "ivf_flat"
+    assert product_id(0) not in reopened.search("red yoga mat model0", top_k=20, rerank=False)
+    assert product_id(0) not in reopened.pid_to_id
+
+
+@pytest.mark.parametrize("index_type, storage, expected", [
+    ("flat", "float32", faiss.IndexFlat),
+    ("hnsw", "float32", faiss.IndexHNSWFlat),
+    ("hnsw", "int8", faiss.IndexHNSWSQ),
+    ("ivf_flat", "float32", faiss.IndexIVFFlat),
+    ("ivf_pq", "float32", faiss.IndexIVFPQ),
+    ("flat", "fp16", faiss.IndexScalarQuantizer),
+])
+def test_build_faiss_index_types(index_type, storage, expected):
+    index = build_faiss_index(index_type, dimension=32, nlist=4, pq_m=4, pq_nbits=4, hnsw_m=8, storage=storage)
+
+    assert isinstance(faiss.downcast_index(index), expected)
+    assert index.metric_type == faiss.METRIC_INNER_PRODUCT
+
+
+def test_unknown_index_settings_are_rejected():
+    with pytest.raises(ValueError):
+        build_faiss_index("annoy")
+    with pytest.raises(ValueError):
+        build_faiss_index("flat", storage="int4")
+
+
+def test_untrained_index_buffers_chunks_until_it_can_train(make_indexer):
+    indexer = make_indexer(index_type="ivf_flat", nlist=4, hybrid=False)
+    products = catalogue(200)
+    assert 100 < min_training_size("ivf_flat", nlist=4) * TRAINING_POINTS_PER_CENTROID <= 200
+
+    indexer.append(products[:100], save=False)
+    assert indexer.index.ntotal == 0 and len(indexer._pending) == 1
+
+    indexer.append(products[100:], save=False)
+    assert indexer.index.is_trained and indexer.index.ntotal == 200 and not indexer._pending
+    assert indexer.search(products[106][1], top_k=1, rerank=False) == [product_id(106)]
+
+
+def test_save_trains_on_whatever_is_buffered(make_indexer):
+    indexer = make_indexer(index_type="ivf_flat", nlist=4, hybrid=False)
+
+    indexer.append(catalogue(20))
+
+    assert indexer.index.is_trained and indexer.get_index_size() == 20
+
+
+def test_recall_report_compares_against_exact_search():
+    encoder = HashEncoder()
+    embeddings = encoder.encode([text for _, text, _ in catalogue()])
+    queries = encoder.encode(["red yoga mat", "blue water bottle", "black wireless earbuds"])
+    configs = [{"index_type": "hnsw", "ef_search": 64}, {"index_type": "ivf_flat", "nlist": 8, "nprobe": 8},
+               {"index_type": "flat", "storage": "int8", "refine_factor": 4}]
+
+    rows = recall_report(embeddings, queries, configs=configs, k=10)
+
+    assert [row["config"] for row in rows] == [{"index_type": "flat"}, *configs]
+    assert rows[0]["recall"] == 1.0
+    # nprobe = nlist scans every cluster, and refinement re-scores at full precision
+    assert rows[2]["recall"] == rows[3]["recall"] == 1.0
+    assert all(row["memory_mb"] > 0 for row in rows)
+
+
+def test_batched_search_matches_single_searches(make_indexer):
+    indexer = make_indexer(index_type="flat", hybrid=True)
+    indexer.append(catalogue())
+    queries = ["blue yoga mat", "black wireless earbuds", "blue yoga mat", "red running shoes model11"]
+    filters = [None, {"price_max": 300}, None, {"category": "footwear"}]
+
+    batched = indexer.search_many(queries, top_k=5, return_scores=True, batch_size=2, filters=filters)
+
+    assert all(batched)
+    for query, query_filters, results in zip(queries, filters, batched):
+        single = indexer.search(query, top_k=5, return_scores=True, filters=query_filters)
+        assert [pid for pid, _ in results] == [pid for pid, _ in single]
+        assert [score for _, score in results] == pytest.approx([score for _, score in single], abs=1e-5)
@@ -0,0 +1,53 @@
+import numpy as np
+import pytest
+import torch
+from sentence_transformers import SentenceTransformer
+
+from InferenceBackends import _rank_correlation, check_parity, load_text_model, set_num_threads, validate_backend
+from conftest import OverlapReranker, catalogue
+
+
+class ReversedReranker(OverlapReranker):
+    def predict(self, pairs, **kwargs):
+        return -super().predict(pairs, **kwargs)
+
+
+def test_unknown_backends_are_rejected(make_indexer):
+    assert validate_backend("onnx-int8") == "onnx-int8"
+    with pytest.raises(ValueError):
+        validate_backend("tensorrt")
+    with pytest.raises(ValueError):
+        make_indexer(backends={"reranker": "tensorrt"})
+
+
+def test_quantized_product_encoder_gets_its_own_cache_key(make_indexer):
+    assert make_indexer("torch").product_model_key == "all-MiniLM-L6-v2"
+    assert make_indexer("int8", backends={"product": "int8"}).product_model_key == "all-MiniLM-L6-v2@int8"
+
+
+def test_int8_backend_quantizes_linear_layers_and_keeps_parity(tiny_model_path):
+    threads = torch.get_num_threads()
+    reference = load_text_model(SentenceTransformer, tiny_model_path, "torch")
+    candidate = load_text_model(SentenceTransformer, tiny_model_path, "int8", num_threads=1)
+    try:
+        assert torch.get_num_threads() == 1
+    finally:
+        set_num_threads(threads)
+
+    assert any(isinstance(module, torch.ao.nn.quantized.dynamic.Linear) for module in candidate.modules())
+    report = check_parity(reference, candidate, texts=[text for _, text, _ in catalogue(20)])
+    assert report["passed"] and report["min_cosine"] >= 0.99
+
+
+def test_reranker_parity_is_judged_by_rank_correlation():
+    pairs = [(query, text) for query in ("blue yoga mat", "red running shoes") for _, text, _ in catalogue(10)]
+
+    assert check_parity(OverlapReranker(), OverlapReranker(), pairs=pairs)["passed"]
+    assert not check_parity(OverlapReranker(), ReversedReranker(), pairs=pairs)["passed"]
+
+
+def test_rank_correlation():
+    scores = np.array([0.1, 0.5, 0.3, 0.9])
+
+    assert _rank_correlation(scores, scores * 10 + 1) == pytest.approx(1.0)
+    assert _rank_correlation(scores, -scores) == pytest.approx(-1.0)
@@ -0,0 +1,74 @@
+import numpy as np
+import pytest
+
+from Indexer import reciprocal_rank_fusion
+from LexicalIndex import LexicalIndex
+from conftest import catalogue, product_id
+
+
+def stopword_heavy_texts(size=200):
+    # "for" and "men" are in every document, "zenith" in a few
+    return [f"shirt for men size {i % 7}" + (" zenith" * (1 + i % 3) if i % 40 == 0 else "") for i in range(size)]
+
+
+def build(tmp_path, texts, **kwargs):
+    index = LexicalIndex(str(tmp_path / "lexical"), **kwargs)
+    index.append(texts)
+    return index
+
+
+def test_common_terms_rescore_candidates_exactly(tmp_path):
+    texts = stopword_heavy_texts()
+    pruned = build(tmp_path, texts)
+    exhaustive = LexicalIndex(str(tmp_path / "exhaustive"), max_df_ratio=1.0)
+    exhaustive.append(texts)
+
+    [results] = pruned.search_many(["zenith shirt for men"], top_k=10)
+    [reference] = exhaustive.search_many(["zenith shirt for men"], top_k=10)
+
+    zenith_docs = {i for i, text in enumerate(texts) if "zenith" in text}
+    assert {doc for doc, _ in results} == zenith_docs
+    # The pruned candidates score exactly as a full scan scores them
+    assert dict(results) == pytest.approx(dict(reference[:len(results)]))
+    assert [score for _, score in results] == sorted((score for _, score in results), reverse=True)
+
+
+def test_query_of_only_common_terms_scans_the_rarest(tmp_path):
+    index = build(tmp_path, stopword_heavy_texts())
+
+    [results] = index.search_many(["for men"], top_k=5)
+
+    assert len(results) == 5
+
+
+def test_mask_limits_candidates(tmp_path):
+    texts = stopword_heavy_texts()
+    index = build(tmp_path, texts)
+    mask = np.zeros(len(texts), dtype=bool)
+    mask[40] = True
+
+    [results] = index.search_many(["zenith for men"], top_k=10, mask=mask)
+
+    assert [doc for doc, _ in results] == [40]
+
+
+def test_reciprocal_rank_fusion_order():
+    dense = [(1, 0.9), (2, 0.8), (3, 0.7)]
+    lexical = [(3, 12.0), (1, 8.0), (4, 5.0)]
+
+    fused = reciprocal_rank_fusion([dense, lexical], top_k=4, k=60)
+
+    # 1: 1/61 + 1/62, 3: 1/63 + 1/61, 2: 1/62, 4: 1/63
+    assert [idx for idx, _ in fused] == [1, 3, 2, 4]
+    assert fused[0][1] == pytest.approx(1 / 61 + 1 / 62)
+
+
+def test_hybrid_search_surfaces_exact_sku_matches(make_indexer):
+    indexer = make_indexer(index_type="flat", hybrid=True)
+    indexer.append(catalogue())
+
+    results = indexer.search_many(["model123", "blue yoga mat model5"], top_k=5, rerank=False)
+
+    # Ranked first by both BM25 and the dense scores, so first after fusion too
+    assert results[0][0] == product_id(123)
+    assert results[1][0] == product_id(5)
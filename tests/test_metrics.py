@@ -0,0 +1,45 @@
+import pytest
+from prometheus_client import CollectorRegistry, REGISTRY
+
+from Metrics import CacheCollector, span
+
+
+def stage_count(stage):
+    return REGISTRY.get_sample_value("intentsearch_stage_seconds_count", {"stage": stage}) or 0.0
+
+
+def test_span_records_milliseconds_and_the_histogram():
+    timings = {"encode": 1.0}
+    before = stage_count("encode")
+
+    with span("encode", timings):
+        pass
+
+    assert timings["encode"] >= 1.0
+    assert stage_count("encode") == before + 1
+
+
+def test_span_records_failed_stages_too():
+    timings = {}
+    before = stage_count("test_failure")
+
+    with pytest.raises(RuntimeError):
+        with span("test_failure", timings):
+            raise RuntimeError("boom")
+
+    assert "test_failure" in timings and stage_count("test_failure") == before + 1
+
+
+def test_cache_collector_reads_stats_at_scrape_time_and_skips_missing_caches():
+    stats = {"hits": 1, "misses": 2, "size": 3}
+    collector = CacheCollector()
+    collector.add("product", lambda: stats)
+    collector.add("rewrite", lambda: None)
+    registry = CollectorRegistry()
+    registry.register(collector)
+    stats["hits"] = 5
+
+    assert registry.get_sample_value("intentsearch_cache_lookups_total", {"cache": "product", "result": "hit"}) == 5
+    assert registry.get_sample_value("intentsearch_cache_entries", {"cache": "product"}) == 3
+    assert registry.get_sample_value("intentsearch_cache_entries", {"cache": "rewrite"}) is None
+
@@ -0,0 +1,101 @@
+import asyncio
+import json
+import threading
+import time
+
+import pytest
+
+from ModelRegistry import ModelRegistry
+
+
+class SlowFactory:
+    def __init__(self, delay=0.0, failures=0):
+        self.delay = delay
+        self.failures = failures
+        self.calls = 0
+
+    def __call__(self):
+        self.calls += 1
+        time.sleep(self.delay)
+        if self.calls <= self.failures:
+            raise RuntimeError("weights not found")
+        return object()
+
+
+def test_models_load_once_on_first_use():
+    factory = SlowFactory(delay=0.1)
+    warmed, loaded = [], []
+    registry = ModelRegistry()
+    registry.register("caption", factory, warmup=warmed.append, on_load=loaded.append)
+    assert factory.calls == 0 and registry.status()["caption"] == {"state": "not_loaded"}
+
+    threads = [threading.Thread(target=registry.get, args=("caption",)) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    model = registry.get("caption")
+    assert factory.calls == 1
+    assert warmed == loaded == [model]
+    assert registry.is_ready("caption") and registry.status()["caption"]["state"] == "ready"
+
+
+def test_a_failed_load_is_reported_and_retried():
+    registry = ModelRegistry()
+    registry.register("transcribe", SlowFactory(failures=1))
+
+    with pytest.raises(RuntimeError):
+        registry.get("transcribe")
+    assert registry.status()["transcribe"] == {"state": "failed", "error": "weights not found"}
+    assert registry.peek("transcribe") is None
+
+    assert registry.get("transcribe") is not None
+
+
+def test_aget_loads_off_the_event_loop():
+    registry = ModelRegistry()
+    registry.register("caption", SlowFactory(delay=0.2))
+    ticks = []
+
+    async def tick():
+        while not registry.is_ready("caption"):
+            ticks.append(time.perf_counter())
+            await asyncio.sleep(0.01)
+
+    async def scenario():
+        _, model = await asyncio.gather(tick(), registry.aget("caption"))
+        return model
+
+    assert asyncio.run(scenario()) is registry.peek("caption")
+    assert len(ticks) > 5
+
+
+def test_background_warm_up_loads_in_order_and_survives_failures():
+    registry = ModelRegistry()
+    order = []
+    registry.register("indexer", lambda: order.append("indexer") or "indexer")
+    registry.register("caption", SlowFactory(failures=1))
+    registry.register("transcribe", lambda: order.append("transcribe") or "transcribe")
+
+    registry.warm_up_in_background(["indexer", "caption", "transcribe"]).join()
+
+    assert order == ["indexer", "transcribe"]
+    assert registry.status()["caption"]["state"] == "failed"
+    assert registry.is_ready("indexer", "transcribe") and not registry.is_ready("caption")
+
+
+def test_ready_endpoint_waits_for_text_search_only(monkeypatch):
+    import main
+
+    registry = ModelRegistry()
+    for name in ("indexer", "caption", "transcribe"):
+        registry.register(name, lambda: object())
+    monkeypatch.setattr(main, "models", registry)
+
+    assert main.ready().status_code == 503
+    registry.get("indexer")
+    response = main.ready()
+
+    assert response.status_code == 200
+    assert json.loads(response.body)["modalities"] == {"text": True, "image": False, "voice": False}
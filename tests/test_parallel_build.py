@@ -0,0 +1,60 @@
+import os
+
+import pytest
+from sentence_transformers import SentenceTransformer
+
+import db
+from Benchmark import LocalCollection, SyntheticCatalogue
+from IndexCreaterScript import Checkpoint, build_index
+from conftest import HashEncoder, OverlapReranker
+
+
+@pytest.fixture
+def build_indexers(monkeypatch, make_indexer, tiny_model_path):
+    """Two empty indexers whose workers and parent both encode products with the tiny model."""
+    catalogue = SyntheticCatalogue(230)
+    monkeypatch.setattr(db, "collection", LocalCollection(catalogue))
+    models = (SentenceTransformer(tiny_model_path), HashEncoder(), OverlapReranker())
+    return [make_indexer(name, index_type="flat", product_model_name=tiny_model_path, models=models, hybrid=False)
+            for name in ("sequential", "parallel")]
+
+
+def shared_memory_segments():
+    return set(os.listdir("/dev/shm")) if os.path.isdir("/dev/shm") else set()
+
+
+def test_parallel_build_matches_a_sequential_build(build_indexers):
+    sequential, parallel = build_indexers
+    build_index(sequential, chunk_size=64, encode_batch_size=16)
+    before = shared_memory_segments()
+
+    indexed = build_index(parallel, chunk_size=64, encode_batch_size=16, workers=2)
+
+    assert indexed == parallel.get_index_size() == 230
+    assert list(parallel.id_map) == list(sequential.id_map)
+    for query in ("zenith yoga mat", "wireless earbuds"):
+        expected = sequential.search(query, top_k=10, return_scores=True, rerank=False)
+        results = parallel.search(query, top_k=10, return_scores=True, rerank=False)
+        assert [pid for pid, _ in results] == [pid for pid, _ in expected]
+        assert [score for _, score in results] == pytest.approx([score for _, score in expected], abs=1e-5)
+    # Every chunk buffer was unlinked by the parent, none by the workers
+    assert shared_memory_segments() <= before
+
+
+def test_checkpoints_only_cover_chunks_already_added(build_indexers, tmp_path):
+    _, indexer = build_indexers
+    checkpoint = Checkpoint(str(tmp_path / "checkpoint.json"))
+    saved = []
+    save = checkpoint.save
+
+    def record(value=None):
+        saved.append((value, indexer.get_index_size()))
+        save(value)
+
+    checkpoint.save = record
+
+    build_index(indexer, chunk_size=64, encode_batch_size=16, workers=2, checkpoint=checkpoint, checkpoint_every=1)
+
+    # Each chunk's watermark is its last document, saved once that chunk is in the index
+    assert saved[:-1] == [(SyntheticCatalogue.object_id(i), i + 1) for i in (63, 127, 191, 229)]
+    assert Checkpoint(checkpoint.path).value == SyntheticCatalogue.object_id(229)
@@ -0,0 +1,53 @@
+import pytest
+
+from QueryParser import RuleBasedQueryParser
+
+
+@pytest.fixture(scope="module")
+def parser():
+    return RuleBasedQueryParser()
+
+
+@pytest.mark.parametrize("query, price_max", [
+    ("yoga mat under ₹500", 500),
+    ("running shoes below rs. 2,499", 2499),
+    ("earbuds under 2k", 2000),
+    ("laptop between 40k and 60k", 60000),
+    ("water bottle upto 300 rupees", 300),
+    ("yoga mat under 500", 500),
+])
+def test_prices(parser, query, price_max):
+    parsed, _ = parser.parse(query)
+
+    assert parsed["price_max"] == price_max
+
+
+@pytest.mark.parametrize("query", ["dumbbell set under 5 kg", "toys for kids under 10 years",
+                                   "power bank under 10000 mah", "backpack under 30 l"])
+def test_quantities_are_not_prices(parser, query):
+    parsed, _ = parser.parse(query)
+
+    assert parsed["price_max"] is None
+
+
+def test_bare_number_lowers_confidence(parser):
+    _, with_currency = parser.parse("yoga mat under ₹500")
+    _, bare = parser.parse("yoga mat under 500")
+
+    assert with_currency == 1.0
+    assert bare < with_currency
+
+
+def test_category_and_intent(parser):
+    parsed, confidence = parser.parse("I need a cheap yoga mat for home")
+
+    assert parsed["category"] == "yoga"
+    assert parsed["intent"] == "cheap"
+    assert "yoga mat" in parsed["query"]
+    assert confidence >= 0.6
+
+
+def test_non_english_query_has_no_confidence(parser):
+    _, confidence = parser.parse("योगा मैट 500 के अंदर")
+
+    assert confidence == 0.0
@@ -0,0 +1,71 @@
+import pytest
+
+from Evaluation import cascade_report
+from Indexer import RerankCascade
+from conftest import HashEncoder, OverlapReranker, catalogue
+
+
+class RecordingReranker(OverlapReranker):
+    """Overlap reranker that remembers every pair it scored."""
+
+    def __init__(self):
+        self.pairs = []
+
+    def predict(self, pairs, **kwargs):
+        self.pairs.extend(pairs)
+        return super().predict(pairs, **kwargs)
+
+
+@pytest.fixture
+def indexer(make_indexer):
+    indexer = make_indexer(index_type="flat", hybrid=False, models=(HashEncoder(), HashEncoder(), RecordingReranker()))
+    indexer.append(catalogue())
+    return indexer
+
+
+def test_depth_skips_confident_queries_and_clamps_the_window():
+    cascade = RerankCascade(skip_margin=0.15, depth_window=0.2, min_depth=3, max_depth=5)
+
+    assert cascade.depth([0.9, 0.6, 0.5]) == 0
+    assert cascade.depth([0.9]) == 0
+    assert cascade.depth([0.9, 0.85, 0.3, 0.2, 0.1]) == 3
+    assert cascade.depth([0.9, 0.89, 0.88, 0.87, 0.86, 0.85, 0.84]) == 5
+
+
+def test_truncate_keeps_the_leading_words():
+    assert RerankCascade(max_tokens=3).truncate("red  yoga mat with strap") == "red yoga mat"
+
+
+def test_cascade_reranks_fewer_candidates_and_keeps_the_rest(indexer):
+    cascade = RerankCascade(skip_margin=1.0, depth_window=1.0, min_depth=2, max_depth=4, max_tokens=2)
+
+    full = indexer.search("blue yoga mat", top_k=10, cascade=False)
+    full_pairs = len(indexer.reranker.pairs)
+    indexer.reranker.pairs.clear()
+    results = indexer.search("blue yoga mat", top_k=10, cascade=cascade)
+
+    assert full_pairs == 10
+    assert len(indexer.reranker.pairs) == 4
+    assert all(len(text.split()) <= 2 for _, text in indexer.reranker.pairs)
+    assert sorted(results) == sorted(full)
+    dense = indexer.search("blue yoga mat", top_k=10, rerank=False)
+    # Candidates past the rerank depth follow in retrieval order
+    assert results[4:] == dense[4:]
+
+
+def test_exhausted_time_budget_keeps_retrieval_order(indexer):
+    cascade = RerankCascade(skip_margin=1.0, time_budget_ms=0.0)
+
+    results = indexer.search("blue yoga mat", top_k=10, cascade=cascade)
+
+    assert indexer.reranker.pairs == []
+    assert results == indexer.search("blue yoga mat", top_k=10, rerank=False)
+
+
+def test_cascade_report_compares_against_full_reranking(indexer):
+    queries = ["blue yoga mat", "black wireless earbuds", "red running shoes model11"]
+
+    full, cascaded = cascade_report(indexer, queries, RerankCascade(), k=5, top_k=10)
+
+    assert full["config"] == {"rerank": "full"} and full["ndcg"] == pytest.approx(1.0)
+    assert 0.0 <= cascaded["skip_rate"] <= 1.0 and cascaded["mean_depth"] <= 20
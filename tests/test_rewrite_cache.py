@@ -0,0 +1,141 @@
+import asyncio
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from Caching import LRUCache, SQLiteCache
+from QueryParser import CachedQueryRewriter, HybridQueryParser
+
+
+class CountingRewriter:
+    """Stand-in for `QueryRewriter` that counts LLM calls and can be slow or fail."""
+
+    def __init__(self, template="Rewrite: {input}", delay=0.0, fail=False):
+        self.model_name = "test-model"
+        self.prompt = SimpleNamespace(template=template)
+        self.delay = delay
+        self.fail = fail
+        self.calls = 0
+
+    def _result(self, user_input):
+        self.calls += 1
+        if self.fail:
+            return {"query": user_input, "error": "LLM unavailable"}
+        return {"query": user_input.strip().lower(), "category": None, "price_max": None, "intent": None}
+
+    def rewrite(self, user_input):
+        time.sleep(self.delay)
+        return self._result(user_input)
+
+    async def arewrite(self, user_input):
+        await asyncio.sleep(self.delay)
+        return self._result(user_input)
+
+
+def test_normalised_repeats_are_served_from_memory():
+    rewriter = CountingRewriter()
+    cache = CachedQueryRewriter(rewriter)
+
+    first = cache.rewrite("Yoga Mat")
+    first["query"] = "changed by the caller"
+    second = cache.rewrite("  yoga   mat ")
+
+    assert rewriter.calls == 1
+    assert second["query"] == "yoga mat"
+    assert cache.stats()["memory_hits"] == 1 and cache.stats()["hit_rate"] == 0.5
+
+
+def test_persistent_tier_survives_restarts_until_the_prompt_changes(tmp_path):
+    path = str(tmp_path / "rewrites.sqlite")
+    CachedQueryRewriter(CountingRewriter(), persistent_path=path).rewrite("yoga mat")
+
+    restarted = CountingRewriter()
+    assert CachedQueryRewriter(restarted, persistent_path=path).rewrite("yoga mat")["query"] == "yoga mat"
+    assert restarted.calls == 0
+
+    new_prompt = CountingRewriter(template="Rewrite better: {input}")
+    CachedQueryRewriter(new_prompt, persistent_path=path).rewrite("yoga mat")
+    assert new_prompt.calls == 1
+
+
+def test_failed_rewrites_are_retried(tmp_path):
+    rewriter = CountingRewriter(fail=True)
+    cache = CachedQueryRewriter(rewriter, persistent_path=str(tmp_path / "rewrites.sqlite"))
+
+    cache.rewrite("yoga mat")
+    cache.rewrite("yoga mat")
+
+    assert rewriter.calls == 2
+    assert len(cache.memory) == 0
+
+
+def test_concurrent_threads_share_one_llm_call():
+    rewriter = CountingRewriter(delay=0.2)
+    cache = CachedQueryRewriter(rewriter)
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(cache.rewrite("yoga mat"))) for _ in range(6)]
+
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert rewriter.calls == 1
+    assert len(results) == 6 and all(result["query"] == "yoga mat" for result in results)
+    assert cache.stats()["coalesced"] == 5
+
+
+def test_concurrent_coroutines_share_one_llm_call_and_persist_it(tmp_path):
+    path = str(tmp_path / "rewrites.sqlite")
+    rewriter = CountingRewriter(delay=0.05)
+    cache = CachedQueryRewriter(rewriter, persistent_path=path)
+
+    async def scenario():
+        return await asyncio.gather(*(cache.arewrite("yoga mat") for _ in range(6)))
+
+    results = asyncio.run(scenario())
+
+    assert rewriter.calls == 1
+    assert all(result == results[0] for result in results)
+    assert cache.stats()["coalesced"] == 5
+    restarted = CountingRewriter()
+    assert asyncio.run(CachedQueryRewriter(restarted, persistent_path=path).arewrite("yoga mat")) == results[0]
+    assert restarted.calls == 0
+
+
+def test_lru_cache_evicts_least_recently_used_and_expires():
+    cache = LRUCache(max_size=2)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("a")
+    cache.set("c", 3)
+
+    assert cache.get("b") is None and cache.get("a") == 1 and cache.get("c") == 3
+
+    expiring = LRUCache(max_size=2, ttl=0.05)
+    expiring.set("a", 1)
+    time.sleep(0.1)
+    assert expiring.get("a", "expired") == "expired"
+    assert (expiring.hits, expiring.misses) == (0, 1)
+
+
+def test_sqlite_cache_round_trips_json_and_expires(tmp_path):
+    cache = SQLiteCache(str(tmp_path / "cache.sqlite"), ttl=0.05)
+    cache.set("key", {"query": "yoga mat", "price_max": 500})
+
+    assert SQLiteCache(cache.path).get("key") == {"query": "yoga mat", "price_max": 500}
+    time.sleep(0.1)
+    assert cache.get("key") is None
+
+
+@pytest.mark.parametrize("query, escalated", [("yoga mat under ₹500", False), ("योगा मैट", True)])
+def test_hybrid_parser_only_escalates_unsure_queries(query, escalated):
+    rewriter = CountingRewriter()
+    parser = HybridQueryParser(CachedQueryRewriter(rewriter))
+
+    asyncio.run(parser.arewrite(query))
+
+    assert rewriter.calls == int(escalated)
+    assert parser.stats()["llm"] == int(escalated)
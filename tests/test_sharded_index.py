@@ -0,0 +1,49 @@
+import faiss
+import numpy as np
+import pytest
+
+from ShardedIndex import merge_top_k
+from conftest import catalogue, product_id
+
+
+def test_merge_top_k_skips_padding():
+    first = (np.array([[0.9, 0.5, -np.inf]], dtype="float32"), np.array([[3, 7, -1]]))
+    second = (np.array([[0.8, 0.7, 0.1]], dtype="float32"), np.array([[4, 2, 8]]))
+
+    D, I = merge_top_k([first, second], 4)
+
+    assert I.tolist() == [[3, 4, 2, 7]]
+    assert D[0].tolist() == pytest.approx([0.9, 0.8, 0.7, 0.5])
+
+
+def test_shards_share_one_trained_quantizer(make_indexer):
+    indexer = make_indexer(index_type="ivf_flat", nlist=8, num_shards=3, hybrid=False)
+    indexer.append(catalogue())
+
+    shards = [faiss.extract_index_ivf(shard) for shard in indexer.index.shards]
+    centroids = [shard.quantizer.reconstruct_n(0, shard.nlist) for shard in shards]
+
+    assert all(np.array_equal(centroids[0], other) for other in centroids[1:])
+    assert [shard.ntotal for shard in indexer.index.shards] == [134, 133, 133]
+
+
+def test_reopened_shards_are_searched_in_worker_processes(make_indexer):
+    unsharded = make_indexer("unsharded", index_type="flat", hybrid=False)
+    sharded = make_indexer("sharded", index_type="flat", num_shards=3, hybrid=False)
+    for indexer in (unsharded, sharded):
+        indexer.append(catalogue())
+        indexer.delete([product_id(4)])
+    sharded.close()
+    filters = [None, {"category": "electronics", "price_max": 500.0}]
+    queries = ["black wireless earbuds", "black wireless earbuds"]
+
+    reopened = make_indexer("sharded", hybrid=False)
+
+    assert reopened.index._shards is None
+    assert reopened.get_index_size() == unsharded.get_index_size()
+    results = reopened.search_many(queries, top_k=10, return_scores=True, rerank=False, filters=filters)
+    expected = unsharded.search_many(queries, top_k=10, return_scores=True, rerank=False, filters=filters)
+    for result, reference in zip(results, expected):
+        assert [pid for pid, _ in result] == [pid for pid, _ in reference]
+        assert [score for _, score in result] == pytest.approx([score for _, score in reference], abs=1e-5)
+    assert reopened.index._shards is None
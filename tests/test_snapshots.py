@@ -0,0 +1,89 @@
+import asyncio
+import os
+
+import pytest
+
+from Indexer import ProductSearchIndexer
+from ModelRegistry import ModelRegistry
+from Snapshots import SnapshotStore
+from conftest import catalogue, product_id
+
+
+@pytest.fixture
+def published(make_indexer, tmp_path):
+    indexer = make_indexer(index_type="flat", storage="int8", hybrid=True)
+    indexer.append(catalogue(200))
+    snapshots = SnapshotStore(str(tmp_path / "snapshots"), keep=2)
+    return indexer, snapshots, indexer.publish(snapshots)
+
+
+def test_publish_copies_append_only_files_and_links_the_rest(published):
+    indexer, snapshots, version = published
+    directory = snapshots.path(version)
+
+    assert snapshots.current() == version
+    for name, source in indexer.state_files().items():
+        if not os.path.exists(source):
+            continue
+        same_inode = os.stat(source).st_ino == os.stat(os.path.join(directory, name)).st_ino
+        assert same_inode == (name not in ("docstore.bin", "docstore.idx", "vectors.vecs")), name
+
+
+def test_snapshot_is_unchanged_by_later_writes(published):
+    indexer, snapshots, version = published
+    paths = snapshots.index_paths(version)
+    before = {name: os.path.getsize(os.path.join(snapshots.path(version), name))
+              for name in os.listdir(snapshots.path(version))}
+
+    indexer.append(catalogue(300)[200:])
+    indexer.delete([product_id(0)])
+
+    after = {name: os.path.getsize(os.path.join(snapshots.path(version), name)) for name in before}
+    assert after == before
+    modified = {name: os.stat(os.path.join(snapshots.path(version), name)).st_mtime_ns for name in before}
+    snapshot = ProductSearchIndexer(**paths, models=indexer.models, use_embedding_cache=False)
+    try:
+        assert snapshot.get_index_size() == 200
+        assert product_id(0) in snapshot.search(catalogue()[0][1], top_k=5, rerank=False)
+        with pytest.raises(ValueError):
+            snapshot.save()
+    finally:
+        snapshot.close()
+    # Opening it read-only wrote nothing either
+    assert {name: os.stat(os.path.join(snapshots.path(version), name)).st_mtime_ns
+            for name in os.listdir(snapshots.path(version))} == modified
+
+
+def test_prune_keeps_the_newest_snapshots(published):
+    indexer, snapshots, first = published
+    os.makedirs(os.path.join(snapshots.root, ".staging-abandoned"))
+
+    versions = [first] + [indexer.publish(snapshots, save=False) for _ in range(3)]
+
+    assert sorted(os.listdir(snapshots.root)) == sorted(["CURRENT.json", *versions[-2:]])
+    assert snapshots.current() == versions[-1]
+
+
+def test_api_swaps_in_a_new_snapshot(published, monkeypatch):
+    import main
+
+    indexer, snapshots, version = published
+    registry = ModelRegistry()
+    registry.register("indexer", lambda: None)
+    monkeypatch.setattr(main, "snapshots", snapshots)
+    monkeypatch.setattr(main, "models", registry)
+    serving = main.load_indexer(models=indexer.models)
+    registry.replace("indexer", serving)
+
+    assert asyncio.run(main.reload_index()) is False
+    indexer.append(catalogue(300)[200:])
+    new_version = indexer.publish(snapshots)
+    assert asyncio.run(main.reload_index()) is True
+
+    swapped = registry.peek("indexer")
+    try:
+        assert swapped.snapshot_version == new_version and serving.snapshot_version == version
+        assert swapped.get_index_size() == 300 and serving.get_index_size() == 200
+    finally:
+        serving.close()
+        swapped.close()
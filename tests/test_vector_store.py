@@ -0,0 +1,61 @@
+import os
+
+import numpy as np
+import pytest
+
+from VectorStore import VectorStore
+from conftest import catalogue, product_id
+
+
+def test_append_and_get_across_reopen(tmp_path):
+    path = str(tmp_path / "vectors")
+    vectors = np.random.default_rng(0).standard_normal((6, 8)).astype("float32")
+    store = VectorStore(path, dimension=8)
+    store.append(vectors[:4])
+    store.append(vectors[4:])
+
+    reopened = VectorStore(path, dimension=8)
+
+    assert len(reopened) == 6
+    np.testing.assert_array_equal(reopened.get([5, 0, 3]), vectors[[5, 0, 3]])
+    np.testing.assert_array_equal(reopened.get([-1, 6]), np.zeros((2, 8), dtype="float32"))
+
+
+def test_partial_row_from_a_crash_is_dropped(tmp_path):
+    path = str(tmp_path / "vectors")
+    store = VectorStore(path, dimension=8, dtype="float16")
+    store.append(np.ones((2, 8)))
+    with open(f"{path}.vecs", "ab") as f:
+        f.write(b"\0" * 5)
+
+    reopened = VectorStore(path, dimension=8, dtype="float16")
+    reopened.append(np.full((1, 8), 2.0))
+
+    assert len(reopened) == 3
+    assert os.path.getsize(f"{path}.vecs") == 3 * 8 * 2
+    np.testing.assert_array_equal(reopened.get([2])[0], np.full(8, 2.0, dtype="float32"))
+
+
+def test_refinement_rescores_quantized_results_at_full_precision(make_indexer):
+    exact = make_indexer("exact", index_type="flat", hybrid=False)
+    refined = make_indexer("refined", index_type="flat", storage="pq", pq_m=8, pq_nbits=4, refine_factor=4,
+                           hybrid=False)
+    for indexer in (exact, refined):
+        indexer.append(catalogue())
+
+    expected = dict(exact.search("black wireless earbuds", top_k=50, return_scores=True, rerank=False))
+    results = refined.search("black wireless earbuds", top_k=5, return_scores=True, rerank=False)
+
+    assert refined.vectors is not None and exact.vectors is None
+    assert [score for _, score in results] == pytest.approx([expected[pid] for pid, _ in results], abs=1e-5)
+
+
+def test_quantized_hnsw_compacts_from_stored_vectors(make_indexer):
+    indexer = make_indexer(index_type="hnsw", storage="int8", hybrid=False, compaction_ratio=0.01)
+    indexer.append(catalogue())
+
+    indexer.delete([product_id(i) for i in range(10)])
+
+    assert not indexer.tombstones and indexer.index.ntotal == len(catalogue()) - 10
+    text = catalogue()[42][1]
+    assert indexer.search(text, top_k=1, rerank=False) == [product_id(42)]